@@ -43,6 +43,12 @@ midi = Midi(
     usb=getenvbool("MIDI_USB", False),
     ble=getenvbool("MIDI_BLE", False)
 )
+for port in ("uart", "usb", "ble"):
+    midi.set_thru_filter(
+        port,
+        channels=os.getenv("MIDI_" + port.upper() + "_THRU_CHANNELS", 65535),
+        types=os.getenv("MIDI_" + port.upper() + "_THRU_TYPES", 255)
+    )
 
 print("\n:: Initializing Audio ::")
 audio = Audio(
@@ -57,42 +63,81 @@ audio = Audio(
 )
 
 print("\n:: Initializing Synthio ::")
-synth = Synth(audio)
+synth = Synth(
+    audio,
+    filter_cache=os.getenv("SYNTH_FILTER_CACHE", 128),
+    filter_step=getenvfloat("SYNTH_FILTER_STEP", 25.0)
+)
 
 print("\n:: Building Waveforms ::")
 waveforms = Waveforms(
     samples=os.getenv("WAVE_SAMPLES", 256),
-    amplitude=os.getenv("WAVE_AMPLITUDE", 12000)
+    amplitude=os.getenv("WAVE_AMPLITUDE", 12000),
+    cache="/waveforms/cache.bin" if getenvbool("WAVE_CACHE", True) else None,
+    sample_rate=audio.get_sample_rate() if getenvbool("WAVE_MIPMAPS", True) else 0,
+    mipmap_cache="/waveforms/mipmaps.bin" if getenvbool("WAVE_CACHE", True) else None
 )
 
 print("\n:: Building Voice ::")
 min_filter_frequency=getenvfloat("OSC_FILTER_MIN_FREQ", 60.0)
 max_filter_frequency=min(audio.get_sample_rate()*0.45, getenvfloat("OSC_FILTER_MAX_FREQ", 20000.0))
-voice = Voice(
+voice_count=max(os.getenv("VOICE_COUNT", 1), 1)
+voice = VoicePool(
     synth,
     waveforms,
+    count=voice_count,
+    steal=os.getenv("VOICE_STEAL", "oldest"),
+    governor=VoiceGovernor(
+        voice_count,
+        target=getenvfloat("VOICE_GOVERNOR_TARGET", 0.7),
+        window=getenvfloat("VOICE_GOVERNOR_WINDOW", 1.0)
+    ) if voice_count > 1 and getenvbool("VOICE_GOVERNOR", True) else None,
     min_filter_frequency=min_filter_frequency,
-    max_filter_frequency=max_filter_frequency
+    max_filter_frequency=max_filter_frequency,
+    filter_update=getenvfloat("OSC_FILTER_UPDATE", 0.01, 3),
+    filter_step=getenvfloat("OSC_FILTER_STEP", 25.0),
+    filter_threshold=getenvfloat("OSC_FILTER_THRESHOLD", 50.0),
+    native_filter=getenvbool("OSC_FILTER_NATIVE", False),
+    shape_update=getenvfloat("OSC_SHAPE_UPDATE", 0.02, 3)
 )
+print("Voices: {:d}".format(voice.get_count()))
 
 print("\n:: Managing Keyboard ::")
 keyboard = Keyboard()
-arpeggiator = Arpeggiator()
+arpeggiator = Arpeggiator(
+    clock_bandwidth=getenvfloat("ARP_CLOCK_BANDWIDTH", 1.0),
+    missed=os.getenv("ARP_MISSED", "merge")
+)
 keyboard.set_arpeggiator(arpeggiator)
+sequencer = Sequencer(
+    length=os.getenv("SEQ_LENGTH", 16),
+    root=os.getenv("SEQ_ROOT", 60)
+)
+arpeggiator.set_sequencer(sequencer)
+keyboard.set_polyphonic(voice.get_count() > 1)
 
 def press(note, velocity):
     voice.press(note, velocity)
 keyboard.set_press(press)
 arpeggiator.set_press(press)
 
-def release():
-    voice.release()
+def release(note=None):
+    voice.release(note)
 keyboard.set_release(release)
 arpeggiator.set_release(release)
 
 print("\n:: Routing Parameters ::")
+gc.collect()
+parameters_free = gc.mem_free()
 parameters = Parameters()
-patches = Patches(parameters)
+parameters.add_transaction(voice)
+patches = Patches(
+    parameters,
+    bank="/patches/bank.bin" if getenvbool("PATCH_BANK", True) else None,
+    cache=os.getenv("PATCH_CACHE", 4),
+    debounce=getenvfloat("PATCH_DEBOUNCE", 0.0)
+)
+patches.add_data("seq", sequencer.get_data(), sequencer.load)
 
 parameters.add_groups([
     ParameterGroup("global", "Global", False),
@@ -102,6 +147,7 @@ parameters.add_groups([
     ParameterGroup("osc1", "Osc 2", True),
 ])
 
+parameters.begin() # Voice updates are applied once after every parameter is registered
 parameters.add_parameters([
 
     # Global
@@ -110,7 +156,7 @@ parameters.add_parameters([
         label="Patch",
         group="global",
         range=patches.get_list(),
-        set_callback=patches.read,
+        set_callback=patches.select,
         mod=False,
         patch=False
     ),
@@ -208,6 +254,15 @@ parameters.add_parameters([
         range=(os.getenv("ARP_MIN_BPM",60), os.getenv("ARP_MAX_BPM",240)),
         set_callback=arpeggiator.set_bpm
     ),
+    Parameter(
+        name="arp_sync",
+        label="MIDI Sync",
+        group="arp",
+        range=True,
+        set_callback=arpeggiator.set_sync,
+        mod=False,
+        patch=False
+    ),
     Parameter(
         name="arp_steps",
         label="Beat Step",
@@ -223,6 +278,30 @@ parameters.add_parameters([
         value=1.0,
         set_callback=arpeggiator.set_gate
     ),
+    Parameter(
+        name="arp_swing",
+        label="Swing",
+        group="arp",
+        set_callback=arpeggiator.set_swing
+    ),
+    Parameter(
+        name="seq_length",
+        label="Seq Length",
+        group="arp",
+        range=(1, SEQUENCER_STEPS),
+        value=(os.getenv("SEQ_LENGTH", 16) - 1) / (SEQUENCER_STEPS - 1),
+        set_callback=sequencer.set_length,
+        mod=False
+    ),
+    Parameter(
+        name="seq_record",
+        label="Seq Record",
+        group="arp",
+        range=True,
+        set_callback=sequencer.set_recording,
+        mod=False,
+        patch=False
+    ),
 
     # Voice
     Parameter(
@@ -422,6 +501,44 @@ parameters.add_parameters([
         group="osc0",
         set_callback=voice.oscillators[0].set_pan_depth
     ),
+    Parameter(
+        name="pulse_width_0",
+        label="PulseWidth",
+        group="osc0",
+        value=0.5,
+        set_callback=voice.oscillators[0].set_pulse_width
+    ),
+    Parameter(
+        name="pwm_depth_0",
+        label="PWM Depth",
+        group="osc0",
+        set_callback=voice.oscillators[0].set_pwm_depth
+    ),
+    Parameter(
+        name="morph_waveform_0",
+        label="Morph Wave",
+        group="osc0",
+        range=waveforms.get_list(),
+        set_callback=voice.oscillators[0].set_morph_waveform
+    ),
+    Parameter(
+        name="morph_0",
+        label="Morph",
+        group="osc0",
+        set_callback=voice.oscillators[0].set_morph
+    ),
+    Parameter(
+        name="morph_depth_0",
+        label="MorphDepth",
+        group="osc0",
+        set_callback=voice.oscillators[0].set_morph_depth
+    ),
+    Parameter(
+        name="shape_rate_0",
+        label="Shape Rate",
+        group="osc0",
+        set_callback=voice.oscillators[0].set_shape_rate
+    ),
 
     # Oscillator 2
     Parameter(
@@ -511,15 +628,63 @@ parameters.add_parameters([
         label="Pan Depth",
         group="osc1",
         set_callback=voice.oscillators[1].set_pan_depth
+    ),
+    Parameter(
+        name="pulse_width_1",
+        label="PulseWidth",
+        group="osc1",
+        value=0.5,
+        set_callback=voice.oscillators[1].set_pulse_width
+    ),
+    Parameter(
+        name="pwm_depth_1",
+        label="PWM Depth",
+        group="osc1",
+        set_callback=voice.oscillators[1].set_pwm_depth
+    ),
+    Parameter(
+        name="morph_waveform_1",
+        label="Morph Wave",
+        group="osc1",
+        range=waveforms.get_list(),
+        set_callback=voice.oscillators[1].set_morph_waveform
+    ),
+    Parameter(
+        name="morph_1",
+        label="Morph",
+        group="osc1",
+        set_callback=voice.oscillators[1].set_morph
+    ),
+    Parameter(
+        name="morph_depth_1",
+        label="MorphDepth",
+        group="osc1",
+        set_callback=voice.oscillators[1].set_morph_depth
+    ),
+    Parameter(
+        name="shape_rate_1",
+        label="Shape Rate",
+        group="osc1",
+        set_callback=voice.oscillators[1].set_shape_rate
     )
 ])
+parameters.commit()
 gc.collect()
+print("Parameters: {:d} registered, {:d} bytes".format(parameters.get_parameter_count(), parameters_free - gc.mem_free()))
+del parameters_free
 
-parameters.get_parameter("mod_parameter").range = parameters.get_mod_parameters()
+parameters.get_parameter("mod_parameter").set_range(parameters.get_mod_parameters())
+parameters.set_control_map(midi.get_control_map())
 
 print("\n:: Loading Initial Patch ::")
+if patches.load_bank():
+    print("Patch Bank: {:d} patches".format(len([index for index in patches.get_list(False) if patches.has_bank(index)])))
 patches.read_first()
 
+print("\n:: Prewarming Filter Cache ::")
+voice.prewarm_filter()
+synth.report_filter_cache()
+
 print("\n:: Setting Up Menu ::")
 menu = Menu(parameters, display, patches)
 
@@ -535,6 +700,7 @@ encoder.set_long_press(menu.toggle_save)
 encoder.set_double_click(menu.confirm_save)
 
 def note_on(notenum, velocity):
+    sequencer.record(notenum, velocity, keyboard.has_notes())
     keyboard.append(notenum, velocity)
 midi.set_note_on(note_on)
 
@@ -543,37 +709,73 @@ def note_off(notenum):
 midi.set_note_off(note_off)
 
 def control_change(control, value):
-    name = None
+    parameter = None
     if control == 1: # Mod Wheel
-        name = parameters.get_mod_parameter()
-    elif control == 64: # Sustain
+        parameter = parameters.get_parameter(parameters.get_mod_parameter())
+    elif control == 64: # Sustain, enters a rest while recording a sequence
+        if map_boolean(value):
+            sequencer.record_rest()
         keyboard.set_sustain(value)
     else:
-        name = midi.get_control_parameter(control)
-    if name:
-        parameter = parameters.get_parameter(name)
-        if parameter:
-            parameter.set(value)
-            if control != 1:
-                menu.display(name)
+        parameter = parameters.get_control(control)
+    if parameter:
+        parameter.set(value)
+        if control != 1:
+            menu.display(parameter.name)
 midi.set_control_change(control_change)
 
 def pitch_bend(value):
     voice.set_pitch_bend(value)
 midi.set_pitch_bend(pitch_bend)
 
+def program_change(program):
+    if patches.get_path(program):
+        parameters.get_parameter("patch").set(program)
+        patches.commit() # Program changes are not debounced
+midi.set_program_change(program_change)
+
+midi.set_clock(arpeggiator.clock)
+midi.set_start(arpeggiator.start)
+midi.set_stop(arpeggiator.stop)
+midi.set_continue(arpeggiator.resume)
+
+profiler = Profiler(
+    names=("voice", "encoder", "arpeggiator", "midi", "display", "patches"),
+    size=os.getenv("PROFILER_SIZE", 128),
+    enabled=getenvbool("PROFILER", False),
+    report=os.getenv("PROFILER_REPORT", 0)
+)
+profiler.add_report(synth.report_filter_cache)
+profiler.add_report(patches.report_cache)
+profiler.add_report(voice.report)
+if profiler.is_enabled():
+    print("\n:: Profiler Enabled ::")
+    print("Send \"p\" over serial to print a report or \"r\" to reset")
+
 midi.init()
 
 while True:
     now = time.monotonic()
-    voice.update()
+    profiler.loop()
+    voice.update(now)
+    profiler.mark(0)
     encoder.update()
+    profiler.mark(1)
     arpeggiator.update(now)
+    profiler.mark(2)
     midi.update(now)
+    profiler.mark(3)
     display.update(now)
+    profiler.mark(4)
+    patches.update(now)
+    profiler.mark(5)
+    profiler.update(now)
 
 print("\n:: Deinitializing ::")
 
+profiler.deinit()
+del profiler
+
 menu.deinit()
 del menu
 patches.deinit()
@@ -582,6 +784,8 @@ parameters.deinit()
 del parameters
 arpeggiator.deinit()
 del arpeggiator
+sequencer.deinit()
+del sequencer
 keyboard.deinit()
 del keyboard
 voice.deinit()
@@ -1,9 +1,101 @@
 # Inspired by Arpy class from eighties_arp in https://github.com/todbot/circuitpython-synthio-tricks
 
+class ClockEstimator:
+    # Delay locked loop tracking the period and phase of an external clock from its arrival timestamps
+    def __init__(self, ppqn=24, bandwidth=1.0, timeout=0.5):
+        self._ppqn = ppqn
+        self._bandwidth = bandwidth
+        self._timeout = int(timeout * 1000000)
+        self.reset()
+
+    def reset(self):
+        self._count = 0
+        self._last = 0
+        self._period = 0.0 # Microseconds per pulse
+        self._phase = 0.0 # Predicted time of the next pulse relative to the last one
+        self._error = 0.0
+        self._b = 0.0
+        self._c = 0.0
+    def _update_coefficients(self):
+        omega = 2.0 * math.pi * self._bandwidth * self._period / 1000000
+        self._b = math.sqrt(2.0) * omega
+        self._c = omega * omega
+
+    def set_bandwidth(self, value):
+        self._bandwidth = max(value, 0.01)
+        if self._period:
+            self._update_coefficients()
+
+    def is_locked(self):
+        return self._count > self._ppqn
+    def get_period(self):
+        return self._period / 1000000
+    def get_bpm(self):
+        if not self._period:
+            return 0.0
+        return 60000000 / (self._period * self._ppqn)
+    def get_offset(self):
+        # Microseconds from the smoothed time of the last pulse to its arrival timestamp
+        return (1.0 - self._b) * self._error
+
+    def tick(self, timestamp):
+        # Returns the number of pulses elapsed including any that were lost
+        delta = (timestamp - self._last) & MIDI_TIME_MASK
+        self._last = timestamp
+        if not self._count or delta > self._timeout:
+            self._count = 1
+            self._error = 0.0
+            return 1
+        if self._count == 1:
+            self._period = float(delta)
+            self._update_coefficients()
+            self._phase = self._period
+            self._error = 0.0
+            self._count = 2
+            return 1
+
+        error = delta - self._phase
+        pulses = 1
+        if error > self._period * 0.5: # Skip over lost pulses instead of pulling the loop off
+            pulses = pulses + int(error / self._period + 0.5)
+            error = error - (pulses - 1) * self._period
+        limit = self._period * 0.5
+        if error > limit:
+            error = limit
+        elif error < -limit:
+            error = -limit
+        self._error = error
+        self._phase = self._period - (1.0 - self._b) * error
+        self._period = self._period + self._c * error
+        for i in range(pulses):
+            self._count = self._count + 1
+            if not self._count % self._ppqn:
+                self._update_coefficients()
+        return pulses
+
 class Arpeggiator:
-    def __init__(self, bpm=120, steps=2):
+    def __init__(self, bpm=120, steps=2, clock_bandwidth=1.0, missed="merge"):
         self._enabled = False
         self._gate = 0.3
+        self._swing = 0.0
+        self._free_bpm = bpm
+
+        # Steps are scheduled from an absolute start time, the step count is derived from the time elapsed since
+        self._step_time = 0.0
+        self._start = time.monotonic()
+        self._step = -1
+        self._release_time = 0.0
+        self._gated = False
+        self._missed_types = ["drop", "merge", "catchup"]
+        self._missed = self._missed_types.index(missed) if missed in self._missed_types else 1
+        self._missed_steps = 0
+
+        # External clock
+        self._sync = False
+        self._running = True
+        self._restart = False
+        self._pulse = -1
+        self._clock = ClockEstimator(bandwidth=clock_bandwidth)
 
         self._step_options = [
             {
@@ -46,15 +138,28 @@ class Arpeggiator:
             "updown",
             "downup",
             "played",
-            "random"
+            "random",
+            "converge",
+            "diverge",
+            "pinky",
+            "sequence"
         ]
         self._type = 0
         self._octaves = 0
 
-        self._raw_notes = []
-        self._notes = []
-        self._pos = 0
-        self._now = time.monotonic()
+        # Held notes are kept sorted and in the order they were played as they change, each step is computed from its index
+        self._sorted = bytearray(128)
+        self._played = bytearray(128)
+        self._velocities = bytearray(128) # 7-bit velocity of each held note
+        self._count = 0
+        self._length = 0
+        self._pos = -1
+        self._note = 0 # Held note of the last step, for its velocity
+        self._notenum = -1 # Note pressed by the last step
+        self._tied = False
+
+        # Steps of the "sequence" type are played from a sequencer and transposed by the last held note
+        self._sequencer = None
 
         self._press = None
         self._release = None
@@ -64,10 +169,15 @@ class Arpeggiator:
             self._bpm = bpm
         if steps:
             self._steps = steps
-        self._step_time = 60.0 / self._bpm / self._steps
-        self._gate_duration = self._gate * self._step_time
+        step_time = 60.0 / self._bpm / self._steps
+        if step_time != self._step_time:
+            # Keeps the last step in place, the following steps use the new tempo
+            self._start = self._start + max(self._step, 0) * (self._step_time - step_time)
+            self._step_time = step_time
     def set_bpm(self, value):
-        self._update_timing(bpm=value)
+        self._free_bpm = value
+        if not self._sync or not self._clock.is_locked():
+            self._update_timing(bpm=value)
     def get_bpm(self):
         return self._bpm
     def set_steps(self, value):
@@ -88,11 +198,21 @@ class Arpeggiator:
         return self._step_options
     def set_gate(self, value):
         self._gate = value
-        self._update_timing()
+    def set_swing(self, value):
+        # Delays every other step by up to half a step, 75% of the pair
+        self._swing = min(max(value, 0.0), 1.0) * 0.5
+    def get_missed_types(self):
+        return self._missed_types
+    def set_missed(self, value):
+        if type(value) is int:
+            self._missed = value % len(self._missed_types)
+        elif type(value) is str:
+            self._missed = self._missed_types.index(value)
+    def get_missed_steps(self):
+        return self._missed_steps
     def set_octaves(self, value):
         self._octaves = int(value)
-        if self._notes:
-            self.update_notes(self._raw_notes)
+        self._update_length()
 
     def is_enabled(self):
         return self._enabled
@@ -103,15 +223,79 @@ class Arpeggiator:
             self.disable()
     def enable(self, keyboard=None):
         self._enabled = True
-        self._now = time.monotonic() - self._step_time
+        self._reset(time.monotonic())
         if keyboard:
-            self.update_notes(keyboard.get_notes())
+            self.update_notes(keyboard)
     def disable(self, keyboard=None):
         self._enabled = False
-        self.update_notes()
+        self._gated = False
+        self._tied = False
+        if self._release:
+            self._release()
         if keyboard:
             keyboard.update()
 
+    def is_synced(self):
+        return self._sync
+    def set_sync(self, value):
+        self._sync = bool(value)
+        self._running = True
+        self._restart = False
+        self._pulse = -1
+        self._clock.reset()
+        if not self._sync:
+            self._update_timing(bpm=self._free_bpm)
+    def set_clock_bandwidth(self, value):
+        self._clock.set_bandwidth(value)
+
+    def clock(self, timestamp):
+        if not self._sync:
+            return
+        pulses = self._clock.tick(timestamp)
+
+        # Smoothed time of this pulse on the monotonic clock
+        pulse_time = time.monotonic() - (((get_midi_time() - timestamp) & MIDI_TIME_MASK) + self._clock.get_offset()) / 1000000
+
+        if self._restart: # The first pulse after a start message is the downbeat
+            self._restart = False
+            self._reset(pulse_time)
+            self._pulse = 0
+        else:
+            self._pulse = self._pulse + pulses
+        if not self._pulse % 24 and self._clock.is_locked():
+            self._update_timing(bpm=self._clock.get_bpm())
+            self._correct_phase(pulse_time)
+    def _correct_phase(self, quarter_time):
+        # Moves the last step onto the nearest step of the grid anchored on this quarter note
+        offset = self._pulse * self._steps / 24
+        offset = offset - math.floor(offset)
+        last = self._start + self._step * self._step_time
+        position = (last - quarter_time) / self._step_time + offset
+        self._start = self._start + quarter_time + (math.floor(position + 0.5) - offset) * self._step_time - last
+    def start(self):
+        if not self._sync:
+            return
+        self._running = True
+        self._restart = True
+    def stop(self):
+        if not self._sync:
+            return
+        self._running = False
+        self._gated = False
+        self._tied = False
+        if self._release:
+            self._release()
+    def resume(self):
+        if not self._sync:
+            return
+        self._running = True
+
+    def set_sequencer(self, sequencer):
+        self._sequencer = sequencer
+        self._update_length()
+    def _is_sequence(self):
+        return self._sequencer and self._type == len(self._types) - 1
+
     def set_press(self, callback):
         self._press = callback
     def set_release(self, callback):
@@ -129,72 +313,210 @@ class Arpeggiator:
             self._type = value % len(self._types)
         elif type(value) is str:
             self._type = self._types.index(value)
-        if self._notes:
-            self.update_notes(self._raw_notes)
-
-    def _get_notes(self, notes=[]):
-        if not notes:
-            return notes
-
-        if abs(self._octaves) > 0:
-            l = len(notes)
-            for octave in range(1,abs(self._octaves)+1):
-                if self._octaves < 0:
-                    octave = octave * -1
-                for i in range(0,l):
-                    notes.append((notes[i][0] + octave*12, notes[i][1]))
-
-        type = self.get_type()
-        if type == "up":
-            notes.sort(key=lambda x: x[0])
-        elif type == "down":
-            notes.sort(key=lambda x: x[0], reverse=True)
-        elif type == "updown":
-            notes.sort(key=lambda x: x[0])
-            if len(notes) > 2:
-                _notes = notes[1:-1].copy()
-                _notes.reverse()
-                notes = notes + _notes
-        elif type == "downup":
-            notes.sort(key=lambda x: x[0], reverse=True)
-            if len(notes) > 2:
-                _notes = notes[1:-1].copy()
-                _notes.reverse()
-                notes = notes + _notes
-        # "played" = notes stay as is, "random" = index is randomized on update
-
-        return notes
-    def update_notes(self, notes=[]):
-        if not self._notes:
-            self._pos = 0
-            self._now = time.monotonic() - self._step_time
-        self._raw_notes = notes.copy()
-        self._notes = self._get_notes(notes)
-        if not self._notes and self._release:
+        self._update_length()
+
+    def _search(self, notenum):
+        # Position of notenum in the sorted notes, or where it would be inserted
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) >> 1
+            if self._sorted[middle] < notenum:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    def has_note(self, notenum):
+        i = self._search(notenum)
+        return i < self._count and self._sorted[i] == notenum
+    def get_count(self):
+        return self._count
+    def get_length(self):
+        return self._length
+    def append_note(self, notenum, velocity):
+        self.append_note_raw(notenum, min(max(round(velocity * 127), 0), 127))
+    def append_note_raw(self, notenum, velocity):
+        # velocity is 7-bit
+        self._velocities[notenum] = velocity
+        i = self._search(notenum)
+        if i < self._count and self._sorted[i] == notenum:
+            # Played again, it moves to the end of the played order
+            self._remove_played(notenum)
+            self._played[self._count - 1] = notenum
+            return
+        for j in range(self._count, i, -1):
+            self._sorted[j] = self._sorted[j - 1]
+        self._sorted[i] = notenum
+        self._played[self._count] = notenum
+        self._count = self._count + 1
+        self._update_length()
+        if self._count == 1:
+            self._reset(time.monotonic())
+    def remove_note(self, notenum):
+        i = self._search(notenum)
+        if i >= self._count or self._sorted[i] != notenum:
+            return
+        for j in range(i, self._count - 1):
+            self._sorted[j] = self._sorted[j + 1]
+        self._remove_played(notenum)
+        self._count = self._count - 1
+        self._update_length()
+        if not self._count and self._enabled:
+            self._gated = False
+            self._tied = False
+            if self._release:
+                self._release()
+    def _remove_played(self, notenum):
+        i = 0
+        while self._played[i] != notenum:
+            i = i + 1
+        for j in range(i, self._count - 1):
+            self._played[j] = self._played[j + 1]
+    def clear_notes(self):
+        self._count = 0
+        self._update_length()
+        if self._enabled and self._release:
+            self._release()
+    def update_notes(self, keyboard=None):
+        # Replaces the held notes with the active notes of a keyboard
+        self._count = 0
+        if keyboard:
+            notenum = keyboard.get_first()
+            while notenum >= 0:
+                self.append_note_raw(notenum, keyboard.get_velocity_raw(notenum))
+                notenum = keyboard.get_next(notenum)
+        self._update_length()
+        if not self._count and self._release:
             self._release()
 
+    def _update_length(self):
+        if self._is_sequence():
+            self._length = self._sequencer.get_length()
+            return
+        length = self._count * (abs(self._octaves) + 1)
+        mode = self.get_type()
+        if (mode == "updown" or mode == "downup") and length > 2:
+            length = length * 2 - 2
+        elif mode == "pinky" and length > 1:
+            length = length * 2 - 2
+        self._length = length
+    def _get_up(self, index):
+        # Sorted notes repeated for each octave, from the lowest octave up
+        octave = index // self._count
+        if self._octaves < 0:
+            octave = octave + self._octaves
+        self._note = self._sorted[index % self._count]
+        return self._note + octave * 12
+    def _get_step(self, pos):
+        if self._is_sequence():
+            return min(max(self._sequencer.get_note(pos) + self._played[self._count - 1] - self._sequencer.get_root(), 0), 127)
+        mode = self.get_type()
+        length = self._count * (abs(self._octaves) + 1)
+        if mode == "down":
+            return self._get_up(length - 1 - pos)
+        elif mode == "updown":
+            return self._get_up(pos if pos < length else self._length - pos)
+        elif mode == "downup":
+            return self._get_up(length - 1 - pos if pos < length else pos - length + 1)
+        elif mode == "played":
+            octave = pos // self._count
+            if self._octaves < 0:
+                octave = -octave
+            self._note = self._played[pos % self._count]
+            return self._note + octave * 12
+        elif mode == "converge": # Outside in
+            return self._get_up(pos >> 1 if not pos & 1 else length - 1 - (pos >> 1))
+        elif mode == "diverge": # Inside out
+            pos = length - 1 - pos
+            return self._get_up(pos >> 1 if not pos & 1 else length - 1 - (pos >> 1))
+        elif mode == "pinky": # Every note alternates with the highest
+            return self._get_up(length - 1 if pos & 1 else pos >> 1)
+        return self._get_up(pos) # "up" and "random"
+    def get_steps_list(self):
+        # The full sequence, for debugging and tools
+        return [self._get_step(pos) for pos in range(self._length)]
+
+    def _reset(self, now):
+        # The first step is due at now
+        self._start = now
+        self._step = -1
+        self._pos = -1
+    def _get_time(self, step):
+        # Time of a step, odd steps are delayed by swing
+        if step & 1:
+            return self._start + (step + self._swing) * self._step_time
+        return self._start + step * self._step_time
+    def _advance(self, count=1):
+        if self._is_sequence(): # The sequence length can change at any step
+            self._length = self._sequencer.get_length()
+        if self.get_type() == "random":
+            self._pos = random.randrange(0,self._length,1)
+        else:
+            self._pos = (self._pos+count) % self._length
+
     def update(self, now=None):
-        if not self._enabled or not self._notes:
+        if not self._enabled or not self._count or not self._running:
             return
 
         if not now:
             now = time.monotonic()
 
-        if now >= self._now + self._step_time:
-            self._now = self._now + self._step_time
-            if self.get_type() == "random":
-                self._pos = random.randrange(0,len(self._notes),1)
-            else:
-                self._pos = (self._pos+1) % len(self._notes)
-            if self._press:
-                self._press(self._notes[self._pos][0], self._notes[self._pos][1])
+        if self._gated and now >= self._release_time:
+            self._gated = False
+            if self._release:
+                self._release(self._notenum)
 
-        if now - self._now > self._gate_duration:
+        step = math.floor((now - self._start) / self._step_time)
+        if step & 1 and now < self._get_time(step):
+            step = step - 1
+        if step <= self._step:
+            return
+
+        missed = step - self._step - 1
+        policy = self._missed_types[self._missed]
+        if missed:
+            self._missed_steps = self._missed_steps + missed
+            if policy == "catchup": # Late steps are played one per update until back on time
+                step = self._step + 1
+            elif policy == "drop": # Missed steps are skipped over to stay in phase with the grid
+                self._advance(missed)
+            # "merge" = missed steps are played as one
+        self._step = step
+        self._advance()
+
+        # Each step is released relative to its own length, which swing changes
+        sequence = self._is_sequence()
+        start = self._get_time(step)
+        duration = self._get_time(step + 1) - start
+        gate = self._sequencer.get_gate(self._pos) if sequence else self._gate
+        end = start + gate * duration
+        if now >= end:
+            if policy == "drop":
+                self._missed_steps = self._missed_steps + 1
+                return
+            end = now + gate * duration
+
+        notenum = -1
+        if not sequence or not self._sequencer.is_rest(self._pos):
+            notenum = self._get_step(self._pos)
+        held = self._tied and notenum == self._notenum # A tie into the same note holds it
+        if self._gated or (self._tied and not held):
+            self._gated = False
             if self._release:
-                self._release()
+                self._release(self._notenum)
+        if notenum >= 0 and self._press and not held:
+            self._press(notenum, self._sequencer.get_velocity(self._pos) if sequence else self._velocities[self._note] / 127)
+        self._notenum = notenum
+        self._tied = notenum >= 0 and sequence and self._sequencer.is_tie(self._pos)
+        self._release_time = end
+        self._gated = notenum >= 0 and not self._tied
 
     def deinit(self):
+        del self._clock
         del self._step_options
         del self._types
-        del self._raw_notes
-        del self._notes
+        del self._missed_types
+        del self._sorted
+        del self._played
+        del self._velocities
+        del self._sequencer
@@ -30,6 +30,9 @@ class Audio:
         return self._mixer.sample_rate
     def get_buffer_size(self):
         return self._mixer.buffer_size
+    def get_buffer_duration(self):
+        # Output is always 16-bit stereo, 4 bytes per frame
+        return self._mixer.buffer_size / 4 / self._mixer.sample_rate
 
     def set_level(self, value):
         self._mixer.voice[0].level = value
@@ -1,17 +1,11 @@
 # Modules
 
-import gc, os, sys, time, math, random, board
+import gc, os, sys, time, math, random, array, struct, board
 import ulab.numpy as numpy
 import synthio
 from audiomixer import Mixer
 
 from busio import UART
-import adafruit_midi
-from adafruit_midi.note_on import NoteOn
-from adafruit_midi.note_off import NoteOff
-from adafruit_midi.control_change import ControlChange
-from adafruit_midi.program_change import ProgramChange
-from adafruit_midi.pitch_bend import PitchBend
 
 from digitalio import DigitalInOut, Direction, Pull
 from rotaryio import IncrementalEncoder
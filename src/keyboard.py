@@ -1,20 +1,44 @@
+KEYBOARD_NOTES = 128
+KEYBOARD_RING = 128 # Sentinel of the insertion order ring
+
 class Keyboard:
     def __init__(self):
         self._note_types = ["high", "low", "last"]
-        self._notes = []
         self._type = 0
         self._sustain = False
-        self._sustained = []
         self._press = None
         self._release = None
         self._arpeggiator = None
+        self._polyphonic = False
+
+        # Notes are bitmaps of all 128 notes, a note is active while its key is held or the sustain pedal latched it
+        self._velocities = bytearray(KEYBOARD_NOTES) # 7-bit velocity of the last press
+        self._held = bytearray(KEYBOARD_NOTES // 8)
+        self._sustained = bytearray(KEYBOARD_NOTES // 8)
+        self._active = bytearray(KEYBOARD_NOTES // 8)
+        self._playing = bytearray(KEYBOARD_NOTES // 8) # Notes pressed by a polyphonic keyboard
+        self._count = 0
+        self._high = -1 # The bitmap is only scanned when the highest or lowest note is dropped
+        self._low = -1
+
+        # Active notes are linked in the order they were pressed for "last" priority
+        self._next = bytearray(KEYBOARD_NOTES + 1)
+        self._prev = bytearray(KEYBOARD_NOTES + 1)
+        self._next[KEYBOARD_RING] = KEYBOARD_RING
+        self._prev[KEYBOARD_RING] = KEYBOARD_RING
 
     def set_press(self, callback):
         self._press = callback
     def set_release(self, callback):
         self._release = callback
     def set_arpeggiator(self, arpeggiator):
+        # The arpeggiator keeps its own copy of the active notes, it is told of every change
         self._arpeggiator = arpeggiator
+        if arpeggiator:
+            arpeggiator.update_notes(self)
+    def set_polyphonic(self, value):
+        # Polyphonic keyboards press and release every held note, release callbacks receive the note number
+        self._polyphonic = value
 
     def get_types(self):
         return self._note_types
@@ -23,101 +47,183 @@ class Keyboard:
     def set_type(self, value):
         self._type = value
 
+    def _link(self, notenum):
+        prev = self._prev[KEYBOARD_RING]
+        self._next[prev] = notenum
+        self._prev[notenum] = prev
+        self._next[notenum] = KEYBOARD_RING
+        self._prev[KEYBOARD_RING] = notenum
+    def _unlink(self, notenum):
+        prev = self._prev[notenum]
+        following = self._next[notenum]
+        self._next[prev] = following
+        self._prev[following] = prev
+    def _deactivate(self, notenum):
+        # Drops a note from the active set once neither its key nor the sustain pedal holds it
+        i = notenum >> 3
+        bit = 1 << (notenum & 7)
+        if self._active[i] & bit and not (self._held[i] | self._sustained[i]) & bit:
+            self._active[i] = self._active[i] & ~bit
+            self._count = self._count - 1
+            self._unlink(notenum)
+            if self._arpeggiator:
+                self._arpeggiator.remove_note(notenum)
+            if notenum == self._high:
+                self._high = self._scan_high(notenum)
+            if notenum == self._low:
+                self._low = self._scan_low(notenum)
+
     def get_sustain(self):
         return self._sustain
     def set_sustain(self, value, update=True):
         value = map_boolean(value)
         if value != self._sustain:
             self._sustain = value
-            self._sustained = []
             if self._sustain:
-                self._sustained = self._notes.copy()
+                self._sustained[:] = self._held
+            else:
+                for i in range(KEYBOARD_NOTES // 8):
+                    released = self._sustained[i] & ~self._held[i]
+                    self._sustained[i] = 0
+                    if released:
+                        for bit in range(8):
+                            if released & (1 << bit):
+                                self._deactivate((i << 3) | bit)
             if update:
                 self.update()
 
     def has_notes(self):
-        if self._sustain and self._sustained:
-            return True
-        if self._notes:
-            return True
-        return False
+        return self._count > 0
+    def get_count(self):
+        return self._count
+    def get_velocity(self, notenum):
+        return self._velocities[notenum] / 127
+    def get_velocity_raw(self, notenum):
+        # 7-bit velocity, avoids allocating a float for every note when walking get_first() and get_next()
+        return self._velocities[notenum]
+    def get_first(self):
+        # Active notes in the order they were pressed: get_first() then get_next(notenum) until -1
+        return self.get_next(KEYBOARD_RING)
+    def get_next(self, notenum):
+        notenum = self._next[notenum]
+        return -1 if notenum == KEYBOARD_RING else notenum
     def get_notes(self):
-        if not self.has_notes():
-            return []
-        return (self._notes if self._notes else []) + (self._sustained if self._sustain and self._sustained else [])
+        notes = []
+        notenum = self.get_first()
+        while notenum >= 0:
+            notes.append((notenum, self.get_velocity(notenum)))
+            notenum = self.get_next(notenum)
+        return notes
 
-    def _get_low(self):
-        if not self.has_notes():
-            return None
-        selected = (127, 0)
-        if self._notes:
-            for note in self._notes:
-                if note[0] < selected[0]:
-                    selected = note
-        if self._sustain and self._sustained:
-            for note in self._sustained:
-                if note[0] < selected[0]:
-                    selected = note
-        return selected
-    def _get_high(self):
-        if not self.has_notes():
-            return None
-        selected = (0, 0)
-        if self._notes:
-            for note in self._notes:
-                if note[0] > selected[0]:
-                    selected = note
-        if self._sustain and self._sustained:
-            for note in self._sustained:
-                if note[0] > selected[0]:
-                    selected = note
-        return selected
-    def _get_last(self):
-        if self._sustain and self._sustained:
-            return self._sustained[-1]
-        if self._notes:
-            return self._notes[-1]
-        return None
-    def get(self, type=None):
-        if type is None:
-            type = self._note_types[self._type]
-        if type == "high":
-            return self._get_high()
-        elif type == "low":
-            return self._get_low()
+    def _scan_low(self, notenum):
+        # Lowest active note above notenum
+        if not self._count:
+            return -1
+        for i in range(notenum >> 3, KEYBOARD_NOTES // 8):
+            if self._active[i]:
+                for bit in range(8):
+                    if self._active[i] & (1 << bit):
+                        return (i << 3) | bit
+        return -1
+    def _scan_high(self, notenum):
+        # Highest active note below notenum
+        if not self._count:
+            return -1
+        for i in range(notenum >> 3, -1, -1):
+            if self._active[i]:
+                for bit in range(7, -1, -1):
+                    if self._active[i] & (1 << bit):
+                        return (i << 3) | bit
+        return -1
+    def _get_note(self, type=None):
+        type = self._type if type is None else self._note_types.index(type) if type in self._note_types else 2
+        if type == 0: # "high"
+            return self._high
+        elif type == 1: # "low"
+            return self._low
         else: # "last"
-            return self._get_last()
+            return self._prev[KEYBOARD_RING] if self._count else -1
+    def get(self, type=None):
+        notenum = self._get_note(type)
+        if notenum < 0:
+            return None
+        return (notenum, self.get_velocity(notenum))
 
     def append(self, notenum, velocity, update=True):
-        self.remove(notenum, False, True)
-        note = (notenum, velocity)
-        self._notes.append(note)
+        i = notenum >> 3
+        bit = 1 << (notenum & 7)
+        self._velocities[notenum] = min(max(round(velocity * 127), 0), 127)
+        self._held[i] = self._held[i] | bit
         if self._sustain:
-            self._sustained.append(note)
+            self._sustained[i] = self._sustained[i] | bit
+        if self._active[i] & bit:
+            self._unlink(notenum)
+        else:
+            self._active[i] = self._active[i] | bit
+            self._count = self._count + 1
+            if notenum > self._high:
+                self._high = notenum
+            if self._low < 0 or notenum < self._low:
+                self._low = notenum
+        self._link(notenum)
+        if self._arpeggiator:
+            self._arpeggiator.append_note_raw(notenum, self._velocities[notenum])
         if update:
             self.update()
     def remove(self, notenum, update=True, remove_sustained=False):
-        self._notes = [note for note in self._notes if note[0] != notenum]
-        if remove_sustained and self._sustain and self._sustained:
-            self._sustained = [note for note in self._sustained if note[0] != notenum]
+        i = notenum >> 3
+        bit = 1 << (notenum & 7)
+        self._held[i] = self._held[i] & ~bit
+        if remove_sustained and self._sustain:
+            self._sustained[i] = self._sustained[i] & ~bit
+        self._deactivate(notenum)
         if update:
             self.update()
 
+    def _update_polyphonic(self, release_all=False):
+        # Releases playing notes which are no longer active, then presses new notes in the order they were played
+        for i in range(KEYBOARD_NOTES // 8):
+            released = self._playing[i] if release_all else self._playing[i] & ~self._active[i]
+            if released:
+                self._playing[i] = self._playing[i] & ~released
+                if self._release:
+                    for bit in range(8):
+                        if released & (1 << bit):
+                            self._release((i << 3) | bit)
+        if release_all:
+            return
+        notenum = self.get_first()
+        while notenum >= 0:
+            i = notenum >> 3
+            bit = 1 << (notenum & 7)
+            if not self._playing[i] & bit:
+                self._playing[i] = self._playing[i] | bit
+                if self._press:
+                    self._press(notenum, self.get_velocity(notenum))
+            notenum = self.get_next(notenum)
+
     def update(self):
-        if not self._arpeggiator or not self._arpeggiator.is_enabled():
-            note = self.get()
-            if not note:
+        arpeggiator = self._arpeggiator and self._arpeggiator.is_enabled()
+        if self._polyphonic and not arpeggiator:
+            self._update_polyphonic()
+            return
+        if self._polyphonic:
+            self._update_polyphonic(True)
+        if not arpeggiator:
+            notenum = self._get_note()
+            if notenum < 0:
                 if self._release:
                     self._release()
             elif self._press:
-                self._press(note[0], note[1])
-        elif self.has_notes():
-            self._arpeggiator.update_notes(self.get_notes())
-        else:
-            self._arpeggiator.update_notes()
+                self._press(notenum, self.get_velocity(notenum))
 
     def deinit(self):
         del self._arpeggiator
+        del self._velocities
+        del self._held
         del self._sustained
-        del self._notes
+        del self._active
+        del self._playing
+        del self._next
+        del self._prev
         del self._note_types
@@ -25,20 +25,11 @@ class Menu:
         parameter = group.items[parameter_index]
         return MenuItem(group_index, group, parameter_index, parameter)
     def _get_item_by_name(self, name):
-        parameter = self._parameters.get_parameter(name)
-        group = self._parameters.get_group(parameter.group)
-        return MenuItem(self._get_group_index(group), group, self._get_parameter_index(group, parameter), parameter)
-    def _get_group_index(self, group):
-        groups = self._parameters.get_groups()
-        for i in range(len(groups)):
-            if groups[i] == group:
-                return i
-        return 0
-    def _get_parameter_index(self, group, parameter):
-        for i in range(len(group.items)):
-            if group.items[i] == parameter:
-                return i
-        return 0
+        index = self._parameters.get_parameter_index(name)
+        if not index:
+            return None
+        group = self._parameters.get_group(index[0])
+        return MenuItem(index[0], group, index[1], group.items[index[1]])
 
     def _queue(self):
         if self._saving:
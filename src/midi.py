@@ -1,16 +1,334 @@
 import time
 
+MIDI_TIME_MASK = 0x3FFFFFFF # Timestamps are microseconds wrapped to stay within small integers
+
+def get_midi_time():
+    return (time.monotonic_ns() // 1000) & MIDI_TIME_MASK
+
+# Thru message type filter bits
+MIDI_THRU_NOTE = 0x03
+MIDI_THRU_AFTERTOUCH = 0x24
+MIDI_THRU_CONTROL = 0x08
+MIDI_THRU_PROGRAM = 0x10
+MIDI_THRU_PITCH_BEND = 0x40
+MIDI_THRU_SYSTEM = 0x80
+MIDI_THRU_ALL = 0xFF
+MIDI_THRU_CHANNELS = 0xFFFF
+
+class MidiQueue:
+    # Ring buffer of decoded messages stored as parallel arrays
+    def __init__(self, size=64):
+        self._size = size
+        self.status = bytearray(size)
+        self.data1 = bytearray(size)
+        self.data2 = bytearray(size)
+        self.timestamps = array.array("L", [0 for i in range(size)])
+        self.head = 0
+        self.tail = 0
+        self.overflows = 0
+
+    def push(self, status, data1, data2, timestamp=0):
+        head = (self.head + 1) % self._size
+        if head == self.tail:
+            self.overflows = self.overflows + 1
+            return False
+        self.status[self.head] = status
+        self.data1[self.head] = data1
+        self.data2[self.head] = data2
+        self.timestamps[self.head] = timestamp
+        self.head = head
+        return True
+    def is_empty(self):
+        return self.head == self.tail
+    def next(self):
+        index = self.tail
+        self.tail = (self.tail + 1) % self._size
+        return index
+    def clear(self):
+        self.tail = self.head
+
+class MidiThru:
+    # Collects forwarded bytes per output port and writes each port once per update
+    def __init__(self, size=256):
+        self._size = size
+        self._ports = []
+        self._buffers = []
+        self._views = []
+        self._lengths = []
+        self._channels = []
+        self._types = []
+        self._enabled = []
+        self._filtered = False
+
+        # Filtered ports copy runs of accepted messages out of the received bytes
+        self._raw_ports = []
+        self._filter_ports = []
+        self._accepts = [] # Whether each status byte passes the filter of each port
+        self._accepted = bytearray(256) # Status bytes accepted by any filtered port
+        self._running = []
+        self._starts = []
+        self._ends = []
+        self._data = None
+
+    def add_port(self, port):
+        buffer = bytearray(self._size)
+        self._ports.append(port)
+        self._buffers.append(buffer)
+        self._views.append(memoryview(buffer))
+        self._lengths.append(0)
+        self._channels.append(MIDI_THRU_CHANNELS)
+        self._types.append(MIDI_THRU_ALL)
+        self._enabled.append(True)
+        self._accepts.append(bytearray(256))
+        self._running.append(0)
+        self._starts.append(-1)
+        self._ends.append(-1)
+        self._raw_ports.append(len(self._ports) - 1)
+        return len(self._ports) - 1
+
+    def set_filter(self, index, channels=MIDI_THRU_CHANNELS, types=MIDI_THRU_ALL):
+        self._channels[index] = channels & MIDI_THRU_CHANNELS
+        self._types[index] = types & MIDI_THRU_ALL
+        accepts = self._accepts[index]
+        for status in range(0x80, 0x100):
+            if status >= 0xF0:
+                accepts[status] = 1 if self._types[index] & MIDI_THRU_SYSTEM else 0
+            else:
+                accepts[status] = 1 if self._types[index] & (1 << ((status >> 4) - 8)) and self._channels[index] & (1 << (status & 0x0F)) else 0
+        self._raw_ports = []
+        self._filter_ports = []
+        for i in range(256):
+            self._accepted[i] = 0
+        for i in range(len(self._ports)):
+            if self._is_filtered(i):
+                self._filter_ports.append(i)
+                for status in range(0x80, 0x100):
+                    self._accepted[status] = self._accepted[status] | self._accepts[i][status]
+            else:
+                self._raw_ports.append(i)
+        self._filtered = bool(self._filter_ports)
+    def set_enabled(self, index, value):
+        if value and not self._enabled[index]: # A newly connected device has no running status
+            self._running[index] = 0
+        self._enabled[index] = value
+    def _is_filtered(self, index):
+        return self._channels[index] != MIDI_THRU_CHANNELS or self._types[index] != MIDI_THRU_ALL
+    def is_filtered(self):
+        return self._filtered
+    def get_accepted(self):
+        return self._accepted
+
+    def _append(self, index, data, count, offset=0):
+        length = self._lengths[index]
+        if length + count > self._size:
+            self._write(index)
+            length = 0
+            if count > self._size:
+                self._ports[index].write(data[offset:offset+count])
+                return
+        self._views[index][length:length+count] = data[offset:offset+count]
+        self._lengths[index] = length + count
+
+    def forward_raw(self, data, count):
+        # Unfiltered ports receive the received byte run as is
+        for i in self._raw_ports:
+            if self._enabled[i]:
+                self._append(i, data, count)
+
+    def begin(self, data):
+        self._data = data
+    def forward(self, status, data1, data2, length, start=-1, end=-1):
+        # A message at data[start:end] is appended to the run of the previous accepted message when it directly follows it
+        for i in self._filter_ports:
+            if not self._enabled[i] or not self._accepts[i][status]:
+                continue
+            if start >= 0 and (self._data[start] >= 0x80 or self._running[i] == status):
+                if start != self._ends[i]:
+                    self._end_run(i)
+                    self._starts[i] = start
+                self._ends[i] = end
+            else:
+                # The status byte isn't in the received bytes or the port's running status differs
+                self._end_run(i)
+                self._append_message(i, status, data1, data2, length)
+            if status < 0xF0:
+                self._running[i] = status
+            elif status < 0xF8: # System common messages cancel running status
+                self._running[i] = 0
+    def end(self):
+        for i in self._filter_ports:
+            self._end_run(i)
+        self._data = None
+    def _end_run(self, index):
+        if self._starts[index] >= 0:
+            self._append(index, self._data, self._ends[index] - self._starts[index], self._starts[index])
+            self._starts[index] = -1
+            self._ends[index] = -1
+    def _append_message(self, index, status, data1, data2, length):
+        position = self._lengths[index]
+        if position + 3 > self._size:
+            self._write(index)
+            position = 0
+        buffer = self._buffers[index]
+        buffer[position] = status
+        if length > 0:
+            buffer[position+1] = data1
+        if length > 1:
+            buffer[position+2] = data2
+        self._lengths[index] = position + length + 1
+
+    def _write(self, index):
+        if self._lengths[index]:
+            self._ports[index].write(self._views[index][:self._lengths[index]])
+            self._lengths[index] = 0
+    def flush(self):
+        for i in range(len(self._ports)):
+            if self._enabled[i]:
+                self._write(i)
+            else:
+                self._lengths[i] = 0
+
+    def deinit(self):
+        for view in self._views:
+            view.release()
+        del self._views
+        del self._buffers
+        del self._ports
+        self._data = None
+
+class MidiParser:
+    # Decodes a raw MIDI byte stream with running status support
+    def __init__(self, port, size=64, byte_time=0):
+        self._port = port
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._status = 0
+        self._length = 0
+        self._count = 0
+        self._data1 = 0
+        self._start = -1 # Position of the current message in the buffer
+
+        # Arrival time of each message is estimated from the read window and serial byte timing
+        self._byte_time = byte_time
+        self._last = 0
+        self._now = 0
+        self._index = 0
+        self._total = 0
+
+        self._thru = None
+        self._accepted = None
+
+    def _get_length(self, status):
+        if status < 0xF0:
+            if status & 0xF0 == 0xC0 or status & 0xF0 == 0xD0:
+                return 1
+            return 2
+        elif status == 0xF1 or status == 0xF3:
+            return 1
+        elif status == 0xF2:
+            return 2
+        return 0
+
+    def _get_timestamp(self):
+        # Bytes arrived in order after the previous read and no later than the byte rate allows
+        latest = (self._now - (self._total - self._index - 1) * self._byte_time) & MIDI_TIME_MASK
+        if not self._last:
+            return latest
+        earliest = (self._last + (self._index + 1) * self._byte_time) & MIDI_TIME_MASK
+        window = (latest - earliest) & MIDI_TIME_MASK
+        if window > MIDI_TIME_MASK // 2:
+            return latest
+        return (earliest + window // 2) & MIDI_TIME_MASK
+
+    def _push(self, queue, status, data1, data2, length, start=-1, end=-1):
+        queue.push(status, data1, data2, self._get_timestamp())
+        if self._thru and self._accepted[status]:
+            self._thru.forward(status, data1, data2, length, start, end)
+
+    def _parse(self, byte, queue):
+        if byte >= 0xF8: # System real-time messages may interleave other messages
+            self._push(queue, byte, 0, 0, 0, self._index, self._index + 1)
+        elif byte >= 0x80:
+            self._count = 0
+            self._start = self._index
+            if byte == 0xF7: # End of system exclusive
+                self._status = 0
+                return
+            self._status = byte
+            self._length = self._get_length(byte)
+            if byte > 0xF0 and not self._length:
+                self._push(queue, byte, 0, 0, 0, self._index, self._index + 1)
+                self._status = 0
+        elif self._status and self._status != 0xF0:
+            if not self._count:
+                self._data1 = byte
+                if self._start < 0: # Running status
+                    self._start = self._index
+            self._count = self._count + 1
+            if self._count >= self._length:
+                # Messages with interleaved real-time bytes are not contiguous
+                start = self._start
+                if self._thru and start >= 0 and self._index + 1 - start != self._length + (1 if self._buffer[start] >= 0x80 else 0):
+                    start = -1
+                self._push(queue, self._status, self._data1, byte if self._length > 1 else 0, self._length, start, self._index + 1)
+                self._start = -1
+                self._count = 0
+                if self._status >= 0xF0: # System common messages cancel running status
+                    self._status = 0
+
+    def read(self, queue, now=None, thru=None):
+        count = self._port.readinto(self._buffer)
+        if now is None:
+            now = get_midi_time()
+        if not count:
+            self._last = now
+            return 0
+        if thru:
+            thru.forward_raw(self._view, count)
+        self._thru = thru if thru and thru.is_filtered() else None
+        if self._thru:
+            self._accepted = self._thru.get_accepted()
+            self._thru.begin(self._view)
+        self._start = -1
+        self._now = now
+        self._total = count
+        for i in range(count):
+            self._index = i
+            self._parse(self._buffer[i], queue)
+        if self._thru:
+            self._thru.end()
+        self._last = now
+        return count
+
+    def deinit(self):
+        self._view.release()
+        del self._view
+        del self._buffer
+        self._thru = None
+        self._accepted = None
+
 class Midi:
 
-    def __init__(self, uart=True, uart_tx=None, uart_rx=None, usb=False, ble=False, update=0.05, map_path="/midi.json"):
+    def __init__(self, uart=True, uart_tx=None, uart_rx=None, usb=False, ble=False, update=0.0, queue_size=64, thru_size=256, map_path="/midi.json"):
         self._thru = False
+        self._channel = 0
         self._note_on = None
         self._note_off = None
         self._control_change = None
         self._pitch_bend = None
         self._program_change = None
+        self._clock = None
+        self._start = None
+        self._stop = None
+        self._continue = None
         self._update = update
         self._now = 0.0
+        self._queue = MidiQueue(queue_size)
+        self._timestamp = 0
+        self._thru_ports = MidiThru(thru_size)
+        self._uart_thru = None
+        self._usb_thru = None
+        self._ble_thru = None
 
         if uart:
             self._uart = UART(
@@ -19,27 +337,22 @@ class Midi:
                 baudrate=31250,
                 timeout=0.001
             )
-            self._uart_midi = adafruit_midi.MIDI(
-                midi_in=self._uart,
-                midi_out=self._uart,
-                in_channel=0,
-                out_channel=0,
-                debug=False
-            )
+            self._uart_parser = MidiParser(self._uart, byte_time=320) # 10 bits at 31250 baud
+            self._uart_thru = self._thru_ports.add_port(self._uart)
         else:
-            self._uart_midi = None
+            self._uart = None
+            self._uart_parser = None
 
         if usb:
             import usb_midi
-            self._usb_midi = adafruit_midi.MIDI(
-                midi_in=usb_midi.ports[0],
-                midi_out=usb_midi.ports[1],
-                in_channel=0,
-                out_channel=0,
-                debug=False
-            )
+            self._usb_in = usb_midi.ports[0]
+            self._usb_out = usb_midi.ports[1]
+            self._usb_parser = MidiParser(self._usb_in)
+            self._usb_thru = self._thru_ports.add_port(self._usb_out)
         else:
-            self._usb_midi = None
+            self._usb_in = None
+            self._usb_out = None
+            self._usb_parser = None
 
         if ble:
             try:
@@ -54,22 +367,17 @@ class Midi:
                     for connection in self._ble.connections:
                         connection.disconnect()
 
-                self._ble_midi = adafruit_midi.MIDI(
-                    midi_in=self._ble_midi_service,
-                    midi_out=self._ble_midi_service,
-                    in_channel=0,
-                    out_channel=0,
-                    debug=False
-                )
+                self._ble_parser = MidiParser(self._ble_midi_service)
+                self._ble_thru = self._thru_ports.add_port(self._ble_midi_service)
             except Exception as e:
                 self._ble_midi_service = None
                 self._ble_advertisement = None
                 self._ble = None
-                self._ble_midi = None
+                self._ble_parser = None
                 print("Device not bluetooth capable:")
         else:
             self._ble = None
-            self._ble_midi = None
+            self._ble_parser = None
 
         self._map = read_json(map_path)
 
@@ -83,91 +391,129 @@ class Midi:
         self._pitch_bend = callback
     def set_program_change(self, callback):
         self._program_change = callback
+    def set_clock(self, callback):
+        self._clock = callback
+    def set_start(self, callback):
+        self._start = callback
+    def set_stop(self, callback):
+        self._stop = callback
+    def set_continue(self, callback):
+        self._continue = callback
 
     def init(self):
         if self._ble and self._ble_advertisement:
             self._ble.start_advertising(self._ble_advertisement)
 
     def set_channel(self, value):
-        if self._uart_midi:
-            self._uart_midi.in_channel = value
-            self._uart_midi.out_channel = value
-        if self._usb_midi:
-            self._usb_midi.in_channel = value
-            self._usb_midi.out_channel = value
-        if self._ble_midi:
-            self._ble_midi.in_channel = value
-            self._ble_midi.out_channel = value
+        self._channel = value
     def set_thru(self, value):
         self._thru = value
+    def set_thru_filter(self, port, channels=MIDI_THRU_CHANNELS, types=MIDI_THRU_ALL):
+        # port is "uart", "usb" or "ble", channels is a bitmask of MIDI channels and types a combination of MIDI_THRU_* flags
+        index = getattr(self, "_" + port + "_thru", None)
+        if index is None:
+            return False
+        self._thru_ports.set_filter(index, channels, types)
+        return True
+    def get_timestamp(self):
+        # Estimated arrival of the message being dispatched
+        return self._timestamp
 
-    def _process_message(self, msg):
-        if not msg:
+    def _process_message(self, status, data1, data2):
+        if status >= 0xF0:
+            if status == 0xF8: # Timing Clock
+                if self._clock:
+                    self._clock(self._timestamp)
+            elif status == 0xFA: # Start
+                if self._start:
+                    self._start()
+            elif status == 0xFB: # Continue
+                if self._continue:
+                    self._continue()
+            elif status == 0xFC: # Stop
+                if self._stop:
+                    self._stop()
+            return
+        if status & 0x0F != self._channel:
             return
 
-        if isinstance(msg, NoteOn):
-            if msg.velocity > 0.0:
+        type = status & 0xF0
+        if type == 0x90: # Note On
+            if data2 > 0:
                 if self._note_on:
-                    self._note_on(msg.note, msg.velocity / 127.0)
+                    self._note_on(data1, data2 / 127.0)
             elif self._note_off:
-                self._note_off(msg.note)
-        elif isinstance(msg, NoteOff):
+                self._note_off(data1)
+        elif type == 0x80: # Note Off
             if self._note_off:
-                self._note_off(msg.note)
-        elif isinstance(msg, ControlChange):
+                self._note_off(data1)
+        elif type == 0xB0: # Control Change
             if self._control_change:
-                self._control_change(msg.control, msg.value / 127.0)
-        elif isinstance(msg, PitchBend):
+                self._control_change(data1, data2 / 127.0)
+        elif type == 0xE0: # Pitch Bend
             if self._pitch_bend:
-                self._pitch_bend((msg.pitch_bend - 8192) / 8192)
-        elif isinstance(msg, ProgramChange):
+                self._pitch_bend(((data2 << 7 | data1) - 8192) / 8192)
+        elif type == 0xC0: # Program Change
             if self._program_change:
-                self._program_change(msg.patch)
+                self._program_change(data1)
 
-        if self._thru:
-            if self._uart_midi:
-                self._uart_midi.send(msg)
-            if self._usb_midi:
-                self._usb_midi.send(msg)
-            if self._ble and self._ble.connected and self._ble_midi:
-                self._ble_midi.send(msg)
-    def _process_messages(self, midi, limit=32):
-        while limit>0:
-            msg = midi.receive()
-            if not msg:
-                break
-            self._process_message(msg)
-            limit = limit - 1
+    def _process_messages(self):
+        queue = self._queue
+        while not queue.is_empty():
+            i = queue.next()
+            self._timestamp = queue.timestamps[i]
+            self._process_message(queue.status[i], queue.data1[i], queue.data2[i])
 
     def get_control_parameter(self, control, default=None):
         return self._map.get(str(control), default)
+    def get_control_map(self):
+        return self._map
+    def get_overflows(self):
+        return self._queue.overflows
 
     def update(self, now=None):
-        if not now:
-            now = time.monotonic()
-        if now < self._now + self._update:
-            return
-        self._now = now
+        if self._update > 0.0:
+            if not now:
+                now = time.monotonic()
+            if now < self._now + self._update:
+                return
+            self._now = now
 
-        if self._uart_midi:
-            self._process_messages(self._uart_midi)
-        if self._usb_midi:
-            self._process_messages(self._usb_midi)
-        if self._ble and self._ble.connected and self._ble_midi:
-            self._process_messages(self._ble_midi)
+        timestamp = get_midi_time()
+        thru = self._thru_ports if self._thru else None
+        if not self._ble_thru is None:
+            self._thru_ports.set_enabled(self._ble_thru, self._ble.connected)
+        if self._uart_parser:
+            self._uart_parser.read(self._queue, timestamp, thru)
+        if self._usb_parser:
+            self._usb_parser.read(self._queue, timestamp, thru)
+        if self._ble and self._ble.connected and self._ble_parser:
+            self._ble_parser.read(self._queue, timestamp, thru)
+        if thru:
+            thru.flush()
+        self._process_messages()
 
     def deinit(self):
         del self._map
         if self._ble and self._ble.connected:
             for connection in self._ble.connections:
                 connection.disconnect()
-        if self._ble_midi:
+        self._thru_ports.deinit()
+        del self._thru_ports
+        if self._ble_parser:
+            self._ble_parser.deinit()
             del self._ble_midi_service
             del self._ble_advertisement
             del self._ble
-            del self._ble_midi
-        if self._usb_midi:
-            del self._usb_midi
-        if self._uart_midi:
-            del self._uart_midi
+            del self._ble_parser
+        if self._usb_parser:
+            self._usb_parser.deinit()
+            del self._usb_in
+            del self._usb_out
+            del self._usb_parser
+        if self._uart_parser:
+            self._uart_parser.deinit()
+            del self._uart_parser
+            self._uart.deinit()
             del self._uart
+        del self._queue
@@ -1,65 +1,272 @@
+PARAMETER_NONE = 0
+PARAMETER_LINEAR = 1
+PARAMETER_LINEAR_INT = 2
+PARAMETER_CENTERED = 3
+PARAMETER_BOOLEAN = 4
+PARAMETER_INDEX = 5
+PARAMETER_KEY = 6
+
+PARAMETER_MOD = 0x01
+PARAMETER_PATCH = 0x02
+
+PARAMETER_INDEX_EPSILON = 0.0001 # Raw values are single precision, k/n may be stored just below k/n
+
+def get_parameter_id(name):
+    # Stable 16-bit identifier derived from the parameter name (CRC-16/CCITT)
+    crc = 0xFFFF
+    for c in name:
+        crc = crc ^ (ord(c) << 8)
+        for i in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+class ParameterStore:
+    # Columnar storage of every parameter, Parameter objects only hold their index
+    def __init__(self):
+        self.names = []
+        self.labels = []
+        self.groups = []
+        self.ranges = []
+        self.callbacks = []
+        self.formats = []
+        self.ids = array.array("H")
+        self.raw = array.array("f")
+        self.bounds = array.array("f") # min, span or center, max, threshold
+        self.step_sizes = array.array("f")
+        self.kinds = bytearray()
+        self.flags = bytearray()
+        self.group_indexes = bytearray()
+        self.positions = bytearray()
+
+        # Sparse columns
+        self.keys = {} # Key lists of dict ranges
+        self.arguments = {}
+        self.properties = {}
+        self.mod_prefixes = {}
+
+        self.mappers = (None, self._map_linear, self._map_linear_int, self._map_centered, self._map_boolean, self._map_index, self._map_key)
+
+    def append(self, name, label, group, mod, patch):
+        self.names.append(name)
+        self.ids.append(get_parameter_id(name))
+        self.labels.append(label)
+        self.groups.append(group)
+        self.ranges.append(None)
+        self.callbacks.append(None)
+        self.formats.append(None)
+        self.raw.append(-1.0) # Outside of 0.0-1.0 so that the first value is always applied
+        for i in range(4):
+            self.bounds.append(0.0)
+        self.step_sizes.append(1.0)
+        self.kinds.append(PARAMETER_NONE)
+        self.flags.append((PARAMETER_MOD if mod else 0) | (PARAMETER_PATCH if patch else 0))
+        self.group_indexes.append(0)
+        self.positions.append(0)
+        return len(self.names) - 1
+
+    def set_range(self, index, value):
+        self.ranges[index] = value
+        if index in self.keys:
+            del self.keys[index]
+        bounds = index * 4
+        for i in range(4):
+            self.bounds[bounds + i] = 0.0
+        kind = PARAMETER_NONE
+        if type(value) is dict:
+            self.keys[index] = list(value)
+            kind = PARAMETER_KEY
+        elif type(value) is list:
+            kind = PARAMETER_INDEX
+        elif type(value) is tuple and len(value) >= 3: # Centered with optional threshold
+            for i in range(min(len(value), 4)):
+                self.bounds[bounds + i] = value[i]
+            kind = PARAMETER_CENTERED
+        elif type(value) is tuple and len(value) == 2: # Linear range
+            kind = self._set_linear(bounds, value[0], value[1])
+        elif type(value) is int or type(value) is float: # +/- linear range
+            kind = self._set_linear(bounds, -value, value)
+        elif type(value) is bool:
+            kind = PARAMETER_BOOLEAN
+        self.kinds[index] = kind
+    def _set_linear(self, bounds, min_value, max_value):
+        self.bounds[bounds] = min_value
+        self.bounds[bounds + 1] = max_value - min_value
+        return PARAMETER_LINEAR_INT if type(min_value) is int else PARAMETER_LINEAR
+    def get_keys(self, index):
+        if self.kinds[index] == PARAMETER_KEY:
+            return self.keys[index]
+        elif self.kinds[index] == PARAMETER_INDEX:
+            return self.ranges[index]
+        return None
+
+    def _map_linear(self, index, value):
+        return value * self.bounds[index * 4 + 1] + self.bounds[index * 4]
+    def _map_linear_int(self, index, value):
+        return round(value * self.bounds[index * 4 + 1] + self.bounds[index * 4])
+    def _map_centered(self, index, value):
+        index = index * 4
+        return map_value_centered(value, self.bounds[index], self.bounds[index + 1], self.bounds[index + 2], self.bounds[index + 3])
+    def _map_boolean(self, index, value):
+        return value >= 0.5
+    def _map_index(self, index, value):
+        count = len(self.ranges[index])
+        value = int(value * count + PARAMETER_INDEX_EPSILON)
+        if value >= count:
+            return max(count - 1, 0)
+        return value
+    def _map_key(self, index, value):
+        keys = self.keys[index]
+        count = len(keys)
+        value = int(value * count + PARAMETER_INDEX_EPSILON)
+        if value >= count:
+            value = count - 1
+        return keys[value]
+
+    def deinit(self):
+        del self.mappers
+        del self.callbacks
+        del self.arguments
+        del self.properties
+        del self.ranges
+        del self.keys
+        del self.formats
+
+parameter_store = ParameterStore()
+
 class Parameter:
+    _store = parameter_store
+
     def __init__(self, name="", label="", group="", range=None, value=0.0, set_callback=None, set_argument=None, object=None, property=None, mod=True, patch=True):
-        self.name = name
-        self.label = label
-        self.group = group
-        self.range = range
-        self.set_callback = set_callback
-        self.set_argument = set_argument
-        self.object = object
-        self.property = property
-        self.mod = mod
-        self.patch = patch
+        store = self._store
+        self._index = store.append(name, label, group, mod, patch)
+        store.callbacks[self._index] = set_callback
+        if set_argument:
+            store.arguments[self._index] = set_argument
+        if object and property:
+            store.properties[self._index] = (object, property)
+        self.set_range(range)
         self.set(value)
+
+    @property
+    def name(self):
+        return self._store.names[self._index]
+    @property
+    def id(self):
+        return self._store.ids[self._index]
+    @property
+    def label(self):
+        return self._store.labels[self._index]
+    @property
+    def group(self):
+        return self._store.groups[self._index]
+    @property
+    def range(self):
+        return self._store.ranges[self._index]
+    @property
+    def mod(self):
+        return bool(self._store.flags[self._index] & PARAMETER_MOD)
+    @property
+    def patch(self):
+        return bool(self._store.flags[self._index] & PARAMETER_PATCH)
+    @property
+    def raw_value(self):
+        return self._store.raw[self._index]
+    @property
+    def format_value(self):
+        return self._store.formats[self._index]
+
+    def set_range(self, value):
+        # Compiles the range into a mapper so that set does not need to inspect it again
+        self._store.set_range(self._index, value)
+        self._store.step_sizes[self._index] = 1.0 / self.get_steps()
+    def get_mod_label(self):
+        prefix = self._store.mod_prefixes.get(self._index, None)
+        if prefix:
+            return prefix + " " + self.label
+        return self.label
+
     def set(self, value):
+        store = self._store
+        index = self._index
         if type(value) is str or type(value) is int:
-            if type(self.range) is dict:
-                value = unmap_dict(value, self.range)
-            elif type(self.range) is list:
-                value = unmap_array(value, self.range)
-            else:
+            keys = store.get_keys(index)
+            if keys is None:
                 return False
-        value = min(max(value, 0.0), 1.0)
-        if hasattr(self, "raw_value") and value == self.raw_value:
+            value = unmap_array(value, keys)
+        previous = store.raw[index]
+        store.raw[index] = min(max(value, 0.0), 1.0)
+        value = store.raw[index]
+        if value == previous:
             return False
-        self.raw_value = value
-        if type(self.range) is dict:
-            value = map_dict(value, self.range)
-        elif type(self.range) is list:
-            value = map_array(value, self.range, True)
-        elif type(self.range) is tuple:
-            if len(self.range) == 4: # Centered with threshold
-                value = map_value_centered(value, self.range[0], self.range[1], self.range[2], self.range[3])
-            elif len(self.range) == 3: # Centered
-                value = map_value_centered(value, self.range[0], self.range[1], self.range[2])
-            elif len(self.range) == 2: # Linear range
-                value = map_value(value, self.range[0], self.range[1])
-        elif type(self.range) is int or type(self.range) is float: # +/- linear range
-            value = map_value(value, -self.range, self.range)
-        elif type(self.range) is bool:
-            value = map_boolean(value)
-        self.format_value = value
-        if self.set_callback:
-            if self.set_argument:
-                self.set_callback(value, self.set_argument)
+        kind = store.kinds[index]
+        if kind:
+            value = store.mappers[kind](index, value)
+        store.formats[index] = value
+        callback = store.callbacks[index]
+        if callback:
+            argument = store.arguments.get(index, None)
+            if argument:
+                callback(value, argument)
             else:
-                self.set_callback(value)
-        elif self.object and self.property:
-            if type(self.object) is dict:
-                self.object[self.property] = value
-            elif hasattr(self.object, self.property):
-                setattr(self.object, self.property, value)
+                callback(value)
+        elif index in store.properties:
+            object, property = store.properties[index]
+            if type(object) is dict:
+                object[property] = value
+            elif hasattr(object, property):
+                setattr(object, property, value)
         return True
     def get(self):
-        return self.raw_value
+        return self._store.raw[self._index]
+
+    def map(self, value):
+        # Raw value to format value without applying it
+        kind = self._store.kinds[self._index]
+        if kind:
+            return self._store.mappers[kind](self._index, value)
+        return value
+    def get_patch_value(self, value=None):
+        # Value as stored in a patch file: names for enumerations and raw values otherwise
+        if value is None:
+            value = self.get()
+        kind = self._store.kinds[self._index]
+        if kind == PARAMETER_KEY or kind == PARAMETER_BOOLEAN:
+            return self.map(value)
+        elif kind == PARAMETER_INDEX:
+            item = self.range[self.map(value)]
+            if type(item) is str:
+                return item
+            elif type(item) is Parameter:
+                return item.name
+        return round(value, 6)
+    def get_raw_value(self, value):
+        # Raw value of a patch file value without applying it, None if it cannot be resolved
+        if type(value) is str or type(value) is int:
+            keys = self._store.get_keys(self._index)
+            if keys is None:
+                return None
+            if type(value) is str and keys and type(keys[0]) is Parameter: # Parameter lists are stored by name
+                for i in range(len(keys)):
+                    if keys[i].name == value:
+                        return i / len(keys)
+                return None
+            return unmap_array(value, keys)
+        return min(max(value, 0.0), 1.0)
+
     def get_formatted_value(self, translate=True):
+        return self.format(self._store.formats[self._index], translate)
+    def format(self, format_value, translate=True):
         if translate:
             value = None
-            if type(self.range) is dict or type(self.range) is list:
-                if type(self.format_value) is float:
-                    value = self.range[int(self.format_value)]
+            range = self.range
+            if type(range) is dict or type(range) is list:
+                if type(format_value) is float:
+                    value = range[int(format_value)]
                 else:
-                    value = self.range[self.format_value]
+                    value = range[format_value]
             if value:
                 if type(value) is str:
                     return value
@@ -68,28 +275,31 @@ class Parameter:
                         return value.get("label")
                     elif value.get("name", None):
                         return value.get("name")
+                elif type(value) is Parameter:
+                    return value.get_mod_label()
                 elif hasattr(value, "label"):
                     return value.label
                 elif hasattr(value, "name"):
                     return value.name
-        return self.format_value
+        return format_value
     def get_steps(self):
+        range = self.range
         steps = 20
-        if type(self.range) is dict or type(self.range) is list:
-            steps = len(self.range)-1
-        elif type(self.range) is bool:
+        if type(range) is dict or type(range) is list:
+            steps = len(range)-1
+        elif type(range) is bool:
             steps = 1
-        elif type(self.range) is tuple and len(self.range) == 2 and type(self.range[0]) is int:
-            steps = self.range[1] - self.range[0] + 1
-        elif type(self.range) is int: # +/- linear range
-            steps = self.range * 2 + 1
+        elif type(range) is tuple and len(range) == 2 and type(range[0]) is int:
+            steps = range[1] - range[0] + 1
+        elif type(range) is int: # +/- linear range
+            steps = range * 2 + 1
         return max(steps, 1)
     def get_step_size(self):
-        return 1.0/self.get_steps()
+        return self._store.step_sizes[self._index]
     def increment(self):
-        return self.set(self.raw_value + self.get_step_size())
+        return self.set(self.get() + self.get_step_size())
     def decrement(self):
-        return self.set(self.raw_value - self.get_step_size())
+        return self.set(self.get() - self.get_step_size())
 
 class ParameterGroup:
     def __init__(self, name="", label="", mod_prepend=False):
@@ -106,8 +316,17 @@ class Parameters:
         self._mod_parameters = []
         self._items = []
         self._groups = []
+        self._transactions = []
+        self._transaction = 0
+
+        # Lookup tables built as items are registered
+        self._group_indexes = {}
+        self._parameter_names = {}
+        self._parameter_ids = {}
+        self._controls = [None for i in range(128)]
 
     def add_group(self, item):
+        self._group_indexes[item.name] = len(self._groups)
         self._groups.append(item)
     def add_groups(self, items):
         for item in items:
@@ -119,26 +338,31 @@ class Parameters:
         return len(self._groups)
     def get_group(self, value):
         if type(value) is str:
-            for group in self._groups:
-                if group.name == value:
-                    return group
+            index = self._group_indexes.get(value, None)
+            if not index is None:
+                return self._groups[index]
         elif type(value) is int and abs(value) < self.get_group_count():
             return self._groups[value]
         return None
+    def get_group_index(self, name):
+        return self._group_indexes.get(name, None)
 
     def add_parameter(self, item):
         self._items.append(item)
+        self._parameter_names[item.name] = item
+        if item.id in self._parameter_ids:
+            print("Parameter id collision: {} and {}".format(item.name, self._parameter_ids[item.id].name))
+        self._parameter_ids[item.id] = item
+        store = item._store
         group = self.get_group(item.group)
         if group:
+            store.group_indexes[item._index] = self._group_indexes[group.name]
+            store.positions[item._index] = len(group.items)
             group.append(item)
         if item.mod:
-            label = item.label
             if group and group.mod_prepend:
-                label = group.label + " " + label
-            self._mod_parameters.append({
-                "name": item.name,
-                "label": label
-            })
+                store.mod_prefixes[item._index] = group.label
+            self._mod_parameters.append(item)
     def add_parameters(self, items):
         for item in items:
             self.add_parameter(item)
@@ -155,12 +379,55 @@ class Parameters:
             return len(self._items)
     def get_parameter(self, value):
         if type(value) is str:
-            for parameter in self._items:
-                if parameter.name == value:
-                    return parameter
+            return self._parameter_names.get(value, None)
         elif type(value) is int and abs(value) < self.get_parameter_count():
             return self._items[value]
         return None
+    def get_parameter_by_id(self, id):
+        return self._parameter_ids.get(id, None)
+    def get_parameter_index(self, name):
+        # Returns (group index, index within group) or None
+        item = self._parameter_names.get(name, None)
+        if not item or self.get_group(item.group) is None:
+            return None
+        return (item._store.group_indexes[item._index], item._store.positions[item._index])
+
+    def add_transaction(self, item):
+        # item is notified with begin() and commit() so that it can defer updates until all values are set
+        self._transactions.append(item)
+    def begin(self):
+        if not self._transaction:
+            for item in self._transactions:
+                item.begin()
+        self._transaction = self._transaction + 1
+    def commit(self):
+        if not self._transaction:
+            return
+        self._transaction = self._transaction - 1
+        if not self._transaction:
+            for item in self._transactions:
+                item.commit()
+    def apply(self, values):
+        # Sets many parameters by name within a single transaction
+        self.begin()
+        for name in values:
+            parameter = self.get_parameter(name)
+            if parameter:
+                value = parameter.get_raw_value(values[name])
+                if not value is None:
+                    parameter.set(value)
+        self.commit()
+
+    def set_control_map(self, map):
+        # map is the control number to parameter name dictionary from midi.json
+        for i in range(len(self._controls)):
+            self._controls[i] = None
+        for control in map:
+            control_number = int(control)
+            if control_number >= 0 and control_number < len(self._controls):
+                self._controls[control_number] = self.get_parameter(map[control])
+    def get_control(self, control):
+        return self._controls[control & 0x7F]
 
     def get_mod_parameters(self):
         return self._mod_parameters
@@ -175,6 +442,12 @@ class Parameters:
         self._mod_parameter = value
 
     def deinit(self):
+        parameter_store.deinit()
+        del self._transactions
         del self._mod_parameters
         del self._items
         del self._groups
+        del self._group_indexes
+        del self._parameter_names
+        del self._parameter_ids
+        del self._controls
@@ -1,17 +1,120 @@
+PATCH_BANK_MAGIC = b"SMPB"
+PATCH_BANK_VERSION = 2
+PATCH_BANK_SLOTS = 100
+PATCH_BANK_HEADER = "<4sBBH" # magic, version, slot count, reserved
+PATCH_BANK_ENTRY = "<IHBBII16s" # newest record offset, value count, flags, delta depth, json mtime, json size, name
+PATCH_BANK_RECORD = "<IH2x" # offset and value count of the record a delta is based on, zero for a full record
+PATCH_BANK_DIRTY = 1 # the slot was saved as a delta and its JSON patch is out of date
+PATCH_BANK_DEPTH = 4 # deltas written to a slot before a full record is written again
+PATCH_BANK_COMPACT = 2 # the bank is compacted at boot once it is this many times larger than its live records
+PATCH_FLUSH_DELAY = 2.0 # seconds after a delta save before the JSON patch is rewritten while idle
+PATCH_TEMP = ".save.tmp"
+
 class Patches:
-    def __init__(self, parameters, dir="/patches"):
+    def __init__(self, parameters, dir="/patches", bank=None, cache=0, debounce=0.0):
         self._parameters = parameters
         self._dir = dir
         self._items = {}
+        self._recover()
         for filename in self._list_filenames():
             self._items[self._get_filename_index(filename)] = filename
 
+        # Binary bank of raw values keyed by parameter id with a fixed index of every slot
+        self._bank = bank
+        self._bank_header_size = struct.calcsize(PATCH_BANK_HEADER)
+        self._bank_entry_size = struct.calcsize(PATCH_BANK_ENTRY)
+        self._bank_index = bytearray(self._bank_header_size + PATCH_BANK_SLOTS * self._bank_entry_size)
+        self._bank_ids = None
+        self._bank_values = None
+        self._bank_record = bytearray(struct.calcsize(PATCH_BANK_RECORD))
+        self._delta_ids = None
+        self._delta_values = None
+        self._chain_offsets = array.array("L", [0 for i in range(PATCH_BANK_DEPTH + 1)])
+        self._chain_counts = array.array("H", [0 for i in range(PATCH_BANK_DEPTH + 1)])
+
+        # Raw values as of the last read or save, only changed parameters are written when saving over the same patch
+        self._saved = None
+        self._saves = 0
+        self._delta_saves = 0
+        self._skipped_saves = 0
+        self._save_stall = 0
+        self._dirty = False
+        self._dirty_time = 0.0
+
+        # Least recently used cache of decoded patches, neighbors of the current patch are prefetched in update
+        self._cache_size = min(max(cache, 0), PATCH_BANK_SLOTS)
+        self._cache_indexes = array.array("b", [-1 for i in range(self._cache_size)])
+        self._cache_ticks = array.array("L", [0 for i in range(self._cache_size)])
+        self._cache_counts = array.array("H", [0 for i in range(self._cache_size)])
+        self._cache_ids = None
+        self._cache_values = None
+        self._cache_stride = -1
+        self._cache_tick = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._prefetches = 0
+        self._prefetch = False
+        self._idle = False
+        self._stall = 0
+        self._prefetch_stall = 0
+        self._current = -1
+
+        # Encoder changes are only applied once the patch parameter has settled for debounce seconds
+        self._debounce = debounce
+        self._pending = -1
+        self._pending_time = 0.0
+
+        # Buffers saved in a binary file next to each patch, read back into the same buffer
+        self._data = []
+
     def _valid_filename(self, filename):
         return len(filename) > len("00-a.json") and filename[-5:] == ".json" and filename[0:2].isdigit() and filename[2] == "-"
     def _get_filename_index(self, filename):
         if not self._valid_filename(filename):
             return 0
         return int(filename[0:2])
+    def _recover(self):
+        # Rolls back a save which was interrupted before the new patch replaced the previous one
+        try:
+            filenames = os.listdir(self._dir)
+        except:
+            return
+        for filename in filenames:
+            try:
+                if filename == PATCH_TEMP:
+                    os.remove(self._dir + "/" + filename)
+                elif filename[-9:] == ".json.bak":
+                    if len([item for item in filenames if item[0:2] == filename[0:2] and self._valid_filename(item)]):
+                        os.remove(self._dir + "/" + filename)
+                    else:
+                        os.rename(self._dir + "/" + filename, self._dir + "/" + filename[:-4])
+                        print("Recovered patch: {}".format(filename[:-4]))
+                elif filename[-4:] == ".bak": # Patch data, "NN.<extension>.bak"
+                    if filename[:-4] in filenames:
+                        os.remove(self._dir + "/" + filename)
+                    else:
+                        os.rename(self._dir + "/" + filename, self._dir + "/" + filename[:-4])
+                        print("Recovered patch data: {}".format(filename[:-4]))
+            except:
+                print("Failed to recover patch: {}".format(filename))
+    def _write_json(self, filename, data, previous=None):
+        # Writes a temporary file and renames it over the previous patch once it is on flash
+        temp = self._dir + "/" + PATCH_TEMP
+        if not save_json(temp, data):
+            return False
+        try:
+            os.sync()
+            if previous:
+                os.rename(self._dir + "/" + previous, self._dir + "/" + previous + ".bak")
+            os.rename(temp, self._dir + "/" + filename)
+            if previous:
+                os.remove(self._dir + "/" + previous + ".bak")
+            os.sync()
+        except:
+            print("Failed to save patch: {}".format(filename))
+            self._recover()
+            return False
+        return True
     def _list_filenames(self):
         try:
             return [filename for filename in os.listdir(self._dir) if self._valid_filename(filename)]
@@ -39,35 +142,576 @@ class Patches:
             return self._items
         else:
             items = {}
-            for index in self._items:
+            for index in sorted(self._items): # Directory listings are not ordered by patch index
                 items[index] = "{:02d}:{}".format(index, self.get_name(index))
             return items
 
-    def remove(self, index):
-        path = self.get_path(index)
-        if not path:
-            return False
+    def add_data(self, extension, buffer, callback=None):
+        # The callback receives the number of bytes read, or 0 if the patch has no file
+        self._data.append((extension, buffer, bytearray(len(buffer)), callback))
+    def _get_data_path(self, index, extension):
+        return "{}/{:02d}.{}".format(self._dir, index, extension)
+    def _read_data(self, index):
+        for extension, buffer, saved, callback in self._data:
+            size = 0
+            try:
+                with open(self._get_data_path(index, extension), "rb") as file:
+                    size = file.readinto(buffer)
+            except:
+                pass
+            if callback:
+                callback(size)
+            saved[:] = buffer
+    def _write_data(self, index, changes=False):
+        written = False
+        for extension, buffer, saved, callback in self._data:
+            if changes and buffer == saved:
+                continue
+            temp = self._dir + "/" + PATCH_TEMP
+            path = self._get_data_path(index, extension)
+            try:
+                with open(temp, "wb") as file:
+                    file.write(buffer)
+                os.sync()
+                # The previous file is kept until the new one is in place, like _write_json
+                previous = False
+                try:
+                    os.rename(path, path + ".bak")
+                    previous = True
+                except:
+                    pass
+                os.rename(temp, path)
+                if previous:
+                    os.remove(path + ".bak")
+                os.sync()
+                saved[:] = buffer
+                written = True
+            except:
+                print("Failed to save patch data: {}".format(path))
+                self._recover()
+        return written
+    def _remove_data(self, index):
+        for extension, buffer, saved, callback in self._data:
+            try:
+                os.remove(self._get_data_path(index, extension))
+            except:
+                pass
+
+    def _get_bank_entry(self, index):
+        return struct.unpack_from(PATCH_BANK_ENTRY, self._bank_index, self._bank_header_size + index * self._bank_entry_size)
+    def _set_bank_entry(self, index, offset=0, count=0, mtime=0, size=0, name="", flags=0, depth=0):
+        struct.pack_into(PATCH_BANK_ENTRY, self._bank_index, self._bank_header_size + index * self._bank_entry_size, offset, count, flags, depth, mtime & 0xFFFFFFFF, size & 0xFFFFFFFF, name.encode()[:16])
+    def _write_bank_entry(self, index):
+        # Only the 32 bytes of the changed slot are rewritten
+        position = self._bank_header_size + index * self._bank_entry_size
         try:
-            os.remove(path)
+            with open(self._bank, "r+b") as file:
+                file.seek(position)
+                file.write(memoryview(self._bank_index)[position:position + self._bank_entry_size])
+            os.sync()
             return True
         except:
+            print("Failed to write patch bank: {}".format(self._bank))
             return False
-    def read(self, index):
+    def _get_stat(self, index):
+        # Modification time and size of the JSON patch so a stale bank slot can be detected
         path = self.get_path(index)
         if not path:
+            return (0, 0)
+        try:
+            stat = os.stat(path)
+            return (stat[8] & 0xFFFFFFFF, stat[6] & 0xFFFFFFFF)
+        except:
+            return (0, 0)
+    def has_bank(self, index=None):
+        if not self._bank_ids:
             return False
-        data = read_json(path)
-        if not data or not "parameters" in data:
-            print("Invalid Data")
+        if index is None:
+            return True
+        return type(index) is int and index >= 0 and index < PATCH_BANK_SLOTS and self._get_bank_entry(index)[1] > 0
+
+    def load_bank(self):
+        # Requires all parameters to be registered, converts any JSON patch which is missing from the bank or changed
+        if not self._bank:
+            return False
+        count = self._parameters.get_parameter_count()
+        self._bank_ids = array.array("H", [0 for i in range(count)])
+        self._bank_values = array.array("f", [0.0 for i in range(count)])
+        self._delta_ids = array.array("H", [0 for i in range(count)])
+        self._delta_values = array.array("f", [0.0 for i in range(count)])
+        self._recover_bank()
+        valid = False
+        try:
+            with open(self._bank, "rb") as file:
+                valid = file.readinto(self._bank_index) == len(self._bank_index)
+            if valid:
+                magic, version, slots, reserved = struct.unpack_from(PATCH_BANK_HEADER, self._bank_index, 0)
+                valid = magic == PATCH_BANK_MAGIC and version == PATCH_BANK_VERSION and slots == PATCH_BANK_SLOTS
+        except:
+            valid = False
+        if not valid:
+            return self._build_bank()
+
+        self.flush()
+        for index in range(PATCH_BANK_SLOTS):
+            entry = self._get_bank_entry(index)
+            if not index in self._items:
+                if entry[1]:
+                    self._set_bank_entry(index)
+                    self._write_bank_entry(index)
+            elif not entry[1] or (entry[4], entry[5]) != self._get_stat(index):
+                self._convert(index)
+        if self._get_bank_size() > PATCH_BANK_COMPACT * self._get_bank_live_size():
+            self._build_bank(True)
+        return True
+    def _recover_bank(self):
+        # Restores the previous bank if a rebuild was interrupted before the new bank replaced it
+        try:
+            os.remove(self._bank + ".tmp")
+        except:
+            pass
+        try:
+            os.stat(self._bank + ".bak")
+        except:
+            return
+        try:
+            os.stat(self._bank)
+            os.remove(self._bank + ".bak")
+        except:
+            try:
+                os.rename(self._bank + ".bak", self._bank)
+                print("Recovered patch bank: {}".format(self._bank))
+            except:
+                print("Failed to recover patch bank: {}".format(self._bank))
+    def _get_bank_size(self):
+        try:
+            return os.stat(self._bank)[6]
+        except:
+            return 0
+    def _get_bank_live_size(self):
+        # Size of the bank once compacted, deltas are merged into a record of at most every parameter
+        size = len(self._bank_index)
+        for index in range(PATCH_BANK_SLOTS):
+            offset, count, flags, depth, mtime, size_json, name = self._get_bank_entry(index)
+            if count:
+                size = size + len(self._bank_record) + (len(self._bank_ids) if depth else count) * 6
+        return size
+    def build_bank(self):
+        # Writes a new bank from every JSON patch, dropping old records and deltas
+        if not self._bank:
             return False
+        if not self._bank_ids:
+            return self.load_bank()
+        self.flush()
+        return self._build_bank()
+    def _build_bank(self, compact=False):
+        # Writes a new bank next to the old one and renames it into place, compacting keeps the merged values of every slot
+        temp = self._bank + ".tmp"
+        index = bytearray(len(self._bank_index))
+        struct.pack_into(PATCH_BANK_HEADER, index, 0, PATCH_BANK_MAGIC, PATCH_BANK_VERSION, PATCH_BANK_SLOTS, 0)
+        try:
+            with open(temp, "wb") as file:
+                file.write(index)
+            for i in range(PATCH_BANK_SLOTS):
+                if compact:
+                    entry = self._get_bank_entry(i)
+                    count = self._read_bank_record(i, self._bank_ids, self._bank_values) if entry[1] else 0
+                    flags, mtime, size, name = entry[2], entry[4], entry[5], entry[6]
+                else:
+                    count = self._decode_json(i, self._bank_ids, self._bank_values) if i in self._items else 0
+                    mtime, size = self._get_stat(i)
+                    flags, name = 0, self.get_name(i).encode()[:16]
+                if not count:
+                    continue
+                offset = self._append_bank_record(temp, self._bank_ids, self._bank_values, count)
+                struct.pack_into(PATCH_BANK_ENTRY, index, self._bank_header_size + i * self._bank_entry_size, offset, count, flags, 0, mtime, size, name)
+            with open(temp, "r+b") as file:
+                file.write(index)
+            os.sync()
+            previous = False
+            try:
+                os.rename(self._bank, self._bank + ".bak")
+                previous = True
+            except:
+                pass
+            os.rename(temp, self._bank)
+            if previous:
+                os.remove(self._bank + ".bak")
+            os.sync()
+        except:
+            print("Failed to write patch bank: {}".format(self._bank))
+            self._recover_bank()
+            if not compact:
+                self._bank_ids = None
+            return False
+        self._bank_index[:] = index
+        print("{} patch bank: {}".format("Compacted" if compact else "Built", self._bank))
+        return True
+    def _decode_json(self, index, ids, values):
+        # Resolves a JSON patch into parameter ids and raw values, returns the value count
+        path = self.get_path(index)
+        data = read_json(path) if path else None
+        if not data or not "parameters" in data:
+            return 0
+        count = 0
         for name in data["parameters"]:
             parameter = self._parameters.get_parameter(name)
+            if not parameter or count >= len(ids):
+                continue
+            value = parameter.get_raw_value(data["parameters"][name])
+            if value is None:
+                continue
+            ids[count] = parameter.id
+            values[count] = value
+            count = count + 1
+        return count
+    def _convert(self, index):
+        count = self._decode_json(index, self._bank_ids, self._bank_values)
+        if not count:
+            return False
+        mtime, size = self._get_stat(index)
+        return self._write_bank_record(index, self._bank_ids, self._bank_values, count, mtime, size)
+    def _append_bank_record(self, path, ids, values, count, base=0, base_count=0):
+        struct.pack_into(PATCH_BANK_RECORD, self._bank_record, 0, base, base_count)
+        with open(path, "ab") as file:
+            file.seek(0, 2)
+            offset = file.tell()
+            file.write(self._bank_record)
+            file.write(memoryview(ids)[:count])
+            file.write(memoryview(values)[:count])
+        os.sync()
+        return offset
+    def _write_bank_record(self, index, ids, values, count, mtime=0, size=0, flags=0, delta=False):
+        # Records are appended and the slot only points at the new record once it is on flash, load_bank compacts the file
+        entry = self._get_bank_entry(index)
+        depth = entry[3] + 1 if delta else 0
+        try:
+            if delta:
+                offset = self._append_bank_record(self._bank, ids, values, count, entry[0], entry[1])
+            else:
+                offset = self._append_bank_record(self._bank, ids, values, count)
+        except:
+            print("Failed to write patch bank: {}".format(self._bank))
+            return False
+        self._set_bank_entry(index, offset, count, mtime, size, self.get_name(index), flags, depth)
+        return self._write_bank_entry(index)
+    def _read_record(self, file, offset, count, ids, values):
+        length = min(count, len(ids))
+        file.seek(offset + len(self._bank_record))
+        file.readinto(memoryview(ids)[:length])
+        file.seek(offset + len(self._bank_record) + count * 2)
+        file.readinto(memoryview(values)[:length])
+        return length
+    def _read_bank_record(self, index, ids, values):
+        # Reads the ids and raw values of a slot into preallocated arrays, deltas are merged over the full record they are based on
+        offset, count, flags, depth, mtime, size, name = self._get_bank_entry(index)
+        try:
+            with open(self._bank, "rb") as file:
+                for i in range(depth, 0, -1):
+                    self._chain_offsets[i] = offset
+                    self._chain_counts[i] = count
+                    file.seek(offset)
+                    file.readinto(self._bank_record)
+                    offset, count = struct.unpack_from(PATCH_BANK_RECORD, self._bank_record, 0)
+                total = self._read_record(file, offset, count, ids, values)
+                for i in range(1, depth + 1):
+                    length = self._read_record(file, self._chain_offsets[i], self._chain_counts[i], self._delta_ids, self._delta_values)
+                    for j in range(length):
+                        k = 0
+                        while k < total and ids[k] != self._delta_ids[j]:
+                            k = k + 1
+                        if k >= len(ids):
+                            continue
+                        if k == total:
+                            ids[k] = self._delta_ids[j]
+                            total = total + 1
+                        values[k] = self._delta_values[j]
+        except:
+            print("Failed to read patch bank: {}".format(self._bank))
+            return 0
+        return total
+    def _apply(self, ids, values, offset, count):
+        self._parameters.begin()
+        for i in range(offset, offset + count):
+            parameter = self._parameters.get_parameter_by_id(ids[i])
+            if parameter:
+                parameter.set(values[i])
+        self._parameters.commit()
+    def get_bank_data(self, index):
+        # Bank slot in the JSON patch format
+        if not self.has_bank(index):
+            return None
+        count = self._read_bank_record(index, self._bank_ids, self._bank_values)
+        if not count:
+            return None
+        data = {
+            "index": index,
+            "name": self._get_bank_entry(index)[6].rstrip(b"\x00").decode(),
+            "parameters": {},
+        }
+        for i in range(count):
+            parameter = self._parameters.get_parameter_by_id(self._bank_ids[i])
             if parameter:
-                parameter.set(data["parameters"][name])
+                data["parameters"][parameter.name] = parameter.get_patch_value(self._bank_values[i])
+        return data
+    def export_json(self, index, path=None):
+        # Without a path the slot replaces its JSON patch and the slot is marked as up to date
+        data = self.get_bank_data(index)
+        if not data:
+            return False
+        if path:
+            return save_json(path, data)
+        filename = "{:02d}-{}.json".format(index, data["name"])
+        if not self._write_json(filename, data, self.get_filename(index)):
+            return False
+        self._items[index] = filename
+        offset, count, flags, depth, mtime, size, name = self._get_bank_entry(index)
+        mtime, size = self._get_stat(index)
+        self._set_bank_entry(index, offset, count, mtime, size, data["name"], flags & ~PATCH_BANK_DIRTY, depth)
+        return self._write_bank_entry(index)
+    def _is_dirty(self, index):
+        # Saved as a delta, a JSON patch which was changed since (ie: over USB) is kept and converted by load_bank instead
+        if not self.has_bank(index):
+            return False
+        entry = self._get_bank_entry(index)
+        return bool(entry[2] & PATCH_BANK_DIRTY) and (entry[4], entry[5]) == self._get_stat(index)
+    def flush(self):
+        # Rewrites the JSON patch of every slot which was saved as a delta
+        count = 0
+        for index in range(PATCH_BANK_SLOTS):
+            if self._is_dirty(index) and self.export_json(index):
+                count = count + 1
+        self._dirty = False
+        return count
+    def _flush_next(self):
+        # Rewrites the JSON patch of one slot, returns whether any are left
+        flushed = False
+        for index in range(PATCH_BANK_SLOTS):
+            if self._is_dirty(index):
+                if flushed:
+                    return True
+                if not self.export_json(index):
+                    return False
+                flushed = True
+        return False
+
+    def _get_cache_slot(self, index):
+        for slot in range(self._cache_size):
+            if self._cache_indexes[slot] == index:
+                return slot
+        return -1
+    def _load_cache(self, index):
+        # Decodes a patch into the least recently used slot, returns the slot or -1 if it could not be read
+        slot = self._get_cache_slot(index)
+        if slot >= 0:
+            return slot
+        if not self.get_path(index):
+            return -1
+        if self._cache_stride != self._parameters.get_parameter_count():
+            # Slots are sized to the registered parameters, patches read during registration reallocate the cache
+            self._cache_stride = self._parameters.get_parameter_count()
+            self._cache_ids = array.array("H", [0 for i in range(self._cache_stride * self._cache_size)])
+            self._cache_values = array.array("f", [0.0 for i in range(self._cache_stride * self._cache_size)])
+            for i in range(self._cache_size):
+                self._cache_indexes[i] = -1
+                self._cache_ticks[i] = 0
+        slot = 0
+        for i in range(1, self._cache_size):
+            if self._cache_ticks[i] < self._cache_ticks[slot]:
+                slot = i
+        offset = slot * self._cache_stride
+        ids = memoryview(self._cache_ids)[offset:offset + self._cache_stride]
+        values = memoryview(self._cache_values)[offset:offset + self._cache_stride]
+        if self.has_bank(index):
+            count = self._read_bank_record(index, ids, values)
+        else:
+            count = self._decode_json(index, ids, values)
+        if not count:
+            self._cache_indexes[slot] = -1
+            self._cache_ticks[slot] = 0
+            return -1
+        self._cache_indexes[slot] = index
+        self._cache_counts[slot] = count
+        self._cache_tick = self._cache_tick + 1
+        self._cache_ticks[slot] = self._cache_tick
+        return slot
+    def _invalidate_cache(self, index):
+        slot = self._get_cache_slot(index)
+        if slot >= 0:
+            self._cache_indexes[slot] = -1
+            self._cache_ticks[slot] = 0
+    def _get_neighbor(self, index, direction):
+        for i in range(1, PATCH_BANK_SLOTS):
+            neighbor = (index + i * direction) % PATCH_BANK_SLOTS
+            if neighbor in self._items:
+                return neighbor
+        return -1
+    def _prefetch_next(self):
+        # Decodes one missing neighbor of the current or pending patch, returns False once there is nothing left to do
+        index = self._pending if self._pending >= 0 else self._current
+        if index < 0:
+            return False
+        # The selected patch comes first, then as many neighbors as fit without evicting each other
+        for i in range(min(self._cache_size, 3)):
+            neighbor = index
+            if i == 1:
+                neighbor = self._get_neighbor(index, 1)
+            elif i == 2:
+                neighbor = self._get_neighbor(index, -1)
+            if neighbor >= 0 and self._get_cache_slot(neighbor) < 0 and self.get_path(neighbor):
+                start = time.monotonic_ns()
+                slot = self._load_cache(neighbor)
+                self._prefetch_stall = max(self._prefetch_stall, (time.monotonic_ns() - start) // 1000)
+                self._prefetches = self._prefetches + 1
+                return slot >= 0
+        return False
+
+    def remove(self, index):
+        path = self.get_path(index)
+        if not path:
+            return False
+        self._invalidate_cache(index)
+        if self.has_bank(index):
+            self._set_bank_entry(index)
+            self._write_bank_entry(index)
+        self._remove_data(index)
+        try:
+            os.remove(path)
+            del self._items[index]
+            return True
+        except:
+            return False
+    def read(self, index):
+        start = time.monotonic_ns()
+        if self._cache_size:
+            slot = self._get_cache_slot(index)
+            if slot >= 0:
+                self._cache_hits = self._cache_hits + 1
+            else:
+                self._cache_misses = self._cache_misses + 1
+                slot = self._load_cache(index)
+                if slot < 0:
+                    return False
+            self._cache_tick = self._cache_tick + 1
+            self._cache_ticks[slot] = self._cache_tick
+            self._apply(self._cache_ids, self._cache_values, slot * self._cache_stride, self._cache_counts[slot])
+        elif self.has_bank(index):
+            self._cache_misses = self._cache_misses + 1
+            count = self._read_bank_record(index, self._bank_ids, self._bank_values)
+            if not count:
+                return False
+            self._apply(self._bank_ids, self._bank_values, 0, count)
+        else:
+            path = self.get_path(index)
+            if not path:
+                return False
+            self._cache_misses = self._cache_misses + 1
+            data = read_json(path)
+            if not data or not "parameters" in data:
+                print("Invalid Data")
+                return False
+            self._parameters.apply(data["parameters"])
+        self._read_data(index)
+        self._current = index
+        self._prefetch = self._cache_size > 0
+        self._idle = False
+        self._snapshot()
+        self._stall = max(self._stall, (time.monotonic_ns() - start) // 1000)
+        return True
+    def select(self, index):
+        # Set callback of the patch parameter, applies the patch immediately or once the selection settles
+        if self._debounce <= 0.0:
+            return self.read(index)
+        self._pending = index
+        self._pending_time = time.monotonic()
+        self._prefetch = self._cache_size > 0
+        self._idle = False
         return True
+    def commit(self):
+        # Applies a pending selection without waiting for the debounce time
+        if self._pending < 0:
+            return False
+        index = self._pending
+        self._pending = -1
+        return self.read(index)
+    def update(self, now=None):
+        if self._pending >= 0:
+            if not now:
+                now = time.monotonic()
+            if now - self._pending_time >= self._debounce:
+                self.commit()
+                return
+        if not self._idle:
+            self._idle = True # Prefetching waits a loop iteration so that it does not add to the cost of a selection
+        elif self._prefetch:
+            self._prefetch = self._prefetch_next()
+        elif self._dirty:
+            if not now:
+                now = time.monotonic()
+            if now - self._dirty_time >= PATCH_FLUSH_DELAY:
+                self._dirty = self._flush_next()
+
+    def get_cache_stats(self):
+        count = self._cache_hits + self._cache_misses
+        return {
+            "entries": len([index for index in self._cache_indexes if index >= 0]),
+            "size": self._cache_size,
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "hit_rate": self._cache_hits / count if count else 0.0,
+            "prefetches": self._prefetches,
+            "stall": self._stall,
+            "prefetch_stall": self._prefetch_stall,
+        }
+    def report_cache(self):
+        stats = self.get_cache_stats()
+        print("Patch Cache: {:d}/{:d} entries, {:d} hits, {:d} misses, {:.1f}% hit rate, {:d} prefetches, {:d}us max load, {:d}us max prefetch".format(stats["entries"], stats["size"], stats["hits"], stats["misses"], stats["hit_rate"] * 100, stats["prefetches"], stats["stall"], stats["prefetch_stall"]))
+        print("Patch Saves: {:d} full, {:d} delta, {:d} unchanged, {:d}us max save".format(self._saves, self._delta_saves, self._skipped_saves, self._save_stall))
+
+    def _snapshot(self):
+        count = self._parameters.get_parameter_count()
+        if self._saved is None or len(self._saved) != count:
+            self._saved = array.array("f", [0.0 for i in range(count)])
+        i = 0
+        for parameter in self._parameters.get_parameters():
+            self._saved[i] = parameter.raw_value
+            i = i + 1
+    def _get_values(self, ids=None, values=None, changes=False):
+        # Raw values of every patch parameter, or only of those changed since the last read or save
+        count = 0
+        i = 0
+        for parameter in self._parameters.get_parameters():
+            value = parameter.raw_value
+            if parameter.patch and (not changes or value != self._saved[i]):
+                if not ids is None:
+                    ids[count] = parameter.id
+                    values[count] = value
+                count = count + 1
+            i = i + 1
+        return count
     def save(self, index=0, name="Patch"):
+        start = time.monotonic_ns()
         index = index % 100
         name = name.strip()
+        filename = "{:02d}-{}.json".format(index, name)
+        if index == self._current and filename == self.get_filename(index) and self._saved and len(self._saved) == self._parameters.get_parameter_count():
+            written = self._write_data(index, True)
+            count = self._get_values(self._delta_ids, self._delta_values, True) if self.has_bank() else self._get_values(changes=True)
+            if not count:
+                if not written:
+                    self._skipped_saves = self._skipped_saves + 1
+                return True
+            entry = self._get_bank_entry(index) if self.has_bank(index) else None
+            if entry and entry[3] < PATCH_BANK_DEPTH and self._write_bank_record(index, self._delta_ids, self._delta_values, count, entry[4], entry[5], PATCH_BANK_DIRTY, True):
+                # Only the changed parameters are written, the JSON patch is rewritten by update once saving has settled
+                self._dirty = True
+                self._dirty_time = time.monotonic()
+                self._invalidate_cache(index)
+                self._snapshot()
+                self._delta_saves = self._delta_saves + 1
+                self._save_stall = max(self._save_stall, (time.monotonic_ns() - start) // 1000)
+                return True
+
         data = {
             "index": 0,
             "name": name,
@@ -75,20 +719,44 @@ class Patches:
         }
         for parameter in self._parameters.get_parameters():
             if parameter.patch:
-                data["parameters"][parameter.name] = parameter.get_formatted_value(True)
-        self.remove(index)
-        filename = "{:02d}-{}.json".format(index, name)
-        path = self._dir + "/" + filename
-        if not save_json(path, data):
+                data["parameters"][parameter.name] = parameter.get_patch_value()
+        if not self._write_json(filename, data, self.get_filename(index)):
             return False
+        self._write_data(index, index == self._current)
         self._items[index] = filename
+        self._invalidate_cache(index)
+        if self.has_bank():
+            count = self._get_values(self._bank_ids, self._bank_values)
+            mtime, size = self._get_stat(index)
+            self._write_bank_record(index, self._bank_ids, self._bank_values, count, mtime, size)
+        self._current = index
+        self._snapshot()
+        self._saves = self._saves + 1
+        self._save_stall = max(self._save_stall, (time.monotonic_ns() - start) // 1000)
         parameter = self._parameters.get_parameter("patch")
-        parameter.range = self.get_list()
+        parameter.set_range(self.get_list())
         parameter.set(index)
         return True
     def read_first(self):
         return self.read(0)
 
     def deinit(self):
+        if self._dirty:
+            self.flush()
         del self._parameters
         del self._items
+        del self._bank_index
+        del self._bank_ids
+        del self._bank_values
+        del self._bank_record
+        del self._delta_ids
+        del self._delta_values
+        del self._chain_offsets
+        del self._chain_counts
+        del self._saved
+        del self._cache_indexes
+        del self._cache_ticks
+        del self._cache_counts
+        del self._cache_ids
+        del self._cache_values
+        del self._data
@@ -0,0 +1,140 @@
+class ProfilerChannel:
+    def __init__(self, name, size=128, bins=12):
+        self.name = name
+        self._samples = array.array("L", [0 for i in range(size)])
+        self._histogram = array.array("L", [0 for i in range(bins)])
+        self.reset()
+
+    def reset(self):
+        self._index = 0
+        self._count = 0
+        self._total = 0
+        self._min = 0xFFFFFFFF
+        self._max = 0
+        for i in range(len(self._histogram)):
+            self._histogram[i] = 0
+
+    def append(self, value):
+        value = min(max(value, 0), 0xFFFFFFFF)
+        self._samples[self._index] = value
+        self._index = (self._index + 1) % len(self._samples)
+        self._count = self._count + 1
+        self._total = self._total + value
+        if value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+        # Histogram bins double in width starting at 64us
+        i = 0
+        value = value >> 6
+        while value and i < len(self._histogram) - 1:
+            value = value >> 1
+            i = i + 1
+        self._histogram[i] = self._histogram[i] + 1
+
+    def get_count(self):
+        return self._count
+    def get_samples(self):
+        if self._count < len(self._samples):
+            return self._samples[:self._count]
+        return self._samples
+    def get_mean(self):
+        if not self._count:
+            return 0
+        return self._total // self._count
+    def get_min(self):
+        return self._min if self._count else 0
+    def get_max(self):
+        return self._max
+    def get_percentile(self, value=0.99):
+        samples = sorted(self.get_samples())
+        if not samples:
+            return 0
+        return samples[min(int(len(samples) * value), len(samples) - 1)]
+    def get_jitter(self):
+        samples = self.get_samples()
+        if not samples:
+            return 0
+        mean = sum(samples) / len(samples)
+        return int(math.sqrt(sum([(sample - mean) ** 2 for sample in samples]) / len(samples)))
+    def get_histogram(self):
+        return self._histogram
+
+class Profiler:
+    def __init__(self, names=(), size=128, enabled=False, report=0.0):
+        self._enabled = enabled
+        self._report = report
+        self._channels = [ProfilerChannel("loop", size)] + [ProfilerChannel(name, size) for name in names]
+        self._loop = 0
+        self._mark = 0
+        self._now = 0.0
+        self._serial = None
+        self._reports = []
+        if self._enabled:
+            try:
+                import supervisor
+                self._serial = supervisor.runtime
+            except ImportError:
+                pass
+
+    def is_enabled(self):
+        return self._enabled
+    def get_channels(self):
+        return self._channels
+
+    def add_report(self, callback):
+        self._reports.append(callback)
+
+    def loop(self):
+        if not self._enabled:
+            return
+        now = time.monotonic_ns()
+        if self._loop:
+            self._channels[0].append((now - self._loop) // 1000)
+        self._loop = now
+        self._mark = now
+    def mark(self, index):
+        if not self._enabled:
+            return
+        now = time.monotonic_ns()
+        self._channels[index + 1].append((now - self._mark) // 1000)
+        self._mark = now
+
+    def reset(self):
+        for channel in self._channels:
+            channel.reset()
+        self._loop = 0
+
+    def report(self):
+        print("\n:: Profile (us) ::")
+        print("{:<12}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}".format("", "count", "mean", "min", "max", "p99", "jitter"))
+        for channel in self._channels:
+            print("{:<12}{:>8d}{:>8d}{:>8d}{:>8d}{:>8d}{:>8d}".format(truncate_str(channel.name, 11), channel.get_count(), channel.get_mean(), channel.get_min(), channel.get_max(), channel.get_percentile(), channel.get_jitter()))
+        print("Histogram from <64us, doubling per bin:")
+        for channel in self._channels:
+            print("{:<12}{}".format(truncate_str(channel.name, 11), " ".join([str(count) for count in channel.get_histogram()])))
+        for callback in self._reports:
+            callback()
+
+    def update(self, now=None):
+        if not self._enabled:
+            return
+        # Serial commands: "p" prints a report, "r" resets all channels
+        if self._serial and self._serial.serial_bytes_available:
+            command = sys.stdin.read(1)
+            if command == "p":
+                self.report()
+            elif command == "r":
+                self.reset()
+        if self._report > 0.0:
+            if not now:
+                now = time.monotonic()
+            if now >= self._now + self._report:
+                if self._now:
+                    self.report()
+                self._now = now
+
+    def deinit(self):
+        del self._channels
+        del self._serial
+        del self._reports
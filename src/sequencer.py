@@ -0,0 +1,95 @@
+SEQUENCER_STEPS = 64
+
+# Each field of every step is one byte in a single buffer: notes, velocities, gates then flags
+SEQUENCER_NOTES = 0
+SEQUENCER_VELOCITIES = SEQUENCER_STEPS
+SEQUENCER_GATES = SEQUENCER_STEPS * 2
+SEQUENCER_FLAGS = SEQUENCER_STEPS * 3
+SEQUENCER_SIZE = SEQUENCER_STEPS * 4
+
+SEQUENCER_TIE = 1 # The note is held into the next step
+SEQUENCER_REST = 2
+
+class Sequencer:
+    def __init__(self, length=16, root=60):
+        self._data = bytearray(SEQUENCER_SIZE)
+        self._length = length
+        self._root = root
+        self._recording = False
+        self._record_pos = 0
+        self.clear()
+
+    def get_data(self):
+        return self._data
+    def clear(self):
+        # Every step plays the root note
+        for i in range(SEQUENCER_STEPS):
+            self._data[SEQUENCER_NOTES + i] = self._root
+            self._data[SEQUENCER_VELOCITIES + i] = 100
+            self._data[SEQUENCER_GATES + i] = 50
+            self._data[SEQUENCER_FLAGS + i] = 0
+    def load(self, size):
+        # Called once a patch has read its steps into the buffer
+        if size != SEQUENCER_SIZE:
+            self.clear()
+            return
+        for i in range(SEQUENCER_STEPS):
+            self._data[SEQUENCER_NOTES + i] = self._data[SEQUENCER_NOTES + i] & 0x7F
+            self._data[SEQUENCER_VELOCITIES + i] = min(self._data[SEQUENCER_VELOCITIES + i], 127)
+            self._data[SEQUENCER_GATES + i] = min(max(self._data[SEQUENCER_GATES + i], 1), 100)
+
+    def get_length(self):
+        return self._length
+    def set_length(self, value):
+        self._length = min(max(int(value), 1), SEQUENCER_STEPS)
+    def get_root(self):
+        return self._root
+    def set_root(self, value):
+        self._root = min(max(int(value), 0), 127)
+
+    def get_note(self, index):
+        return self._data[SEQUENCER_NOTES + index]
+    def get_velocity(self, index):
+        return self._data[SEQUENCER_VELOCITIES + index] / 127
+    def get_gate(self, index):
+        return self._data[SEQUENCER_GATES + index] / 100
+    def is_tie(self, index):
+        return bool(self._data[SEQUENCER_FLAGS + index] & SEQUENCER_TIE)
+    def is_rest(self, index):
+        return bool(self._data[SEQUENCER_FLAGS + index] & SEQUENCER_REST)
+    def set_step(self, index, note=None, velocity=None, gate=None, tie=None, rest=None):
+        index = index % SEQUENCER_STEPS
+        if not note is None:
+            self._data[SEQUENCER_NOTES + index] = min(max(int(note), 0), 127)
+        if not velocity is None:
+            self._data[SEQUENCER_VELOCITIES + index] = min(max(round(velocity * 127), 0), 127)
+        if not gate is None:
+            self._data[SEQUENCER_GATES + index] = min(max(round(gate * 100), 1), 100)
+        flags = self._data[SEQUENCER_FLAGS + index]
+        if not tie is None:
+            flags = flags | SEQUENCER_TIE if tie else flags & ~SEQUENCER_TIE
+        if not rest is None:
+            flags = flags | SEQUENCER_REST if rest else flags & ~SEQUENCER_REST
+        self._data[SEQUENCER_FLAGS + index] = flags
+
+    def is_recording(self):
+        return self._recording
+    def set_recording(self, value):
+        self._recording = bool(value)
+        self._record_pos = 0
+    def record(self, notenum, velocity, legato=False):
+        # Writes the next step, a note played while another is held ties the previous step into it
+        if not self._recording:
+            return
+        if legato:
+            self.set_step((self._record_pos - 1) % self._length, tie=True)
+        self.set_step(self._record_pos, notenum, velocity, tie=False, rest=False)
+        self._record_pos = (self._record_pos + 1) % self._length
+    def record_rest(self):
+        if not self._recording:
+            return
+        self.set_step(self._record_pos, tie=False, rest=True)
+        self._record_pos = (self._record_pos + 1) % self._length
+
+    def deinit(self):
+        del self._data
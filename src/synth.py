@@ -1,5 +1,5 @@
 class Synth:
-    def __init__(self, audio):
+    def __init__(self, audio, filter_cache=128, filter_step=25.0):
         self._synth = synthio.Synthesizer(
             sample_rate=audio.get_sample_rate(),
             channel_count=2
@@ -8,15 +8,119 @@ class Synth:
 
         self._filter_types = ["lpf", "hpf", "bpf"]
 
+        # Filters are cached by type, cutoff quantized to filter_step cents and resonance quantized to 1/8 octave
+        self._filter_cache = {} # Slot of each key
+        self._filter_cache_size = max(filter_cache, 0)
+        self._filter_scale = 1200.0 / math.log(2) / max(filter_step, 0.1)
+        self._resonance_scale = 8.0 / math.log(2)
+        self._filter_hits = 0
+        self._filter_misses = 0
+
+        # Full caches reuse slots with a clock hand, a slot used since the hand last passed it is given a second chance
+        self._filter_keys = array.array("l", [0 for i in range(self._filter_cache_size)])
+        self._filter_items = [None for i in range(self._filter_cache_size)]
+        self._filter_used = bytearray(self._filter_cache_size)
+        self._filter_count = 0
+        self._filter_hand = 0
+
+        # Size of a single filter, the cache footprint is reported from it
+        self._filter_memory = 0
+        if self._filter_cache_size > 0:
+            gc.collect()
+            free = gc.mem_free()
+            filter = self._build_filter("lpf", 1000.0, 0.707)
+            self._filter_memory = max(free - gc.mem_free(), 0)
+            del filter
+
     def get_filter_types(self):
         return self._filter_types
-    def build_filter(self, type, frequency, resonance):
+    def _build_filter(self, type, frequency, resonance):
         if type == "lpf":
             return self._synth.low_pass_filter(frequency, resonance)
         elif type == "hpf":
             return self._synth.high_pass_filter(frequency, resonance)
         else: # "bpf"
             return self._synth.band_pass_filter(frequency, resonance)
+    def has_block_filter(self):
+        return hasattr(synthio, "BlockBiquad")
+    def build_block_filter(self, type, frequency, resonance):
+        # Cutoff and resonance may be blocks which synthio evaluates at block rate (CircuitPython 9.2+)
+        if not self.has_block_filter():
+            return None
+        if type == "lpf":
+            mode = synthio.FilterMode.LOW_PASS
+        elif type == "hpf":
+            mode = synthio.FilterMode.HIGH_PASS
+        else: # "bpf"
+            mode = synthio.FilterMode.BAND_PASS
+        return synthio.BlockBiquad(mode, frequency, resonance)
+    def _get_filter_key(self, type, frequency_step, resonance_step):
+        type = self._filter_types.index(type) if type in self._filter_types else 2
+        return (((type << 16) + frequency_step) << 8) + resonance_step + 128
+    def build_filter(self, type, frequency, resonance):
+        frequency_step = round(math.log(max(frequency, 1.0)) * self._filter_scale)
+        resonance_step = min(max(round(math.log(max(resonance, 0.01)) * self._resonance_scale), -128), 127)
+        key = self._get_filter_key(type, frequency_step, resonance_step)
+
+        slot = self._filter_cache.get(key)
+        if not slot is None:
+            self._filter_hits = self._filter_hits + 1
+            self._filter_used[slot] = 1
+            return self._filter_items[slot]
+
+        self._filter_misses = self._filter_misses + 1
+        filter = self._build_filter(type, math.exp(frequency_step / self._filter_scale), math.exp(resonance_step / self._resonance_scale))
+        if self._filter_cache_size > 0:
+            slot = self._claim_filter_slot()
+            self._filter_keys[slot] = key
+            self._filter_items[slot] = filter
+            self._filter_used[slot] = 1
+            self._filter_cache[key] = slot
+        return filter
+    def _claim_filter_slot(self):
+        if self._filter_count < self._filter_cache_size:
+            self._filter_count = self._filter_count + 1
+            return self._filter_count - 1
+        while self._filter_used[self._filter_hand]:
+            self._filter_used[self._filter_hand] = 0
+            self._filter_hand = (self._filter_hand + 1) % self._filter_cache_size
+        slot = self._filter_hand
+        self._filter_hand = (self._filter_hand + 1) % self._filter_cache_size
+        del self._filter_cache[self._filter_keys[slot]]
+        return slot
+    def prewarm_filters(self, type, min_frequency, max_frequency, resonance):
+        if self._filter_cache_size <= 0:
+            return 0
+        start = round(math.log(max(min_frequency, 1.0)) * self._filter_scale)
+        end = round(math.log(max(max_frequency, 1.0)) * self._filter_scale)
+        count = 0
+        for step in range(start, min(end, start + self._filter_cache_size - 1) + 1):
+            self.build_filter(type, math.exp(step / self._filter_scale), resonance)
+            count = count + 1
+        self._filter_hits = 0
+        self._filter_misses = 0
+        return count
+    def clear_filters(self):
+        self._filter_cache = {}
+        for i in range(self._filter_cache_size):
+            self._filter_items[i] = None
+            self._filter_used[i] = 0
+        self._filter_count = 0
+        self._filter_hand = 0
+        gc.collect()
+    def get_filter_cache_stats(self):
+        requests = self._filter_hits + self._filter_misses
+        return {
+            "entries": len(self._filter_cache),
+            "size": self._filter_cache_size,
+            "hits": self._filter_hits,
+            "misses": self._filter_misses,
+            "hit_rate": self._filter_hits / requests if requests else 0.0,
+            "memory": self._filter_memory * len(self._filter_cache) + self._filter_cache_size * 9, # Word per key and per item, byte per used flag
+        }
+    def report_filter_cache(self):
+        stats = self.get_filter_cache_stats()
+        print("Filter Cache: {:d}/{:d} entries, {:d} hits, {:d} misses, {:.1f}% hit rate, ~{:d} bytes".format(stats["entries"], stats["size"], stats["hits"], stats["misses"], stats["hit_rate"] * 100, stats["memory"]))
 
     def append(self, block):
         self._synth.blocks.append(block)
@@ -24,9 +128,23 @@ class Synth:
         self._synth.press(note)
     def release(self, note):
         self._synth.release(note)
+    def get_note_level(self, note):
+        # Envelope level of a note, None while it is still attacking or when synthio is unable to report it
+        if not hasattr(self._synth, "note_info"):
+            return None
+        state, value = self._synth.note_info(note)
+        if state is None:
+            return 0.0
+        if state == synthio.EnvelopeState.ATTACK:
+            return None
+        return value
 
     def deinit(self):
         self._synth.release_all()
         self._synth.deinit()
         del self._synth
         del self._filter_types
+        del self._filter_cache
+        del self._filter_keys
+        del self._filter_items
+        del self._filter_used
@@ -69,8 +69,12 @@ class AREnvelope:
         self._lerp.deinit()
         del self._lerp
 
+VOICE_ENVELOPE = 0x01
+VOICE_FILTER = 0x02
+VOICE_TUNING = 0x04
+
 class Oscillator:
-    def __init__(self, synth, waveforms, root=440.0):
+    def __init__(self, synth, waveforms, root=440.0, shape_update=0.02):
         self._synth = synth
         self._waveforms = waveforms
 
@@ -81,6 +85,10 @@ class Oscillator:
 
         self.root = root
         self._log2 = math.log(2) # for octave conversion optimization
+        self._frequency = root
+        self._waveform = None
+        self._transaction = 0
+        self._dirty = 0
         self.frequency_lerp = LerpBlockInput(self._synth)
         self.vibrato = synthio.LFO(
             waveform=self._waveforms.get_data("sine"),
@@ -110,31 +118,132 @@ class Oscillator:
         self._synth.append(self.note.bend)
         self._synth.append(self.note.panning)
 
+        # Pulse width and morphing render into a dynamic waveform which is only allocated once it is first used
+        self.pulse_width = 0.5
+        self.pwm_depth = 0.0
+        self.morph = 0.0
+        self.morph_depth = 0.0
+        self._morph_waveform = None
+        self._square = False
+        self.shape_lfo = synthio.LFO(
+            waveform=self._waveforms.get_data("sine"),
+            rate=1.0,
+            scale=1.0,
+            offset=0.0
+        )
+        self._synth.append(self.shape_lfo)
+        self._dynamic = None
+        self._table_frequency = root
+        self._shape_modulated = False
+        self._shape_update = shape_update
+        self._shape_now = 0.0
+
     def set_frequency(self, value):
+        self._frequency = value
         self.frequency_lerp.set(math.log(value/self.root)/self._log2)
+        self._update_waveform()
     def set_glide(self, value):
         self.frequency_lerp.set_rate(value)
 
     def set_pitch_bend_amount(self, value):
         self.bend_amount = value
         self._update_pitch_bend()
+        self._update_waveform()
     def set_pitch_bend(self, value=None):
         self.bend = value
         self._update_pitch_bend()
     def _update_pitch_bend(self):
         self.pitch_bend_lerp.set(self.bend * self.bend_amount)
 
-    def set_coarse_tune(self, value):
+    def begin(self):
+        self._transaction = self._transaction + 1
+    def commit(self):
+        self._transaction = max(self._transaction - 1, 0)
+        if not self._transaction and self._dirty:
+            self._dirty = 0
+            self._update_root()
+
+    def set_coarse_tune(self, value, update=True):
         self.coarse_tune = value
-        self._update_root()
-    def set_fine_tune(self, value):
+        if update:
+            self._invalidate_root()
+    def set_fine_tune(self, value, update=True):
         self.fine_tune = value
-        self._update_root()
+        if update:
+            self._invalidate_root()
+    def _invalidate_root(self):
+        if self._transaction:
+            self._dirty = VOICE_TUNING
+        else:
+            self._update_root()
     def _update_root(self):
         self.note.frequency = self.root * pow(2,self.coarse_tune) * pow(2,self.fine_tune)
+        self._update_waveform()
 
     def set_waveform(self, value):
-        self.note.waveform = self._waveforms.get_data(value)
+        self._waveform = value
+        item = self._waveforms.get(value)
+        self._square = not item is None and item.name == "square"
+        self._update_waveform()
+    def _update_waveform(self):
+        # Band-limited waveforms use the table for the highest pitch the note can reach with tuning and pitch bend
+        if self._waveform is None:
+            return
+        self._table_frequency = self._frequency * self.note.frequency / self.root * pow(2, max(self.bend_amount, 0.0))
+        pulse = self._is_pulse()
+        morph = not self._morph_waveform is None and (self.morph > 0.0 or self.morph_depth)
+        self._shape_modulated = (pulse and self.pwm_depth) or (morph and self.morph_depth)
+        if pulse or morph:
+            if not self._dynamic:
+                self._dynamic = DynamicWaveform(self._waveforms.get_samples(), self._waveforms.get_amplitude())
+            self._render_waveform()
+            waveform = self._dynamic.data
+        else:
+            waveform = self._waveforms.get_data(self._waveform, self._table_frequency)
+        if not waveform is self.note.waveform:
+            self.note.waveform = waveform
+    def _is_pulse(self):
+        return self._square and (self.pulse_width != 0.5 or self.pwm_depth)
+    def _render_waveform(self):
+        lfo = self.shape_lfo.value
+        if self._is_pulse():
+            # Pulses are built from the band-limited saw, the width is quantized to whole samples
+            samples = self._waveforms.get_samples()
+            table = self._waveforms.get_data("saw", self._table_frequency)
+            width = min(max(round((self.pulse_width + lfo * self.pwm_depth) * samples), 1), samples - 1)
+        else:
+            table = self._waveforms.get_data(self._waveform, self._table_frequency)
+            width = 0
+        morph = min(max(round((self.morph + lfo * self.morph_depth) * 64), 0), 64) / 64
+        morph_table = None
+        if morph > 0.0 and not self._morph_waveform is None:
+            morph_table = self._waveforms.get_data(self._morph_waveform, self._table_frequency)
+        self._dynamic.render(table, width, morph_table, morph)
+
+    def set_pulse_width(self, value):
+        self.pulse_width = value
+        self._update_waveform()
+    def set_pwm_depth(self, value):
+        self.pwm_depth = value
+        self._update_waveform()
+    def set_morph_waveform(self, value):
+        self._morph_waveform = value
+        self._update_waveform()
+    def set_morph(self, value):
+        self.morph = value
+        self._update_waveform()
+    def set_morph_depth(self, value):
+        self.morph_depth = value
+        self._update_waveform()
+    def set_shape_rate(self, value):
+        self.shape_lfo.rate = value
+
+    def update(self, now):
+        # The shape lfo is polled at a control rate, the table is only rewritten when the quantized result changes
+        if not self._shape_modulated or now < self._shape_now + self._shape_update:
+            return
+        self._shape_now = now
+        self._render_waveform()
 
     def press(self):
         self._synth.press(self.note)
@@ -165,6 +274,10 @@ class Oscillator:
 
     def deinit(self):
         del self.note
+        if self._dynamic:
+            self._dynamic.deinit()
+        del self._dynamic
+        del self.shape_lfo
         self.pitch_bend_lerp.deinit()
         del self.pitch_bend_lerp
         del self.vibrato
@@ -174,7 +287,7 @@ class Oscillator:
         del self._synth
 
 class Voice:
-    def __init__(self, synth, waveforms, min_filter_frequency=60.0, max_filter_frequency=20000.0):
+    def __init__(self, synth, waveforms, min_filter_frequency=60.0, max_filter_frequency=20000.0, filter_update=0.01, filter_step=25.0, filter_threshold=50.0, native_filter=False, shape_update=0.02):
         self._synth = synth
         self._waveforms = waveforms
 
@@ -203,9 +316,55 @@ class Voice:
 
         self._min_filter_frequency = min_filter_frequency
         self._max_filter_frequency = max_filter_frequency
-        self._filter_buffer = ("", 0.0, 0.0)
+        self._filter_buffer = ("", 0, 0.0)
+
+        # Filter modulation is evaluated at a fixed control rate and the cutoff is quantized to a grid of cents
+        self._filter_update = filter_update
+        self._filter_now = 0.0
+        self._filter_step = max(filter_step, 0.1)
+        self._filter_threshold = max(filter_threshold, self._filter_step) / self._filter_step
+        self._cents_scale = 1200.0 / math.log(2) / self._filter_step
 
-        self.oscillators = (Oscillator(self._synth, waveforms), Oscillator(self._synth, waveforms))
+        # Native mode sums cutoff, envelope and lfo with synthio blocks so no polling is required
+        self._native_filter = native_filter and self._synth.has_block_filter()
+        self._filter = None
+        if native_filter and not self._native_filter:
+            print("Native filter modulation not supported, using control rate updates")
+        if self._native_filter:
+            self._filter_frequency_sum = synthio.Math(synthio.MathOperation.SUM, self.filter_frequency, self.filter_envelope.get(), self.filter_lfo)
+            self._synth.append(self._filter_frequency_sum)
+            self._filter_frequency_block = synthio.Math(synthio.MathOperation.MID, self._filter_frequency_sum, self._min_filter_frequency, self._max_filter_frequency)
+            self._synth.append(self._filter_frequency_block)
+
+        self.oscillators = (Oscillator(self._synth, waveforms, shape_update=shape_update), Oscillator(self._synth, waveforms, shape_update=shape_update))
+
+        # Changes made within a transaction are applied once when it is committed
+        self._transaction = 0
+        self._dirty = 0
+
+    def begin(self):
+        self._transaction = self._transaction + 1
+        for oscillator in self.oscillators:
+            oscillator.begin()
+    def commit(self):
+        self._transaction = max(self._transaction - 1, 0)
+        for oscillator in self.oscillators:
+            oscillator.commit()
+        if self._transaction or not self._dirty:
+            return
+        dirty = self._dirty
+        self._dirty = 0
+        if dirty & VOICE_ENVELOPE:
+            self._update_envelope()
+        if dirty & VOICE_FILTER:
+            self._update_filter()
+    def _invalidate(self, flag):
+        if self._transaction:
+            self._dirty = self._dirty | flag
+        elif flag == VOICE_ENVELOPE:
+            self._update_envelope()
+        elif flag == VOICE_FILTER:
+            self._update_filter()
 
     def press(self, note, velocity):
         self.velocity = velocity
@@ -259,18 +418,45 @@ class Voice:
             for oscillator in self.oscillators:
                 oscillator.set_waveform(value)
 
-    def _update_filter(self):
+    def _update_native_filter(self):
+        type = self.get_filter_type()
+        resonance = self.get_filter_resonance()
+        self._filter_frequency_sum.a = self.get_filter_frequency()
+        if self._filter and self._filter_buffer[0] == type:
+            if self._filter_buffer[2] != resonance:
+                self._filter.Q = resonance
+        else:
+            self._filter = self._synth.build_block_filter(type, self._filter_frequency_block, resonance)
+            for oscillator in self.oscillators:
+                oscillator.set_filter(self._filter)
+        self._filter_buffer = (type, 0, resonance)
+    def _update_filter(self, force=True):
+        if self._native_filter:
+            return self._update_native_filter()
         type = self.get_filter_type()
         frequency = min(max(self.get_filter_frequency() + self.filter_envelope.get_value() + self.filter_lfo.value, self._min_filter_frequency), self._max_filter_frequency)
         resonance = self.get_filter_resonance()
 
-        if self._filter_buffer[0] == type and self._filter_buffer[1] == frequency and self._filter_buffer[2] == resonance:
-            return
-        self._filter_buffer = (type, frequency, resonance)
+        step = round(math.log(frequency) * self._cents_scale)
+        if self._filter_buffer[0] == type and self._filter_buffer[2] == resonance:
+            if step == self._filter_buffer[1] or (not force and abs(step - self._filter_buffer[1]) < self._filter_threshold):
+                return
+        self._filter_buffer = (type, step, resonance)
 
-        filter = self._synth.build_filter(type, frequency, resonance)
+        filter = self._synth.build_filter(type, math.exp(step / self._cents_scale), resonance)
         for oscillator in self.oscillators:
             oscillator.set_filter(filter)
+    def prewarm_filter(self):
+        # Build the filters that the current envelope and lfo settings are able to reach
+        if self._native_filter:
+            return 0
+        depth = abs(self.get_filter_lfo_depth())
+        return self._synth.prewarm_filters(
+            self.get_filter_type(),
+            min(max(self.get_filter_frequency() - depth, self._min_filter_frequency), self._max_filter_frequency),
+            min(max(self.get_filter_frequency() + self.get_filter_amount() + depth, self._min_filter_frequency), self._max_filter_frequency),
+            self.get_filter_resonance()
+        )
     def get_filter_type(self):
         if type(self.filter_type) is int:
             return self._synth.get_filter_types()[self.filter_type]
@@ -282,17 +468,17 @@ class Voice:
         self.filter_type = value
         if update and self.filter_type != self._filter_type:
             self._filter_type = self.filter_type
-            self._update_filter()
+            self._invalidate(VOICE_FILTER)
     def set_filter_frequency(self, value, update=True):
         self.filter_frequency = value
         if update:
-            self._update_filter()
+            self._invalidate(VOICE_FILTER)
     def get_filter_frequency(self):
         return self.filter_frequency
     def set_filter_resonance(self, value, update=True):
         self.filter_resonance = value
         if update:
-            self._update_filter()
+            self._invalidate(VOICE_FILTER)
     def get_filter_resonance(self):
         return self.filter_resonance
     def set_filter_attack_time(self, value):
@@ -336,31 +522,31 @@ class Voice:
     def set_envelope_attack_time(self, value, update=True):
         self.attack_time = value
         if update:
-            self._update_envelope()
+            self._invalidate(VOICE_ENVELOPE)
     def get_envelope_attack_time(self):
         return self.attack_time
     def set_envelope_decay_time(self, value, update=True):
         self.decay_time = value
         if update:
-            self._update_envelope()
+            self._invalidate(VOICE_ENVELOPE)
     def get_envelope_decay_time(self):
         return self.decay_time
     def set_envelope_release_time(self, value, update=True):
         self.release_time = value
         if update:
-            self._update_envelope()
+            self._invalidate(VOICE_ENVELOPE)
     def get_envelope_release_time(self):
         return self.release_time
     def set_envelope_attack_level(self, value, update=True):
         self.attack_level = value
         if update:
-            self._update_envelope()
+            self._invalidate(VOICE_ENVELOPE)
     def get_envelope_attack_level(self):
         return self.attack_level
     def set_envelope_sustain_level(self, value, update=True):
         self.sustain_level = value
         if update:
-            self._update_envelope()
+            self._invalidate(VOICE_ENVELOPE)
     def get_envelope_sustain_level(self):
         return self.sustain_level
 
@@ -371,14 +557,247 @@ class Voice:
             for oscillator in self.oscillators:
                 oscillator.set_pan(value)
 
-    def update(self):
-        self._update_filter()
+    def update(self, now=None):
+        if not now:
+            now = time.monotonic()
+        for oscillator in self.oscillators:
+            oscillator.update(now)
+        if self._native_filter:
+            return
+        if now < self._filter_now + self._filter_update:
+            return
+        self._filter_now = now
+        self._update_filter(False)
 
     def deinit(self):
         for oscillator in self.oscillators:
             oscillator.deinit()
         del self.oscillators
         del self._filter_buffer
+        del self._filter
         self.filter_envelope.deinit()
         del self.filter_envelope
         del self._synth
+
+class VoiceBroadcast:
+    # Forwards setters to the same method of every item, getters read the first item
+    def __init__(self, items):
+        self._items = items
+    def __getattr__(self, name):
+        # Forwarders are built on the first lookup and kept as attributes, later lookups do not reach __getattr__
+        if name.startswith("get_"):
+            call = getattr(self._items[0], name)
+        else:
+            methods = [getattr(item, name) for item in self._items]
+            def call(*args):
+                result = None
+                for method in methods:
+                    result = method(*args)
+                return result
+        setattr(self, name, call)
+        return call
+
+class VoiceGovernor:
+    # Audio is rendered by background tasks which delay the main loop, so the share of each window spent
+    # beyond the fastest loop iteration estimates synthio's share of the cpu, slower main loop work counts towards it
+    def __init__(self, count, target=0.7, window=1.0):
+        self._count = count
+        self._target = target
+        self._window = int(window * 1000000000)
+        self._limit = count
+        self._load = 0.0
+        self._fastest = 0
+        self._samples = 0
+        self._loop_ns = 0
+        self._window_ns = 0
+
+    def get_limit(self):
+        return self._limit
+    def get_load(self):
+        return self._load
+    def set_target(self, value):
+        self._target = value
+
+    def update(self, now, active):
+        # Called once per main loop iteration
+        ns = time.monotonic_ns()
+        if not self._loop_ns:
+            self._loop_ns = ns
+            self._window_ns = ns
+            return False
+        period = ns - self._loop_ns
+        self._loop_ns = ns
+        if not self._samples or period < self._fastest:
+            self._fastest = period
+        self._samples = self._samples + 1
+        if ns < self._window_ns + self._window:
+            return False
+        self._load = max(1.0 - self._fastest * self._samples / max(ns - self._window_ns, 1), 0.0)
+        self._window_ns = ns
+        self._samples = 0
+
+        # Shed a voice when over budget, add one only if the load projected for another voice still fits
+        limit = self._limit
+        if self._load > self._target:
+            limit = max(min(limit, active) - 1, 1)
+        elif active >= limit and active and self._load * (active + 1) / active < self._target:
+            limit = min(limit + 1, self._count)
+        if limit == self._limit:
+            return False
+        self._limit = limit
+        return True
+
+class VoicePool:
+    def __init__(self, synth, waveforms, count=1, steal="oldest", governor=None, **kwargs):
+        self._synth = synth
+        self._voices = tuple([Voice(synth, waveforms, **kwargs) for i in range(max(count, 1))])
+        self._count = len(self._voices)
+        self._broadcast = VoiceBroadcast(self._voices)
+        self.oscillators = tuple([VoiceBroadcast([voice.oscillators[i] for voice in self._voices]) for i in range(len(self._voices[0].oscillators))])
+
+        self._steal_types = ["oldest", "round-robin", "quietest"]
+        self._steal = 0
+        self.set_steal(steal)
+
+        # Allocation state per voice: held note (-1 when free), press or release order and velocity
+        self._notes = array.array("b", [-1] * self._count)
+        self._ticks = array.array("L", [0] * self._count)
+        self._velocities = array.array("f", [0.0] * self._count)
+        self._tick = 0
+        self._next = 0
+        self._active = 0
+        self._steals = 0
+
+        self._governor = governor if self._count > 1 else None
+        self._limit = self._count
+
+    def __getattr__(self, name):
+        # Voice settings are applied to every voice in the pool
+        method = getattr(self._broadcast, name)
+        setattr(self, name, method)
+        return method
+
+    def get_count(self):
+        return self._count
+    def get_active(self):
+        return self._active
+    def get_limit(self):
+        return self._limit
+    def get_voices(self):
+        return self._voices
+
+    def get_steal_types(self):
+        return self._steal_types
+    def set_steal(self, value):
+        if type(value) is str:
+            value = self._steal_types.index(value) if value in self._steal_types else 0
+        self._steal = value
+
+    def _find(self, note):
+        for i in range(self._count):
+            if self._notes[i] == note:
+                return i
+        return -1
+    def _allocate(self):
+        # Free voices are reused in the order they were released so that release tails can finish
+        if self._active < self._limit:
+            index = -1
+            for i in range(self._count):
+                if self._notes[i] < 0 and (index < 0 or self._ticks[i] < self._ticks[index]):
+                    index = i
+            if index >= 0:
+                return index
+        self._steals = self._steals + 1
+        return self._get_steal()
+    def _get_steal(self):
+        type = self._steal_types[self._steal]
+        index = -1
+        if type == "round-robin":
+            for i in range(self._count):
+                j = (self._next + i) % self._count
+                if self._notes[j] >= 0:
+                    index = j
+                    break
+            self._next = index + 1
+        elif type == "quietest":
+            level = 0.0
+            for i in range(self._count):
+                if self._notes[i] < 0:
+                    continue
+                value = self._synth.get_note_level(self._voices[i].oscillators[0].note)
+                if value is None:
+                    value = self._velocities[i]
+                if index < 0 or value < level:
+                    index = i
+                    level = value
+        else: # "oldest"
+            for i in range(self._count):
+                if self._notes[i] >= 0 and (index < 0 or self._ticks[i] < self._ticks[index]):
+                    index = i
+        return max(index, 0)
+
+    def press(self, note, velocity):
+        if self._count == 1:
+            index = 0
+        else:
+            index = self._find(note)
+            if index < 0:
+                index = self._allocate()
+            if self._notes[index] >= 0:
+                # Retrigger the envelope of a repeated or stolen voice
+                self._release(index)
+        if self._notes[index] < 0:
+            self._active = self._active + 1
+        self._tick = self._tick + 1
+        self._notes[index] = note
+        self._ticks[index] = self._tick
+        self._velocities[index] = velocity
+        self._voices[index].press(note, velocity)
+    def release(self, note=None):
+        if self._count == 1:
+            self._release(0)
+            return
+        for i in range(self._count):
+            if self._notes[i] >= 0 and (note is None or self._notes[i] == note):
+                self._release(i)
+    def _release(self, index):
+        if self._notes[index] >= 0:
+            self._active = self._active - 1
+        self._tick = self._tick + 1
+        self._notes[index] = -1
+        self._ticks[index] = self._tick
+        self._voices[index].release()
+
+    def _set_limit(self, value):
+        self._limit = value
+        while self._active > self._limit:
+            self._release(self._get_steal())
+
+    def update(self, now=None):
+        if not now:
+            now = time.monotonic()
+        if self._governor and self._governor.update(now, self._active):
+            self._set_limit(self._governor.get_limit())
+        for voice in self._voices:
+            voice.update(now)
+
+    def get_stats(self):
+        return {
+            "count": self._count,
+            "active": self._active,
+            "limit": self._limit,
+            "steals": self._steals,
+            "load": self._governor.get_load() if self._governor else 0.0,
+        }
+    def report(self):
+        stats = self.get_stats()
+        print("Voices: {:d}/{:d} active, limit {:d}, {:d} steals, {:.1f}% audio load".format(stats["active"], stats["count"], stats["limit"], stats["steals"], stats["load"] * 100))
+
+    def deinit(self):
+        for voice in self._voices:
+            voice.deinit()
+        del self._voices
+        del self._broadcast
+        del self.oscillators
+        del self._governor
+        del self._synth
@@ -1,15 +1,81 @@
+WAVE_CACHE_MAGIC = b"SMWC"
+WAVE_CACHE_VERSION = 1
+WAVE_CACHE_HEADER = "<4sBBHHH" # magic, version, reserved, waveform count, samples, amplitude
+WAVE_CACHE_ENTRY = "<IIHH24s" # wav mtime, wav size, flags, reserved, name
+WAVE_CACHE_INVALID = 1 # the wav file could not be read
+WAVE_MIPMAP_MAGIC = b"SMWM"
+WAVE_MIPMAP_VERSION = 1
+WAVE_MIPMAP_HEADER = "<4sBBHHH" # magic, version, levels, samples, amplitude, sample rate / 2
+
 class Waveform:
-    def __init__(self, name, data):
+    def __init__(self, name, data=None):
         self.name = name
         self.data = data
+        self.loaded = not data is None
+        self.index = -1 # Position of custom waveforms in the cache file
+        self.mipmaps = None # Band-limited tables from most to fewest harmonics
+        self.limits = None # Highest fundamental frequency of each table which does not alias
+    def get_mipmap(self, frequency):
+        for i in range(len(self.limits)):
+            if frequency <= self.limits[i]:
+                return self.mipmaps[i]
+        return self.mipmaps[-1]
+    def deinit(self):
+        del self.data
+        del self.mipmaps
+        del self.limits
+
+class DynamicWaveform:
+    # A table which is rewritten in place, notes referencing it pick up every render without being reassigned
+    def __init__(self, samples, amplitude=12000):
+        self.data = numpy.zeros(samples, dtype=numpy.int16)
+        # Pulse edges overshoot to about 2.2 times the saw amplitude including gibbs and would wrap around in int16
+        self._clip = amplitude * 2.2 > 32767
+        self._work = numpy.zeros(samples)
+        self._mix = numpy.zeros(samples)
+        self._table = None
+        self._width = 0
+        self._morph_table = None
+        self._morph = 0.0
+    def render(self, table, width=0, morph_table=None, morph=0.0):
+        if table is self._table and width == self._width and morph_table is self._morph_table and morph == self._morph:
+            return False
+        self._table = table
+        self._width = width
+        self._morph_table = morph_table
+        self._morph = morph
+
+        # Only in-place operations on preallocated buffers so that control rate updates do not allocate
+        samples = len(self._work)
+        self._work[:] = table
+        if width > 0:
+            # A pulse is a saw minus the same saw delayed by the width in samples, which keeps it band-limited and free of dc
+            self._mix[:] = table
+            self._work[width:] -= self._mix[:samples - width]
+            self._work[:width] -= self._mix[samples - width:]
+        if not morph_table is None and morph > 0.0:
+            self._mix[:] = morph_table
+            self._mix *= morph
+            self._work *= 1.0 - morph
+            self._work += self._mix
+        if self._clip:
+            self._work[:] = numpy.clip(self._work, -32767, 32767)
+        self.data[:] = self._work
+        return True
     def deinit(self):
         del self.data
+        del self._work
+        del self._mix
+        del self._table
+        del self._morph_table
 
 class Waveforms:
-    def __init__(self, samples=256, amplitude=12000, dir="/waveforms"):
+    def __init__(self, samples=256, amplitude=12000, dir="/waveforms", cache=None, sample_rate=0, mipmap_cache=None):
         self._samples = samples
         self._amplitude = amplitude
         self._dir = dir
+        self._cache = cache
+        self._mipmap_buffer = None
         self._items = [
             Waveform("saw", numpy.linspace(self._amplitude, -self._amplitude, num=self._samples, dtype=numpy.int16)),
             Waveform("square", numpy.concatenate((numpy.ones(self._samples//2, dtype=numpy.int16)*self._amplitude,numpy.ones(self._samples//2, dtype=numpy.int16)*-self._amplitude))),
@@ -17,11 +83,18 @@ class Waveforms:
             Waveform("noise", numpy.array([random.randint(-self._amplitude, self._amplitude) for i in range(self._samples)], dtype=numpy.int16))
         ]
 
-        # Append custom waveforms
+        # Append custom waveforms, their data is only read once a parameter selects them
+        self._custom = len(self._items)
         filenames = self._list_wav()
         if filenames:
-            for filename in filenames:
-                self._items.append(Waveform(self._get_wav_name(filename), self._read_wav_data(filename)))
+            for filename in sorted(filenames):
+                self._items.append(Waveform(self._get_wav_name(filename)))
+            if self._cache:
+                self._sync_cache()
+
+        # Saw and square have a band-limited table per octave, a sample rate of 0 disables them
+        if sample_rate > 0:
+            self._load_mipmaps(sample_rate, mipmap_cache)
 
     def get(self, value):
         if type(value) is str:
@@ -31,6 +104,10 @@ class Waveforms:
         elif type(value) is int:
             return self._items[value]
         return None
+    def get_samples(self):
+        return self._samples
+    def get_amplitude(self):
+        return self._amplitude
     def get_list(self):
         arr = []
         for item in self._items:
@@ -41,14 +118,208 @@ class Waveforms:
             if self._items[i].name == name:
                 return i
         return 0
-    def get_data(self, name):
+    def get_data(self, name, frequency=None):
+        # With a frequency, band-limited waveforms return the table with the most harmonics which do not alias
         item = self.get(name)
         if not item:
             return None
+        if frequency and item.mipmaps:
+            return item.get_mipmap(frequency)
+        if not item.loaded:
+            self._load(item)
         return item.data
 
-    def _read_wav_data(self, filename):
-        import adafruit_wave
+    def _get_mipmap_harmonics(self, level):
+        return max((self._samples // 2 >> level) - 1, 1)
+    def _get_mipmap_levels(self):
+        levels = 1
+        while self._get_mipmap_harmonics(levels - 1) > 1:
+            levels = levels + 1
+        return levels
+    def _load_mipmaps(self, sample_rate, cache=None):
+        levels = self._get_mipmap_levels()
+        items = (self.get("saw"), self.get("square"))
+        size = self._samples * 2
+        self._mipmap_buffer = bytearray(len(items) * levels * size)
+        header = struct.pack(WAVE_MIPMAP_HEADER, WAVE_MIPMAP_MAGIC, WAVE_MIPMAP_VERSION, levels, self._samples, self._amplitude, sample_rate // 2)
+
+        loaded = False
+        if cache:
+            try:
+                with open(cache, "rb") as file:
+                    if file.read(len(header)) == header:
+                        loaded = file.readinto(self._mipmap_buffer) == len(self._mipmap_buffer)
+            except:
+                loaded = False
+
+        nyquist = sample_rate / 2
+        for i in range(len(items)):
+            items[i].mipmaps = [numpy.frombuffer(self._mipmap_buffer, dtype=numpy.int16, count=self._samples, offset=(i * levels + level) * size) for level in range(levels)]
+            items[i].limits = array.array("f", [nyquist / self._get_mipmap_harmonics(level) for level in range(levels)])
+        if loaded:
+            print("Wavetable mipmaps: {:d} levels, {:d} bytes, read from {}".format(levels, len(self._mipmap_buffer), cache))
+            return True
+
+        # Additive synthesis of every level in a single pass, each level adds the harmonics the one above it could not fit
+        times = array.array("f", [0.0 for level in range(levels)])
+        phase = numpy.linspace(0, 2 * numpy.pi, self._samples, endpoint=False)
+        for i in range(len(items)):
+            table = numpy.zeros(self._samples)
+            harmonic = 1
+            for level in range(levels - 1, -1, -1):
+                start = time.monotonic_ns()
+                harmonics = self._get_mipmap_harmonics(level)
+                while harmonic <= harmonics:
+                    if i == 0 or harmonic % 2: # Square waves only have odd harmonics
+                        table = table + numpy.sin(phase * harmonic) / harmonic
+                    harmonic = harmonic + 1
+                # Harmonics keep the amplitude of the ideal waveform so switching levels does not change the level of the note
+                items[i].mipmaps[level][:] = numpy.array(numpy.clip(table * (self._amplitude * (2.0 if i == 0 else 4.0) / numpy.pi), -32767, 32767), dtype=numpy.int16)
+                times[level] = times[level] + (time.monotonic_ns() - start) / 1000000
+        for level in range(levels):
+            print("Mipmap level {:d}: {:d} harmonics up to {:.0f}Hz, {:d} bytes, {:.2f}ms".format(level, self._get_mipmap_harmonics(level), items[0].limits[level], len(items) * size, times[level]))
+        print("Wavetable mipmaps: {:d} levels, {:d} bytes, {:.2f}ms".format(levels, len(self._mipmap_buffer), sum(times)))
+
+        if cache:
+            try:
+                with open(cache, "wb") as file:
+                    file.write(header)
+                    file.write(self._mipmap_buffer)
+            except:
+                print("Failed to write mipmap cache: {}".format(cache))
+        return True
+
+    def _get_stat(self, item):
+        try:
+            stat = os.stat(self._dir + "/" + item.name + ".wav")
+            return (stat[8] & 0xFFFFFFFF, stat[6] & 0xFFFFFFFF)
+        except:
+            return (0, 0)
+    def _get_cache_offset(self, index):
+        count = len(self._items) - self._custom
+        return struct.calcsize(WAVE_CACHE_HEADER) + count * struct.calcsize(WAVE_CACHE_ENTRY) + index * self._samples * 2
+    def _read_cache_index(self, file):
+        # Returns the cache index as a bytearray if it was built with the current settings
+        header = bytearray(struct.calcsize(WAVE_CACHE_HEADER))
+        if file.readinto(header) != len(header):
+            return None
+        magic, version, reserved, count, samples, amplitude = struct.unpack(WAVE_CACHE_HEADER, header)
+        if magic != WAVE_CACHE_MAGIC or version != WAVE_CACHE_VERSION or samples != self._samples or amplitude != self._amplitude:
+            return None
+        index = bytearray(count * struct.calcsize(WAVE_CACHE_ENTRY))
+        if file.readinto(index) != len(index):
+            return None
+        return index
+    def _find_cache_entry(self, index, item, stat):
+        size = struct.calcsize(WAVE_CACHE_ENTRY)
+        for i in range(len(index) // size):
+            mtime, wav_size, flags, reserved, name = struct.unpack_from(WAVE_CACHE_ENTRY, index, i * size)
+            if name.rstrip(b"\x00") == item.name.encode()[:24] and (mtime, wav_size) == stat:
+                return i, flags
+        return -1, 0
+    def _sync_cache(self):
+        # Uses the cache if every custom waveform matches its entry, otherwise rebuilds it
+        index = None
+        try:
+            with open(self._cache, "rb") as file:
+                index = self._read_cache_index(file)
+        except:
+            index = None
+        valid = not index is None and len(index) // struct.calcsize(WAVE_CACHE_ENTRY) == len(self._items) - self._custom
+        if valid:
+            for i in range(self._custom, len(self._items)):
+                item = self._items[i]
+                position, flags = self._find_cache_entry(index, item, self._get_stat(item))
+                if position != i - self._custom:
+                    valid = False
+                    break
+                item.index = -1 if flags & WAVE_CACHE_INVALID else position
+                item.loaded = bool(flags & WAVE_CACHE_INVALID)
+        if valid:
+            print("Waveform cache: {:d} waveforms".format(len(self._items) - self._custom))
+            return True
+        return self._build_cache(index)
+    def _build_cache(self, previous=None):
+        # Resamples changed waveforms and copies the rest from the previous cache into a new file
+        adafruit_wave = None
+        buffer = bytearray(self._samples * 2)
+        data = numpy.frombuffer(buffer, dtype=numpy.int16)
+        entry = bytearray(struct.calcsize(WAVE_CACHE_ENTRY))
+        count = len(self._items) - self._custom
+        resampled = 0
+        temp = self._cache + ".tmp"
+        try:
+            with open(temp, "wb") as file:
+                file.write(struct.pack(WAVE_CACHE_HEADER, WAVE_CACHE_MAGIC, WAVE_CACHE_VERSION, 0, count, self._samples, self._amplitude))
+                for i in range(count):
+                    file.write(entry) # Written once the waveforms have been read
+                for i in range(count):
+                    item = self._items[self._custom + i]
+                    stat = self._get_stat(item)
+                    position, flags = self._find_cache_entry(previous, item, stat) if previous else (-1, 0)
+                    if position >= 0 and not flags & WAVE_CACHE_INVALID:
+                        with open(self._cache, "rb") as source:
+                            source.seek(struct.calcsize(WAVE_CACHE_HEADER) + len(previous) + position * self._samples * 2)
+                            source.readinto(buffer)
+                        flags = 0
+                    else:
+                        if not adafruit_wave:
+                            import adafruit_wave
+                        wav = self._read_wav_data(item.name + ".wav", adafruit_wave)
+                        flags = 0 if not wav is None else WAVE_CACHE_INVALID
+                        if wav is None:
+                            wav = numpy.zeros(self._samples, dtype=numpy.int16)
+                        data[:] = wav
+                        del wav
+                        resampled = resampled + 1
+                    file.write(buffer)
+                    struct.pack_into(WAVE_CACHE_ENTRY, entry, 0, stat[0], stat[1], flags, 0, item.name.encode()[:24])
+                    position = file.tell()
+                    file.seek(struct.calcsize(WAVE_CACHE_HEADER) + i * len(entry))
+                    file.write(entry)
+                    file.seek(position)
+                    item.index = -1 if flags else i
+                    item.loaded = bool(flags)
+            try:
+                os.remove(self._cache)
+            except:
+                pass
+            os.rename(temp, self._cache)
+            os.sync()
+        except:
+            print("Failed to write waveform cache: {}".format(self._cache))
+            for i in range(self._custom, len(self._items)):
+                self._items[i].index = -1
+                self._items[i].loaded = False
+            result = False
+        else:
+            print("Waveform cache: {:d} waveforms, {:d} resampled".format(count, resampled))
+            result = True
+        if adafruit_wave:
+            free_module(adafruit_wave)
+            del adafruit_wave
+        return result
+    def _load(self, item):
+        # Reads a custom waveform from the cache with a single readinto, or resamples the wav file without a cache
+        item.loaded = True
+        if item.index >= 0:
+            buffer = bytearray(self._samples * 2)
+            try:
+                with open(self._cache, "rb") as file:
+                    file.seek(self._get_cache_offset(item.index))
+                    if file.readinto(buffer) == len(buffer):
+                        item.data = numpy.frombuffer(buffer, dtype=numpy.int16)
+                        return True
+            except:
+                pass
+            print("Failed to read waveform cache: {}".format(item.name))
+        item.data = self._read_wav_data(item.name + ".wav")
+        return not item.data is None
+
+    def _read_wav_data(self, filename, adafruit_wave=None):
+        module = adafruit_wave
+        if not module:
+            import adafruit_wave
         data = None
         with adafruit_wave.open(self._dir+"/"+filename) as w:
             if w.getsampwidth() == 2 and w.getnchannels() == 1:
@@ -60,8 +331,9 @@ class Waveforms:
                     data = numpy.array(data*(self._amplitude/norm), dtype=numpy.int16)
             else:
                 print("Failed to read {}: unsupported format".format(filename))
-        free_module(adafruit_wave)
-        del adafruit_wave
+        if not module:
+            free_module(adafruit_wave)
+            del adafruit_wave
         return data
     def _valid_wav_filename(self, filename):
         return len(filename) > len("a.wav") and filename[-4:] == ".wav"
@@ -79,3 +351,4 @@ class Waveforms:
         for item in self._items:
             item.deinit()
         del self._items
+        del self._mipmap_buffer
@@ -0,0 +1,63 @@
+# circuitpython-synthio-mono: Wavetable Aliasing Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Plays the saw and square tables at a range of MIDI notes with the same
+# truncating table lookup as synthio and measures how much of the output energy
+# lands outside the harmonics of the note (aliasing), for the single naive table
+# and for the band-limited mipmap chosen for the note. Also reports the time and
+# memory taken to build the mipmaps.
+#
+# Usage: python3 tools/benchmarks/aliasing.py [--rate 22050] [--samples 256] [--notes 36,48,60,72,84,96,108]
+
+import argparse, io, math, os, sys, time
+from contextlib import redirect_stdout
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+def render(table, frequency, rate):
+    # One second of a note so that every harmonic of an integer frequency falls on an FFT bin
+    length = len(table)
+    phases = (numpy.arange(rate) * (frequency * length / rate)) % length
+    return numpy.asarray(table, dtype=numpy.float64)[phases.astype(numpy.int32)]
+
+def measure_aliasing(samples, frequency, rate):
+    spectrum = numpy.abs(numpy.fft.rfft(samples)) ** 2
+    spectrum[0] = 0.0
+    harmonics = numpy.arange(frequency, rate // 2 + 1, frequency)
+    wanted = spectrum[harmonics].sum()
+    unwanted = spectrum.sum() - wanted
+    return 10.0 * math.log10(max(unwanted, 1e-12) / max(wanted, 1e-12))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure aliasing of naive and band-limited wavetables")
+    parser.add_argument("--rate", type=int, default=22050)
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--amplitude", type=int, default=12000)
+    parser.add_argument("--notes", default="36,48,60,72,84,96,108")
+    args = parser.parse_args()
+
+    lib = emulate.setup(realtime_audio=False)
+    naive = lib.Waveforms(args.samples, args.amplitude)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(output):
+        mipmaps = lib.Waveforms(args.samples, args.amplitude, sample_rate=args.rate)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(output.getvalue().rstrip())
+    print("Waveforms with mipmaps built in {:.2f}ms".format(elapsed))
+
+    print("\n{:<8}{:>10}{:>14}{:>14}{:>14}{:>14}".format("note", "Hz", "saw naive", "saw mipmap", "square naive", "square mipmap"))
+    for note in [int(value) for value in args.notes.split(",")]:
+        frequency = int(round(440.0 * 2 ** ((note - 69) / 12)))
+        row = []
+        for name in ("saw", "square"):
+            row.append(measure_aliasing(render(naive.get_data(name), frequency, args.rate), frequency, args.rate))
+            row.append(measure_aliasing(render(mipmaps.get_data(name, frequency), frequency, args.rate), frequency, args.rate))
+        print("{:<8d}{:>10d}{:>12.1f}dB{:>12.1f}dB{:>12.1f}dB{:>12.1f}dB".format(note, frequency, *row))
+
+if __name__ == "__main__":
+    main()
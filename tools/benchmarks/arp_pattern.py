@@ -0,0 +1,145 @@
+# circuitpython-synthio-mono: Arpeggiator Pattern Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Plays chords into a Keyboard with the arpeggiator enabled and measures the
+# cost of each chord change (note on/off) and of each arpeggiator step, along
+# with the memory allocated per event. The incremental pattern engine is compared
+# against the previous implementation which rebuilt a sorted list of every step
+# from a copy of the held notes on each chord change.
+#
+# Usage: python3 tools/benchmarks/arp_pattern.py [--chords 3,6,12] [--octaves 2] [--events 5000]
+
+import argparse, os, random, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+class LegacyArpeggiator:
+    # Note handling of the arpeggiator before the incremental pattern engine
+    def __init__(self, type="up", octaves=0):
+        self._type = type
+        self._octaves = octaves
+        self._raw_notes = []
+        self._notes = []
+        self._pos = 0
+    def _get_notes(self, notes=[]):
+        if not notes:
+            return notes
+        if abs(self._octaves) > 0:
+            l = len(notes)
+            for octave in range(1,abs(self._octaves)+1):
+                if self._octaves < 0:
+                    octave = octave * -1
+                for i in range(0,l):
+                    notes.append((notes[i][0] + octave*12, notes[i][1]))
+        type = self._type
+        if type == "up":
+            notes.sort(key=lambda x: x[0])
+        elif type == "down":
+            notes.sort(key=lambda x: x[0], reverse=True)
+        elif type == "updown":
+            notes.sort(key=lambda x: x[0])
+            if len(notes) > 2:
+                _notes = notes[1:-1].copy()
+                _notes.reverse()
+                notes = notes + _notes
+        return notes
+    def update_notes(self, notes=[]):
+        self._raw_notes = notes.copy()
+        self._notes = self._get_notes(notes)
+    def step(self, press):
+        if self._notes:
+            self._pos = (self._pos+1) % len(self._notes)
+            press(self._notes[self._pos][0], self._notes[self._pos][1])
+
+class LegacyKeyboard:
+    # Only what the legacy arpeggiator needs: the held notes as a list, copied for every change
+    def __init__(self, arpeggiator):
+        self._notes = []
+        self._arpeggiator = arpeggiator
+    def append(self, notenum, velocity):
+        self._notes = [note for note in self._notes if note[0] != notenum]
+        self._notes.append((notenum, velocity))
+        self._arpeggiator.update_notes(self._notes.copy())
+    def remove(self, notenum):
+        self._notes = [note for note in self._notes if note[0] != notenum]
+        self._arpeggiator.update_notes(self._notes.copy())
+
+def build_events(chord, count):
+    # Overlapping chords with a few arpeggiator steps between every chord change
+    random.seed(0)
+    events = []
+    previous = []
+    while len(events) < count:
+        notes = random.sample(range(36, 84), chord)
+        for note in notes:
+            events.append(("on", note, random.randrange(1, 128) / 127))
+        for note in previous:
+            events.append(("off", note, 0))
+        for i in range(chord):
+            events.append(("step", 0, 0))
+        previous = notes
+    return events[:count]
+
+def play(keyboard, step, events):
+    for kind, value, velocity in events:
+        if kind == "on":
+            keyboard.append(value, velocity)
+        elif kind == "off":
+            keyboard.remove(value)
+        else:
+            step()
+
+def measure(keyboard, step, events):
+    start = time.perf_counter_ns()
+    play(keyboard, step, events)
+    elapsed = (time.perf_counter_ns() - start) / len(events)
+    # Largest amount of memory held by a single event beyond what was held before it
+    total = 0
+    tracemalloc.start()
+    for event in events[:2000]:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        play(keyboard, step, (event,))
+        total = total + tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return elapsed, total / min(len(events), 2000)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure arpeggiator chord changes and steps")
+    parser.add_argument("--chords", default="3,6,12")
+    parser.add_argument("--octaves", type=int, default=2)
+    parser.add_argument("--events", type=int, default=5000)
+    args = parser.parse_args()
+
+    lib = emulate.setup(realtime_audio=False)
+    press = lambda notenum, velocity: None
+    print("\n{:<24}{:>12}{:>12}{:>16}{:>16}".format("scenario (ns/event)", "legacy", "pattern", "legacy bytes", "pattern bytes"))
+    for chord in [int(value) for value in args.chords.split(",")]:
+        for type in ("up", "down", "updown"):
+            events = build_events(chord, args.events)
+
+            legacy = LegacyArpeggiator(type, args.octaves)
+            legacy_time, legacy_bytes = measure(LegacyKeyboard(legacy), lambda: legacy.step(press), events)
+
+            arpeggiator = lib.Arpeggiator()
+            arpeggiator.set_type(type)
+            arpeggiator.set_octaves(args.octaves)
+            arpeggiator.set_press(press)
+            arpeggiator.set_release(lambda notenum=None: None)
+            keyboard = lib.Keyboard()
+            keyboard.set_arpeggiator(arpeggiator)
+            arpeggiator.enable()
+            # Every step is due on each update
+            clock = [arpeggiator._start]
+            def step():
+                clock[0] = clock[0] + arpeggiator._step_time
+                arpeggiator.update(clock[0])
+            pattern_time, pattern_bytes = measure(keyboard, step, events)
+
+            name = "{:d} notes, {}".format(chord, type)
+            print("{:<24}{:>12.0f}{:>12.0f}{:>16.1f}{:>16.1f}".format(name, legacy_time, pattern_time, legacy_bytes, pattern_bytes))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# circuitpython-synthio-mono: Arpeggiator Timing Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Drives the arpeggiator from a simulated main loop on a virtual clock with
+# jitter and injected stalls (patch loads, display writes, garbage collection)
+# and compares each step against the ideal grid: timing error of the steps that
+# were played, steps that were missed, bursts of steps played within a single
+# loop and the error of each gate. The scheduler before absolute step timing,
+# which advanced one step per update, is compared with each missed step policy.
+#
+# Usage: python3 tools/benchmarks/arp_timing.py [--bpm 120] [--steps 4] [--duration 60] [--stalls 0.05,0.2,0.4] [--stall-every 0.7] [--loop 0.002] [--swing 0.0]
+
+import argparse, bisect, os, random, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+START = 1.0 # Virtual time of the first step, a time of 0 would be taken as no time by update
+
+class LegacyScheduler:
+    # Step timing of the arpeggiator before the absolute scheduler
+    def __init__(self, step_time, gate, press, release):
+        self._step_time = step_time
+        self._gate_duration = gate * step_time
+        self._press = press
+        self._release = release
+        self._now = 0.0
+    def start(self, now):
+        self._now = now - self._step_time
+    def update(self, now):
+        if now >= self._now + self._step_time:
+            self._now = self._now + self._step_time
+            self._press(0, 1.0)
+        if now - self._now > self._gate_duration:
+            self._release()
+
+class Recorder:
+    def __init__(self):
+        self.now = 0.0
+        self.presses = []
+        self.releases = []
+        self.gated = False
+    def press(self, notenum, velocity):
+        if self.gated:
+            self.release()
+        self.presses.append(self.now)
+        self.gated = True
+    def release(self, notenum=None):
+        if self.gated:
+            self.releases.append(self.now)
+            self.gated = False
+
+def run(scheduler, recorder, args, grid, length):
+    # Loop period with jitter and a stall of about length seconds every few hundred milliseconds
+    random.seed(0)
+    now = START
+    stall = START + args.stall_every
+    while now < START + args.duration:
+        recorder.now = now
+        scheduler.update(now)
+        now = now + args.loop * random.uniform(0.5, 1.5)
+        if now >= stall:
+            now = now + length * random.uniform(0.5, 1.5)
+            stall = stall + args.stall_every * random.uniform(0.5, 1.5)
+
+    # Each press is matched with the nearest grid step
+    expected = len([time for time in grid if time < START + args.duration])
+    errors = []
+    lengths = []
+    bursts = 0
+    last = -1.0
+    for time in recorder.presses:
+        index = bisect.bisect_left(grid, time)
+        if index >= len(grid) or (index > 0 and time - grid[index - 1] < grid[index] - time):
+            index = index - 1
+        errors.append(time - grid[index])
+        lengths.append(grid[min(index + 1, len(grid) - 1)] - grid[index])
+        if time - last < args.loop * 1.5:
+            bursts = bursts + 1
+        last = time
+    # Gates are compared with the length of their own step, which swing changes
+    gates = []
+    for i in range(min(len(recorder.presses), len(recorder.releases))):
+        gates.append(abs(recorder.releases[i] - recorder.presses[i] - args.gate * lengths[i]))
+    late = [error for error in errors if error > args.loop * 2]
+    errors.sort()
+    return {
+        "played": len(recorder.presses),
+        "expected": expected,
+        "median": errors[len(errors) // 2] * 1000 if errors else 0.0,
+        "max": errors[-1] * 1000 if errors else 0.0,
+        "late": len(late),
+        "bursts": bursts,
+        "gate": sum(gates) / len(gates) * 1000 if gates else 0.0,
+    }
+
+def print_result(name, result):
+    print("{:<12}{:>14}{:>12.2f}{:>12.2f}{:>8d}{:>8d}{:>14.2f}".format(name, "{:d}/{:d}".format(result["played"], result["expected"]), result["median"], result["max"], result["late"], result["bursts"], result["gate"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure arpeggiator step timing under loop stalls")
+    parser.add_argument("--bpm", type=float, default=120.0)
+    parser.add_argument("--steps", type=float, default=4.0)
+    parser.add_argument("--gate", type=float, default=0.5)
+    parser.add_argument("--swing", type=float, default=0.0)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--stalls", default="0.05,0.2,0.4", help="stall lengths to sweep, a step is 125ms at the default tempo")
+    parser.add_argument("--stall-every", type=float, default=0.7)
+    parser.add_argument("--loop", type=float, default=0.002)
+    args = parser.parse_args()
+    args.step_time = 60.0 / args.bpm / args.steps
+
+    lib = emulate.setup(realtime_audio=False)
+    for length in [float(value) for value in args.stalls.split(",")]:
+        print("\nStep of {:.1f}ms, {:.0f}ms stalls every {:.0f}ms, {:.1f}ms loop".format(args.step_time * 1000, length * 1000, args.stall_every * 1000, args.loop * 1000))
+        print("{:<12}{:>14}{:>12}{:>12}{:>8}{:>8}{:>14}".format("scheduler", "played", "median ms", "max ms", "late", "burst", "gate err ms"))
+
+        # Legacy timing has no swing
+        grid = [START + i * args.step_time for i in range(int(args.duration / args.step_time) + 2)]
+        recorder = Recorder()
+        legacy = LegacyScheduler(args.step_time, args.gate, recorder.press, recorder.release)
+        legacy.start(START)
+        result = run(legacy, recorder, args, grid, length)
+        print_result("legacy", result)
+
+        swing = min(max(args.swing, 0.0), 1.0) * 0.5 * args.step_time
+        grid = [START + i * args.step_time + (swing if i & 1 else 0.0) for i in range(int(args.duration / args.step_time) + 2)]
+        for policy in ("drop", "merge", "catchup"):
+            recorder = Recorder()
+            arpeggiator = lib.Arpeggiator(bpm=args.bpm, steps=args.steps, missed=policy)
+            arpeggiator.set_gate(args.gate)
+            arpeggiator.set_swing(args.swing)
+            arpeggiator.set_press(recorder.press)
+            arpeggiator.set_release(recorder.release)
+            arpeggiator.append_note(60, 1.0)
+            arpeggiator.enable()
+            arpeggiator._reset(START)
+            result = run(arpeggiator, recorder, args, grid, length)
+            print_result(policy, result)
+
+if __name__ == "__main__":
+    main()
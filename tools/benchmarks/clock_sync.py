@@ -0,0 +1,89 @@
+# circuitpython-synthio-mono: MIDI Clock Sync Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Feeds synthetic 24 PPQN clock streams with timing noise, dropped pulses and
+# tempo changes into the arpeggiator's clock estimator and measures how far the
+# tempo and the quarter note phase it reports are from the true clock. The raw
+# interval of the last pulse and of the last quarter note are shown for comparison.
+#
+# Usage: python3 tools/benchmarks/clock_sync.py [--bpm 120] [--quarters 200] [--bandwidth 1.0]
+
+import argparse, math, os, random, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+def build_stream(bpm, quarters, jitter, loop, drop, ramp):
+    # Returns (true pulse time, received timestamp in microseconds, true bpm) for every pulse
+    stream = []
+    now = 1.0
+    for i in range(quarters * 24):
+        tempo = bpm + ramp * i / (quarters * 24)
+        period = 60.0 / tempo / 24
+        if random.random() >= drop:
+            received = now + abs(random.gauss(0.0, jitter)) + random.uniform(0.0, loop)
+            stream.append((now, int(received * 1000000), tempo))
+        now = now + period
+    return stream
+
+def measure(lib, stream, bandwidth):
+    estimator = lib.ClockEstimator(bandwidth=bandwidth)
+    result = {"dll": ([], []), "pulse": ([], []), "quarter": ([], [])}
+    last = None
+    quarter = []
+    settle = 4 * 24
+    for i, (actual, timestamp, tempo) in enumerate(stream):
+        estimator.tick(timestamp & lib.MIDI_TIME_MASK)
+        quarter.append(timestamp)
+        if len(quarter) > 25:
+            quarter.pop(0)
+        if i >= settle and estimator.is_locked():
+            result["dll"][0].append(estimator.get_bpm() - tempo)
+            result["dll"][1].append((timestamp - estimator.get_offset()) / 1000000 - actual)
+            result["pulse"][0].append(60000000 / ((timestamp - last) * 24) - tempo)
+            result["pulse"][1].append(timestamp / 1000000 - actual)
+            result["quarter"][0].append(60000000 / (quarter[-1] - quarter[0]) * (len(quarter) - 1) / 24 - tempo)
+            result["quarter"][1].append(timestamp / 1000000 - actual)
+        last = timestamp
+    return result
+
+def report(name, values):
+    bpm, phase = values
+    phase_mean = sum(phase) / len(phase)
+    phase = [value - phase_mean for value in phase] # Constant delay is not a phase error
+    print("{:<28}{:>10.3f}{:>10.3f}{:>12.3f}{:>12.3f}".format(
+        name,
+        math.sqrt(sum(value * value for value in bpm) / len(bpm)),
+        max(abs(value) for value in bpm),
+        math.sqrt(sum(value * value for value in phase) / len(phase)) * 1000.0,
+        max(abs(value) for value in phase) * 1000.0
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure tempo and phase tracking of the MIDI clock estimator")
+    parser.add_argument("--bpm", type=float, default=120.0)
+    parser.add_argument("--quarters", type=int, default=200)
+    parser.add_argument("--bandwidth", type=float, default=1.0, help="loop bandwidth in Hz")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lib = emulate.setup(realtime_audio=False, seed=args.seed)
+    cases = (
+        ("clean", 0.0, 0.0, 0.0, 0.0),
+        ("1ms gaussian jitter", 0.001, 0.0, 0.0, 0.0),
+        ("3ms loop quantization", 0.0, 0.003, 0.0, 0.0),
+        ("jitter + 2% dropped pulses", 0.001, 0.003, 0.02, 0.0),
+        ("jitter + ramp to +20bpm", 0.001, 0.003, 0.0, 20.0),
+    )
+    for title, jitter, loop, drop, ramp in cases:
+        stream = build_stream(args.bpm, args.quarters, jitter, loop, drop, ramp)
+        result = measure(lib, stream, args.bandwidth)
+        print("\n{}".format(title))
+        print("{:<28}{:>10}{:>10}{:>12}{:>12}".format("estimate", "bpm rms", "bpm max", "phase rms", "phase max"))
+        report("clock estimator", result["dll"])
+        report("last pulse interval", result["pulse"])
+        report("last quarter interval", result["quarter"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# circuitpython-synthio-mono: Dynamic Waveform Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Boots code.py in the emulator, holds a note and modulates the waveform of the
+# first oscillator with the shape lfo (pulse width and morph) and with the mod
+# wheel. Reports the cost of each control rate update, how many updates rewrote
+# the table, whether the note had to be given a new waveform object and the
+# memory allocated per update. The same sweep is repeated by building a new
+# array for every update to show the allocations that in-place rendering avoids;
+# what remains for in-place updates are small objects like slice views and floats.
+#
+# Usage: python3 tools/benchmarks/dynamic_waveform.py [--updates 2000] [--note 48]
+
+import argparse, io, os, sys, time, tracemalloc
+from contextlib import redirect_stdout
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+def configure(parameters, values):
+    for name, value in values:
+        parameter = parameters.get_parameter(name)
+        parameter.set(parameter.get_raw_value(value) if type(value) is str else value)
+
+def sweep(module, oscillator, updates, wheel=None):
+    # Advances the shape lfo by one synthio block per update, or moves the mod wheel from 0 to 127 and back
+    now = oscillator._shape_now
+    waveform = oscillator.note.waveform
+    reassigned = 0
+    start = time.perf_counter_ns()
+    for i in range(updates):
+        now = now + oscillator._shape_update
+        if wheel:
+            module.control_change(1, abs(127 - (i * 4) % 254) / 127.0)
+        else:
+            oscillator.shape_lfo._tick(i)
+            oscillator.update(now)
+        if not oscillator.note.waveform is waveform:
+            reassigned = reassigned + 1
+            waveform = oscillator.note.waveform
+    return (time.perf_counter_ns() - start) / updates / 1000, reassigned
+
+def measure_allocation(update, updates):
+    # Largest amount of memory held by a single update beyond what was held before it, averaged over all updates
+    total = 0
+    tracemalloc.start()
+    for i in range(updates):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        update(i)
+        total = total + tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / updates
+
+def allocate_pulse(oscillator, samples, amplitude):
+    # Previous approach: a new pulse table for every update
+    width = min(max(round((oscillator.pulse_width + oscillator.shape_lfo.value * oscillator.pwm_depth) * samples), 1), samples - 1)
+    oscillator.note.waveform = numpy.concatenate((numpy.ones(width, dtype=numpy.int16) * amplitude, numpy.ones(samples - width, dtype=numpy.int16) * -amplitude))
+
+def count_renders(oscillator, updates):
+    # Replays the lfo to count how many updates changed the quantized table
+    dynamic = oscillator._dynamic
+    renders = 0
+    for i in range(updates):
+        oscillator.shape_lfo._tick(updates + i)
+        table, width, morph_table, morph = dynamic._table, dynamic._width, dynamic._morph_table, dynamic._morph
+        oscillator._render_waveform()
+        if not table is dynamic._table or width != dynamic._width or not morph_table is dynamic._morph_table or morph != dynamic._morph:
+            renders = renders + 1
+    return renders
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure in-place pulse width and morph updates")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--note", type=int, default=48)
+    args = parser.parse_args()
+
+    with redirect_stdout(io.StringIO()):
+        module = emulate.boot(seed=0)
+    parameters = module.parameters
+    oscillator = module.voice.get_voices()[0].oscillators[0]
+    samples = module.waveforms.get_samples()
+    amplitude = module.waveforms.get_amplitude()
+    module.voice.press(args.note, 1.0)
+
+    scenarios = (
+        ("pwm lfo", (("waveform_0", "square"), ("pulse_width_0", 0.5), ("pwm_depth_0", 0.8), ("morph_0", 0.0), ("morph_depth_0", 0.0), ("shape_rate_0", 1.0)), None),
+        ("morph lfo", (("waveform_0", "saw"), ("morph_waveform_0", "sine"), ("pwm_depth_0", 0.0), ("morph_depth_0", 1.0), ("shape_rate_0", 1.0)), None),
+        ("pwm + morph lfo", (("waveform_0", "square"), ("pulse_width_0", 0.3), ("pwm_depth_0", 0.4), ("morph_waveform_0", "saw"), ("morph_depth_0", 0.5)), None),
+        ("mod wheel morph", (("waveform_0", "saw"), ("morph_waveform_0", "square"), ("pwm_depth_0", 0.0), ("morph_depth_0", 0.0), ("mod_parameter", "morph_0")), True),
+    )
+
+    print("\n{:<20}{:>12}{:>10}{:>12}{:>16}".format("scenario", "us/update", "renders", "reassigned", "bytes/update"))
+    for name, values, wheel in scenarios:
+        configure(parameters, values)
+        elapsed, reassigned = sweep(module, oscillator, args.updates, wheel)
+        if wheel:
+            renders = "-"
+            allocated = measure_allocation(lambda i: module.control_change(1, abs(127 - (i * 4) % 254) / 127.0), args.updates)
+        else:
+            renders = count_renders(oscillator, args.updates)
+            allocated = measure_allocation(lambda i: (oscillator.shape_lfo._tick(2 * args.updates + i), oscillator._render_waveform()), args.updates)
+        print("{:<20}{:>12.1f}{:>10}{:>12d}{:>16.1f}".format(name, elapsed, renders, reassigned, allocated))
+
+    configure(parameters, scenarios[0][1])
+    start = time.perf_counter_ns()
+    for i in range(args.updates):
+        oscillator.shape_lfo._tick(i)
+        allocate_pulse(oscillator, samples, amplitude)
+    elapsed = (time.perf_counter_ns() - start) / args.updates / 1000
+    allocated = measure_allocation(lambda i: (oscillator.shape_lfo._tick(i), allocate_pulse(oscillator, samples, amplitude)), args.updates)
+    print("{:<20}{:>12.1f}{:>10}{:>12d}{:>16.1f}".format("pwm new array", elapsed, "-", args.updates, allocated))
+
+    # Band-limited pulse check: duty cycle and dc offset of a static 25% pulse
+    configure(parameters, (("waveform_0", "square"), ("pulse_width_0", 0.25), ("pwm_depth_0", 0.0), ("morph_0", 0.0), ("morph_depth_0", 0.0)))
+    data = numpy.asarray(oscillator.note.waveform, dtype=numpy.float64)
+    print("\n25% pulse: duty {:.3f}, dc {:.1f} of {:d} amplitude".format(float(numpy.mean(data > 0)), float(numpy.mean(data)), amplitude))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# circuitpython-synthio-mono: Keyboard Note Stack Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Plays dense chords through Keyboard with and without the sustain pedal and
+# measures the cost of note on/off including the priority lookup made by each
+# update, and the memory allocated per event. The bitmap note stack is compared
+# against the previous implementation which kept the notes in lists.
+#
+# Usage: python3 tools/benchmarks/keyboard_notes.py [--chords 4,10,24] [--events 20000]
+
+import argparse, os, random, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+class LegacyKeyboard:
+    # Keyboard before the bitmap note stack, only what note on/off and priority need
+    def __init__(self, type="high"):
+        self._type = type
+        self._notes = []
+        self._sustain = False
+        self._sustained = []
+        self._press = None
+        self._release = None
+    def set_press(self, callback):
+        self._press = callback
+    def set_release(self, callback):
+        self._release = callback
+    def set_sustain(self, value):
+        if value != self._sustain:
+            self._sustain = value
+            self._sustained = []
+            if self._sustain:
+                self._sustained = self._notes.copy()
+            self.update()
+    def has_notes(self):
+        return bool(self._sustain and self._sustained) or bool(self._notes)
+    def _get_high(self):
+        if not self.has_notes():
+            return None
+        selected = (0, 0)
+        for note in self._notes:
+            if note[0] > selected[0]:
+                selected = note
+        if self._sustain and self._sustained:
+            for note in self._sustained:
+                if note[0] > selected[0]:
+                    selected = note
+        return selected
+    def _get_last(self):
+        if self._sustain and self._sustained:
+            return self._sustained[-1]
+        if self._notes:
+            return self._notes[-1]
+        return None
+    def append(self, notenum, velocity):
+        self.remove(notenum, False, True)
+        note = (notenum, velocity)
+        self._notes.append(note)
+        if self._sustain:
+            self._sustained.append(note)
+        self.update()
+    def remove(self, notenum, update=True, remove_sustained=False):
+        self._notes = [note for note in self._notes if note[0] != notenum]
+        if remove_sustained and self._sustain and self._sustained:
+            self._sustained = [note for note in self._sustained if note[0] != notenum]
+        if update:
+            self.update()
+    def update(self):
+        note = self._get_high() if self._type == "high" else self._get_last()
+        if not note:
+            self._release()
+        else:
+            self._press(note[0], note[1])
+
+def build_events(chord, count, sustain):
+    # Overlapping chords: each chord is pressed before the previous one is released
+    random.seed(0)
+    events = []
+    previous = []
+    while len(events) < count:
+        root = random.randrange(36, 72)
+        notes = [root + random.randrange(0, 24) for i in range(chord)]
+        if sustain:
+            events.append(("sustain", len(events) // (chord * 4) % 2 == 0, 0))
+        for note in notes:
+            events.append(("on", note, random.randrange(1, 128) / 127))
+        for note in previous:
+            events.append(("off", note, 0))
+        previous = notes
+    return events[:count]
+
+def play(keyboard, events):
+    for kind, value, velocity in events:
+        if kind == "on":
+            keyboard.append(value, velocity)
+        elif kind == "off":
+            keyboard.remove(value)
+        else:
+            keyboard.set_sustain(value)
+
+def measure(keyboard, events):
+    start = time.perf_counter_ns()
+    play(keyboard, events)
+    elapsed = (time.perf_counter_ns() - start) / len(events)
+    # Largest amount of memory held by a single event beyond what was held before it
+    total = 0
+    tracemalloc.start()
+    for event in events[:2000]:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        play(keyboard, (event,))
+        total = total + tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return elapsed, total / min(len(events), 2000)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Keyboard note on/off and priority lookup")
+    parser.add_argument("--chords", default="4,10,24")
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+
+    lib = emulate.setup(realtime_audio=False)
+    print("\n{:<26}{:>12}{:>12}{:>16}{:>16}".format("scenario (ns/event)", "legacy", "bitmap", "legacy bytes", "bitmap bytes"))
+    for chord in [int(value) for value in args.chords.split(",")]:
+        for type in ("high", "last"):
+            for sustain in (False, True):
+                events = build_events(chord, args.events, sustain)
+                legacy = LegacyKeyboard(type)
+                keyboard = lib.Keyboard()
+                keyboard.set_type(keyboard.get_types().index(type))
+                for item in (legacy, keyboard):
+                    item.set_press(lambda notenum, velocity: None)
+                    item.set_release(lambda: None)
+                legacy_time, legacy_bytes = measure(legacy, events)
+                bitmap_time, bitmap_bytes = measure(keyboard, events)
+                name = "{:d} notes, {}{}".format(chord, type, " + sustain" if sustain else "")
+                print("{:<26}{:>12.0f}{:>12.0f}{:>16.1f}{:>16.1f}".format(name, legacy_time, bitmap_time, legacy_bytes, bitmap_bytes))
+
+if __name__ == "__main__":
+    main()
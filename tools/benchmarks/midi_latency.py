@@ -0,0 +1,68 @@
+# circuitpython-synthio-mono: MIDI Latency Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Measures the time from MIDI bytes arriving at the UART to the note on callback
+# while the main loop spends a random amount of time in other subsystems. The
+# legacy 50ms polling interval is compared against draining every iteration.
+#
+# Usage: python3 tools/benchmarks/midi_latency.py [--notes 500] [--load 0.5]
+
+import argparse, math, os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def measure(lib, update, notes, load, interval):
+    import board
+    midi = lib.Midi(uart=True, uart_tx=board.GP4, uart_rx=board.GP5, update=update)
+    sent = {}
+    latencies = []
+    def note_on(note, velocity):
+        latencies.append(time.perf_counter() - sent.pop(note))
+    midi.set_note_on(note_on)
+
+    uart = midi._uart
+    due = time.perf_counter()
+    count = 0
+    while count < notes or sent:
+        now = time.monotonic()
+        if count < notes and time.perf_counter() >= due:
+            note = 36 + count % 48
+            uart.feed(bytes([0x90, note, 100, 0x80, note, 0]))
+            sent[note] = time.perf_counter()
+            count = count + 1
+            due = due + random.uniform(0.5, 1.5) * interval
+        busy(random.uniform(0.0, load))
+        midi.update(now)
+    midi.deinit()
+    return latencies
+
+def report(name, latencies):
+    latencies = sorted(latency * 1000.0 for latency in latencies)
+    mean = sum(latencies) / len(latencies)
+    jitter = math.sqrt(sum((latency - mean) ** 2 for latency in latencies) / len(latencies))
+    print("{:<20}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(name, mean, latencies[int(len(latencies) * 0.99)], latencies[-1], jitter))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure note on latency of the MIDI input")
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--load", type=float, default=0.5, help="maximum milliseconds spent in other subsystems per loop")
+    parser.add_argument("--interval", type=float, default=10.0, help="mean milliseconds between notes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    lib = emulate.setup(realtime_audio=False, seed=args.seed)
+    polled = measure(lib, 0.05, args.notes, args.load / 1000.0, args.interval / 1000.0)
+    drained = measure(lib, 0.0, args.notes, args.load / 1000.0, args.interval / 1000.0)
+    print("\n{:<20}{:>10}{:>10}{:>10}{:>10}".format("latency (ms)", "mean", "p99", "max", "jitter"))
+    report("poll every 50ms", polled)
+    report("drain every loop", drained)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# circuitpython-synthio-mono: MIDI Thru Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Floods the UART input with control changes and clock messages and measures the
+# cost of Midi.update() with thru enabled. A per-message writer, which is how thru
+# used to work, is compared against the batched thru engine with and without a
+# port filter on usb, which passes control changes on channels 1 and 2.
+#
+# Usage: python3 tools/benchmarks/midi_thru.py [--updates 2000]
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+class MessageThru:
+    # Writes every message to every port as soon as it is decoded
+    def __init__(self, ports):
+        self._ports = ports
+        self._buffer = bytearray(3)
+        self._accepted = bytearray(b"\x01" * 256)
+    def is_filtered(self):
+        return True
+    def get_accepted(self):
+        return self._accepted
+    def forward_raw(self, data, count):
+        pass
+    def begin(self, data):
+        pass
+    def forward(self, status, data1, data2, length, start=-1, end=-1):
+        self._buffer[0] = status
+        self._buffer[1] = data1
+        self._buffer[2] = data2
+        for port in self._ports:
+            port.write(self._buffer[:length+1])
+    def end(self):
+        pass
+    def set_enabled(self, index, value):
+        pass
+    def flush(self):
+        pass
+    def deinit(self):
+        pass
+
+def build_flood(size):
+    data = bytearray()
+    i = 0
+    while len(data) < size:
+        data.extend(bytes([0xB0 | (i % 4), 1 + i % 8, i % 128]))
+        if i % 4 == 0:
+            data.append(0xF8)
+        i = i + 1
+    return bytes(data[:size])
+
+def measure(lib, mode, updates, size):
+    import board
+    midi = lib.Midi(uart=True, uart_tx=board.GP4, uart_rx=board.GP5, usb=True)
+    midi.set_thru(True)
+    if mode == "message":
+        midi._thru_ports = MessageThru([midi._uart, midi._usb_out])
+    elif mode == "filtered":
+        midi.set_thru_filter("usb", channels=0x0003, types=lib.MIDI_THRU_ALL & ~lib.MIDI_THRU_SYSTEM)
+    uart = midi._uart
+    flood = build_flood(size)
+    uart.tx_buffer.clear()
+    midi._usb_out.tx_buffer.clear()
+    uart.writes = 0
+    midi._usb_out.writes = 0
+    elapsed = 0.0
+    for i in range(updates):
+        uart.feed(flood)
+        start = time.perf_counter()
+        midi.update()
+        elapsed = elapsed + time.perf_counter() - start
+    writes = uart.writes + midi._usb_out.writes
+    forwarded = len(uart.tx_buffer)
+    filtered = len(midi._usb_out.tx_buffer)
+    midi.deinit()
+    return elapsed / updates, writes / updates, forwarded / updates, filtered / updates
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure MIDI thru cost under a flood of messages")
+    parser.add_argument("--updates", type=int, default=2000)
+    args = parser.parse_args()
+
+    lib = emulate.setup(realtime_audio=False, seed=0)
+    print("\n{:<24}{:>8}{:>14}{:>14}{:>14}{:>14}".format("thru", "bytes", "us/update", "writes", "uart bytes", "usb bytes"))
+    for size in (8, 32, 60):
+        for name, mode in (("per message", "message"), ("batched", "batched"), ("batched + usb filter", "filtered")):
+            cost, writes, forwarded, filtered = measure(lib, mode, args.updates, size)
+            print("{:<24}{:>8d}{:>14.2f}{:>14.2f}{:>14.2f}{:>14.2f}".format(name, size, cost * 1000000.0, writes, forwarded, filtered))
+
+if __name__ == "__main__":
+    main()
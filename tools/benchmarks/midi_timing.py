@@ -0,0 +1,104 @@
+# circuitpython-synthio-mono: MIDI Timing Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Measures how well the relative timing of a fast MIDI passage survives a loaded
+# main loop. Bytes are delivered to the UART from a separate thread at 31250 baud
+# while the loop spends a random amount of time in other subsystems and
+# occasionally stalls. Each note on is compared against the time it was sent;
+# the constant part of that delay is removed so that only timing error remains.
+# Both the time the callback runs and the arrival timestamp estimated by the
+# parser are measured.
+#
+# Usage: python3 tools/benchmarks/midi_timing.py [--notes 400] [--load 2] [--stall 15]
+
+import argparse, math, os, random, sys, threading, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+BYTE_TIME = 10 / 31250
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+def send(uart, events, start):
+    for due, data in events:
+        for byte in data:
+            while time.monotonic() < start + due:
+                time.sleep(0.0001)
+            uart.feed(bytes([byte]))
+            due = due + BYTE_TIME
+
+def measure(lib, events, load, stall, stall_interval):
+    import board
+    midi = lib.Midi(uart=True, uart_tx=board.GP4, uart_rx=board.GP5)
+    received = []
+    stamps = []
+    def note_on(note, velocity):
+        received.append(time.monotonic())
+        stamps.append(midi.get_timestamp())
+    midi.set_note_on(note_on)
+
+    start = time.monotonic() + 0.05
+    thread = threading.Thread(target=send, args=(midi._uart, events, start))
+    thread.start()
+    next_stall = start + stall_interval
+    end = start + events[-1][0] + 0.2
+    while time.monotonic() < end:
+        busy(random.uniform(0.0, load))
+        if time.monotonic() >= next_stall:
+            busy(stall)
+            next_stall = next_stall + random.uniform(0.5, 1.5) * stall_interval
+        midi.update(time.monotonic())
+    thread.join()
+    midi.deinit()
+
+    sent = [start + due for due, data in events if data[0] & 0xF0 == 0x90]
+    count = min(len(sent), len(received))
+    received = get_errors([received[i] - sent[i] for i in range(count)])
+    stamped = []
+    for i in range(count):
+        delay = (stamps[i] - (int(sent[i] * 1000000) & lib.MIDI_TIME_MASK)) & lib.MIDI_TIME_MASK
+        if delay > lib.MIDI_TIME_MASK // 2:
+            delay = delay - lib.MIDI_TIME_MASK - 1
+        stamped.append(delay / 1000000)
+    return received, get_errors(stamped)
+
+def get_errors(delays):
+    offset = sorted(delays)[len(delays) // 2]
+    return [delay - offset for delay in delays], offset
+
+def report(name, errors, offset):
+    errors = sorted(abs(error) * 1000.0 for error in errors)
+    rms = math.sqrt(sum(error * error for error in errors) / len(errors))
+    print("{:<24}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(name, offset * 1000.0, sum(errors) / len(errors), rms, errors[int(len(errors) * 0.99)], errors[-1]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure note timing error of the MIDI input under load")
+    parser.add_argument("--notes", type=int, default=400)
+    parser.add_argument("--interval", type=float, default=31.25, help="milliseconds between notes (default: 16ths at 480bpm)")
+    parser.add_argument("--load", type=float, default=2.0, help="maximum milliseconds spent in other subsystems per loop")
+    parser.add_argument("--stall", type=float, default=15.0, help="milliseconds of an occasional stall such as a display write")
+    parser.add_argument("--stall-interval", type=float, default=250.0, help="mean milliseconds between stalls")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    events = []
+    for i in range(args.notes):
+        note = 36 + i % 48
+        due = i * args.interval / 1000.0
+        events.append((due, bytes([0x90, note, 100])))
+        events.append((due + args.interval / 2000.0, bytes([0x80, note, 0])))
+
+    sys.setswitchinterval(0.0001) # Let the sender thread preempt the busy main loop
+    lib = emulate.setup(realtime_audio=False, seed=args.seed)
+    print("\n{:<24}{:>10}{:>10}{:>10}{:>10}{:>10}".format("timing (ms)", "delay", "mean err", "rms err", "p99 err", "max err"))
+    received, stamped = measure(lib, events, args.load / 1000.0, args.stall / 1000.0, args.stall_interval / 1000.0)
+    report("dispatch on read", *received)
+    report("arrival timestamp", *stamped)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# circuitpython-synthio-mono: Parameter Mapping Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Measures the cost of Parameter.set() for each kind of range. The compiled
+# mappers are compared against the previous implementation which inspected the
+# range type on every call. Values alternate so that every call maps a new value.
+#
+# Usage: python3 tools/benchmarks/parameter_set.py [--calls 100000]
+
+import argparse, os, sys, time, types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+def legacy_set(lib, self, value):
+    # Parameter.set() before ranges were compiled
+    if type(value) is str or type(value) is int:
+        if type(self.range) is dict:
+            value = lib.unmap_dict(value, self.range)
+        elif type(self.range) is list:
+            value = lib.unmap_array(value, self.range)
+        else:
+            return False
+    value = min(max(value, 0.0), 1.0)
+    if hasattr(self, "raw_value") and value == self.raw_value:
+        return False
+    self.raw_value = value
+    if type(self.range) is dict:
+        value = lib.map_dict(value, self.range)
+    elif type(self.range) is list:
+        value = lib.map_array(value, self.range, True)
+    elif type(self.range) is tuple:
+        if len(self.range) == 4:
+            value = lib.map_value_centered(value, self.range[0], self.range[1], self.range[2], self.range[3])
+        elif len(self.range) == 3:
+            value = lib.map_value_centered(value, self.range[0], self.range[1], self.range[2])
+        elif len(self.range) == 2:
+            value = lib.map_value(value, self.range[0], self.range[1])
+    elif type(self.range) is int or type(self.range) is float:
+        value = lib.map_value(value, -self.range, self.range)
+    elif type(self.range) is bool:
+        value = lib.map_boolean(value)
+    self.format_value = value
+    if self.set_callback:
+        if self.set_argument:
+            self.set_callback(value, self.set_argument)
+        else:
+            self.set_callback(value)
+    return True
+
+def measure(function, values, calls):
+    count = len(values)
+    start = time.perf_counter_ns()
+    for i in range(calls):
+        function(values[i % count])
+    return (time.perf_counter_ns() - start) / calls
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Parameter.set() cost per range kind")
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+
+    lib = emulate.setup(realtime_audio=False)
+    ranges = (
+        ("linear float", (0.0, 1.0)),
+        ("linear int", (0, 127)),
+        ("centered", (0.0, 1.0, 4.0)),
+        ("centered threshold", (-1.0, 0.0, 1.0, 0.05)),
+        ("+/- int", 12),
+        ("boolean", True),
+        ("list", ["sine", "saw", "square", "triangle", "noise"]),
+        ("dict", {"low": 0, "high": 1, "band": 2}),
+    )
+    values = [i / 127 for i in range(128)]
+    print("\n{:<24}{:>12}{:>12}{:>10}".format("range (ns/op)", "legacy", "compiled", "speedup"))
+    for name, value in ranges:
+        parameter = lib.Parameter(name=name, range=value, set_callback=lambda value: None)
+        previous = types.SimpleNamespace(range=value, set_callback=lambda value: None, set_argument=None)
+        legacy = measure(lambda value: legacy_set(lib, previous, value), values, args.calls)
+        compiled = measure(lambda value: parameter.set(value), values, args.calls)
+        print("{:<24}{:>12.1f}{:>12.1f}{:>9.2f}x".format(name, legacy, compiled, legacy / compiled))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# circuitpython-synthio-mono: Patch Load Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Boots code.py on a copy of the patches directory and measures how long a patch
+# switch takes and how much memory it allocates when the patch is parsed from JSON
+# and when it is read from the binary patch bank. Both paths apply the values in a
+# single parameter transaction, so the difference is the cost of reading the patch.
+# The patch cache is disabled so that every load reads the file.
+#
+# Usage: python3 tools/benchmarks/patch_load.py [--loads 200] [--patches 0] [--root .]
+
+import argparse, io, os, shutil, sys, tempfile, time, tracemalloc
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+def measure(patches, indexes, loads):
+    times = []
+    allocated = 0
+    for i in range(loads):
+        index = indexes[i % len(indexes)]
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter_ns()
+        with redirect_stdout(io.StringIO()): # read_json prints every file it reads
+            patches.read(index)
+        times.append(time.perf_counter_ns() - start)
+        allocated = allocated + tracemalloc.get_traced_memory()[1] - before
+    times.sort()
+    return (sum(times) / len(times) / 1000, times[len(times) * 99 // 100] / 1000, allocated / loads)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and patch bank load times")
+    parser.add_argument("--loads", type=int, default=200)
+    parser.add_argument("--patches", type=int, default=0, help="number of patch copies to cycle through (default: every patch)")
+    parser.add_argument("--root", default=emulate.ROOT_DIR, help="directory with the patches to load")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="synthio-mono-")
+    try:
+        shutil.copy(os.path.join(emulate.ROOT_DIR, "midi.json"), directory)
+        os.mkdir(os.path.join(directory, "patches"))
+        sources = sorted(filename for filename in os.listdir(os.path.join(args.root, "patches")) if filename.endswith(".json"))
+        count = max(args.patches, len(sources))
+        for index in range(count):
+            source = sources[index % len(sources)]
+            shutil.copy(os.path.join(args.root, "patches", source), os.path.join(directory, "patches", "{:02d}-{}".format(index, source[3:])))
+
+        with redirect_stdout(io.StringIO()):
+            device = emulate.boot(directory, os.path.join(emulate.ROOT_DIR, "settings.toml"), ("PATCH_BANK=1", "PATCH_CACHE=0"))
+        patches = device.patches
+        indexes = [index for index in range(count)]
+        bank = patches._bank
+        tracemalloc.start()
+
+        results = []
+        patches._bank = None
+        bank_ids = patches._bank_ids
+        patches._bank_ids = None # has_bank() is false without the preallocated arrays
+        results.append(("json", measure(patches, indexes, args.loads)))
+        patches._bank = bank
+        patches._bank_ids = bank_ids
+        results.append(("bank", measure(patches, indexes, args.loads)))
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print("\n{:d} patches, {:d} parameters, {:d} loads".format(count, device.parameters.get_parameter_count(), args.loads))
+    print("{:<8}{:>12}{:>12}{:>16}".format("format", "mean us", "p99 us", "bytes/load"))
+    for name, (mean, p99, allocated) in results:
+        print("{:<8}{:>12.1f}{:>12.1f}{:>16.0f}".format(name, mean, p99, allocated))
+    print("speedup {:.2f}x".format(results[0][1][0] / results[1][1][0]))
+
+if __name__ == "__main__":
+    main()
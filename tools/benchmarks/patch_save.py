@@ -0,0 +1,124 @@
+# circuitpython-synthio-mono: Patch Save Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Boots code.py on a copy of the patches directory, changes a few parameters and
+# saves the patch over itself repeatedly. Reports the time and the number of bytes
+# written to the filesystem per save for full JSON saves and for delta saves to the
+# patch bank, checks that every save reads back after a reboot and that a save
+# interrupted between its renames leaves the previous patch in place.
+#
+# Usage: python3 tools/benchmarks/patch_save.py [--saves 12] [--changes 2]
+
+import argparse, builtins, io, os, random, shutil, sys, tempfile, time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+import _device
+
+class CountingFile:
+    def __init__(self, file, counter):
+        self._file = file
+        self._counter = counter
+    def write(self, data):
+        count = self._file.write(data)
+        self._counter[0] = self._counter[0] + (count or 0)
+        return count
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        return self._file.__exit__(*args)
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+def prepare():
+    directory = tempfile.mkdtemp(prefix="synthio-mono-")
+    shutil.copy(os.path.join(emulate.ROOT_DIR, "midi.json"), directory)
+    shutil.copytree(os.path.join(emulate.ROOT_DIR, "patches"), os.path.join(directory, "patches"), ignore=shutil.ignore_patterns("bank.bin"))
+    return directory
+
+def boot(directory, bank):
+    with redirect_stdout(io.StringIO()):
+        return emulate.boot(directory, os.path.join(emulate.ROOT_DIR, "settings.toml"), ("PATCH_BANK={:d}".format(bank),))
+
+def get_values(device):
+    # Patch values so that enumerations compare by name rather than by their exact raw value
+    return dict((parameter.name, parameter.get_patch_value()) for parameter in device.parameters.get_parameters() if parameter.patch)
+
+def change(device, count):
+    parameters = [parameter for parameter in device.parameters.get_parameters() if parameter.patch and parameter.name != "mod_parameter"]
+    for parameter in random.sample(parameters, count):
+        parameter.set(random.random())
+
+def measure(directory, bank, args):
+    device = boot(directory, bank)
+    patches = device.patches
+    name = patches.get_name(0)
+    counter = [0]
+    open = builtins.open
+    builtins.open = lambda *items, **kwargs: CountingFile(open(*items, **kwargs), counter)
+    times = []
+    written = []
+    try:
+        for i in range(args.saves):
+            if i % 4 != 3: # Every fourth save has nothing to write
+                change(device, args.changes)
+            counter[0] = 0
+            start = time.perf_counter_ns()
+            with redirect_stdout(io.StringIO()):
+                patches.save(0, name)
+            times.append((time.perf_counter_ns() - start) / 1000)
+            written.append(counter[0])
+    finally:
+        builtins.open = open
+    expected = get_values(device)
+    actual = get_values(boot(directory, bank))
+    mismatches = [key for key in expected if expected[key] != actual.get(key)]
+    return times, written, mismatches
+
+def interrupt(directory):
+    # Fails the rename of the new patch after the previous one was moved aside
+    device = boot(directory, False)
+    expected = get_values(device)
+    change(device, 4)
+    rename = _device.overrides["os"].rename
+    def failing_rename(old, new):
+        if old.endswith(".tmp"):
+            raise OSError("power lost")
+        rename(old, new)
+    _device.overrides["os"].rename = failing_rename
+    try:
+        with redirect_stdout(io.StringIO()):
+            result = device.patches.save(0, device.patches.get_name(0))
+    finally:
+        _device.overrides["os"].rename = rename
+    actual = get_values(boot(directory, False))
+    return result, [key for key in expected if expected[key] != actual.get(key)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure patch save cost and check that saves are crash-safe")
+    parser.add_argument("--saves", type=int, default=12)
+    parser.add_argument("--changes", type=int, default=2, help="parameters changed between saves")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print("\n{:<16}{:>12}{:>12}{:>14}{:>14}{:>12}".format("format", "mean us", "max us", "mean bytes", "max bytes", "readback"))
+    for title, bank in (("json", False), ("bank + delta", True)):
+        directory = prepare()
+        try:
+            times, written, mismatches = measure(directory, bank, args)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print("{:<16}{:>12.1f}{:>12.1f}{:>14.0f}{:>14d}{:>12}".format(title, sum(times) / len(times), max(times), sum(written) / len(written), max(written), "ok" if not mismatches else "{:d} differ".format(len(mismatches))))
+
+    directory = prepare()
+    try:
+        result, mismatches = interrupt(directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    print("\nInterrupted save: {}, previous patch {}".format("reported failure" if not result else "reported success", "intact" if not mismatches else "damaged ({:d} parameters differ)".format(len(mismatches))))
+
+if __name__ == "__main__":
+    main()
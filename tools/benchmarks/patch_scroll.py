@@ -0,0 +1,81 @@
+# circuitpython-synthio-mono: Patch Scroll Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Boots code.py with a directory of patch copies and scrolls the patch parameter
+# like the encoder does: one detent every --detent seconds with main loop
+# iterations in between that give the patch cache idle time to prefetch. Reports
+# the patch cache hit rate and the worst main loop stall on a detent and while
+# idle (prefetching or applying a debounced patch) for each configuration.
+#
+# Usage: python3 tools/benchmarks/patch_scroll.py [--patches 16] [--detents 64] [--detent 0.08] [--loop 0.005]
+
+import argparse, io, os, shutil, sys, tempfile, time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+import _device
+
+def prepare(count):
+    directory = tempfile.mkdtemp(prefix="synthio-mono-")
+    shutil.copy(os.path.join(emulate.ROOT_DIR, "midi.json"), directory)
+    os.mkdir(os.path.join(directory, "patches"))
+    sources = sorted(filename for filename in os.listdir(os.path.join(emulate.ROOT_DIR, "patches")) if filename.endswith(".json"))
+    for index in range(count):
+        source = sources[index % len(sources)]
+        shutil.copy(os.path.join(emulate.ROOT_DIR, "patches", source), os.path.join(directory, "patches", "{:02d}-{}".format(index, source[3:])))
+    return directory
+
+def scroll(directory, overrides, args):
+    with redirect_stdout(io.StringIO()):
+        device = emulate.boot(directory, os.path.join(emulate.ROOT_DIR, "settings.toml"), overrides)
+    clock = _device.clock
+    patches = device.patches
+    parameter = device.parameters.get_parameter("patch")
+    loops = max(int(args.detent / args.loop), 1)
+    direction = 1
+    detents = []
+    idle = []
+    with redirect_stdout(io.StringIO()): # read_json prints every file it reads
+        for i in range(args.detents + int(1.0 / args.loop)):
+            for j in range(loops if i < args.detents else 1):
+                start = time.perf_counter_ns()
+                detent = i < args.detents and j == 0
+                if detent:
+                    # Scroll back and forth across every patch
+                    if not (parameter.increment() if direction > 0 else parameter.decrement()):
+                        direction = -direction
+                        parameter.increment() if direction > 0 else parameter.decrement()
+                patches.update(clock.now)
+                (detents if detent else idle).append((time.perf_counter_ns() - start) / 1000)
+                clock.advance(args.loop)
+    return patches.get_cache_stats(), sum(detents) / len(detents), max(detents), max(idle)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure main loop stalls while scrolling through patches")
+    parser.add_argument("--patches", type=int, default=16)
+    parser.add_argument("--detents", type=int, default=64)
+    parser.add_argument("--detent", type=float, default=0.08, help="seconds between encoder detents")
+    parser.add_argument("--loop", type=float, default=0.005, help="seconds per main loop iteration")
+    args = parser.parse_args()
+
+    configs = (
+        ("json, no cache", ("PATCH_BANK=0", "PATCH_CACHE=0", "PATCH_DEBOUNCE=0")),
+        ("json, cache", ("PATCH_BANK=0", "PATCH_CACHE=4", "PATCH_DEBOUNCE=0")),
+        ("json, cache, debounce", ("PATCH_BANK=0", "PATCH_CACHE=4", "PATCH_DEBOUNCE=25")),
+        ("bank, no cache", ("PATCH_BANK=1", "PATCH_CACHE=0", "PATCH_DEBOUNCE=0")),
+        ("bank, cache", ("PATCH_BANK=1", "PATCH_CACHE=4", "PATCH_DEBOUNCE=0")),
+        ("bank, cache, debounce", ("PATCH_BANK=1", "PATCH_CACHE=4", "PATCH_DEBOUNCE=25")),
+    )
+    print("\n{:<24}{:>7}{:>7}{:>10}{:>16}{:>16}{:>14}".format("config", "loads", "hits", "hit rate", "detent mean us", "detent max us", "idle max us"))
+    for name, overrides in configs:
+        directory = prepare(args.patches)
+        try:
+            stats, mean, detent, idle = scroll(directory, overrides, args)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print("{:<24}{:>7d}{:>7d}{:>9.1f}%{:>16.1f}{:>16.1f}{:>14.1f}".format(name, stats["hits"] + stats["misses"], stats["hits"], stats["hit_rate"] * 100, mean, detent, idle))
+
+if __name__ == "__main__":
+    main()
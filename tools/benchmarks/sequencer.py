@@ -0,0 +1,66 @@
+# circuitpython-synthio-mono: Step Sequencer Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Fills a Sequencer with random notes, gates, ties and rests and plays it through
+# the arpeggiator's "sequence" type while a key is held, with every update due on
+# a new step. Reports the cost and the memory allocated per step next to the
+# arpeggiator types, and the size of the step buffer which is saved with patches.
+#
+# Usage: python3 tools/benchmarks/sequencer.py [--length 64] [--steps 20000]
+
+import argparse, os, random, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+def build(lib, type, length):
+    sequencer = lib.Sequencer(length=length)
+    random.seed(0)
+    for i in range(length):
+        sequencer.set_step(i, random.randrange(48, 72), random.randrange(1, 128) / 127, random.uniform(0.1, 1.0), random.random() < 0.2, random.random() < 0.1)
+    arpeggiator = lib.Arpeggiator()
+    arpeggiator.set_sequencer(sequencer)
+    arpeggiator.set_type(type)
+    arpeggiator.set_press(lambda notenum, velocity: None)
+    arpeggiator.set_release(lambda notenum=None: None)
+    for notenum in (60, 64, 67):
+        arpeggiator.append_note(notenum, 1.0)
+    arpeggiator.enable()
+    return arpeggiator, sequencer
+
+def measure(arpeggiator, steps):
+    # Every update is on the next step
+    now = arpeggiator._start
+    start = time.perf_counter_ns()
+    for i in range(steps):
+        arpeggiator.update(now)
+        now = now + arpeggiator._step_time
+    elapsed = (time.perf_counter_ns() - start) / steps
+    total = 0
+    tracemalloc.start()
+    for i in range(2000):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        arpeggiator.update(now)
+        now = now + arpeggiator._step_time
+        total = total + tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return elapsed, total / 2000
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure step sequencer playback")
+    parser.add_argument("--length", type=int, default=64)
+    parser.add_argument("--steps", type=int, default=20000)
+    args = parser.parse_args()
+
+    lib = emulate.setup(realtime_audio=False)
+    print("\n{:<12}{:>12}{:>14}".format("type", "ns/step", "bytes/step"))
+    for type in ("up", "updown", "pinky", "sequence"):
+        arpeggiator, sequencer = build(lib, type, args.length)
+        elapsed, allocated = measure(arpeggiator, args.steps)
+        print("{:<12}{:>12.0f}{:>14.1f}".format(type, elapsed, allocated))
+    print("\nStep buffer: {:d} bytes for {:d} steps".format(len(sequencer.get_data()), lib.SEQUENCER_STEPS))
+
+if __name__ == "__main__":
+    main()
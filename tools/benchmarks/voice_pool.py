@@ -0,0 +1,94 @@
+# circuitpython-synthio-mono: Voice Pool Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Measures the cost of each voice of a VoicePool with the stub synthio modules of
+# the emulator. Audio buffers are rendered with every voice idle and with every
+# voice holding a note, so the per-voice cost of the synthio blocks and of the
+# notes themselves can be told apart, along with the control rate update of the
+# pool. Then the pool is played in realtime with every voice held and the
+# governor's load estimate, voice limit and the number of underruns are traced.
+#
+# Usage: python3 tools/benchmarks/voice_pool.py [--voices 1,2,4,8] [--buffers 200] [--duration 5] [--target 0.7]
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+import _device
+
+def build(lib, count, governor=None):
+    audio = lib.Audio(type="i2s")
+    synth = lib.Synth(audio)
+    waveforms = lib.Waveforms()
+    pool = lib.VoicePool(synth, waveforms, count=count, governor=governor)
+    pool.set_waveform("saw")
+    pool.set_filter_frequency(2000.0)
+    return audio, pool
+
+def measure_render(output, frames, buffers):
+    start = time.perf_counter()
+    for i in range(buffers):
+        output.render(frames)
+    return (time.perf_counter() - start) / buffers * 1000
+
+def measure_update(pool, updates):
+    now = time.monotonic()
+    start = time.perf_counter_ns()
+    for i in range(updates):
+        now = now + 0.01
+        pool.update(now)
+    return (time.perf_counter_ns() - start) / updates / 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-voice cost and the voice governor")
+    parser.add_argument("--voices", default="1,2,4,8")
+    parser.add_argument("--buffers", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--target", type=float, default=0.7)
+    args = parser.parse_args()
+
+    print("\n{:<8}{:>14}{:>14}{:>12}{:>16}{:>14}".format("voices", "idle ms/buf", "held ms/buf", "% of buf", "ms/held voice", "update us"))
+    single = None
+    for count in [int(value) for value in args.voices.split(",")]:
+        lib = emulate.setup(realtime_audio=False)
+        audio, pool = build(lib, count)
+        output = _device.outputs[-1]
+        frames = audio.get_buffer_size() // 4
+        period = audio.get_buffer_duration() * 1000
+        idle = measure_render(output, frames, args.buffers)
+        for i in range(count):
+            pool.press(48 + i * 3, 1.0)
+        held = measure_render(output, frames, args.buffers)
+        update = measure_update(pool, args.buffers)
+        if single is None:
+            single = idle
+        print("{:<8d}{:>14.3f}{:>14.3f}{:>11.1f}%{:>16.3f}{:>14.1f}".format(count, idle, held, held / period * 100, (held - single) / count, update))
+        pool.deinit()
+
+    count = max([int(value) for value in args.voices.split(",")])
+    lib = emulate.setup(realtime_audio=True)
+    governor = lib.VoiceGovernor(count, target=args.target, window=0.5)
+    audio, pool = build(lib, count, governor)
+    output = _device.outputs[-1]
+    print("\nGovernor: {:d} voices, {:.0f}% target".format(count, args.target * 100))
+    print("{:<8}{:>10}{:>8}{:>8}{:>12}".format("time", "load", "limit", "active", "underruns"))
+    start = time.monotonic()
+    report = start
+    note = 0
+    while time.monotonic() - start < args.duration:
+        now = time.monotonic()
+        # Hold as many notes as the governor allows
+        if pool.get_active() < pool.get_limit():
+            pool.press(36 + note % 48, 1.0)
+            note = note + 1
+        pool.update(now)
+        if now >= report + 0.5:
+            report = now
+            stats = pool.get_stats()
+            print("{:<8.1f}{:>9.1f}%{:>8d}{:>8d}{:>12d}".format(now - start, stats["load"] * 100, stats["limit"], stats["active"], output.underruns))
+        time.sleep(0.001)
+    pool.report()
+
+if __name__ == "__main__":
+    main()
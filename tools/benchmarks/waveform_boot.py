@@ -0,0 +1,77 @@
+# circuitpython-synthio-mono: Waveform Boot Benchmark
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Writes a directory of random mono wav files and measures how long building the
+# waveform list takes at boot: resampling every file up front as before, reading
+# only the selected waveforms, and reading them from the resampled waveform cache
+# when it has to be built, when it is valid and when one file has changed. Cached
+# tables are checked against freshly resampled ones.
+#
+# Usage: python3 tools/benchmarks/waveform_boot.py [--waves 32] [--selected 2] [--samples 256]
+
+import argparse, io, os, random, shutil, struct, sys, tempfile, time, wave
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import emulate
+
+def write_waves(directory, count):
+    os.mkdir(os.path.join(directory, "waveforms"))
+    for i in range(count):
+        frames = random.randint(600, 4000)
+        with wave.open(os.path.join(directory, "waveforms", "wave{:02d}.wav".format(i)), "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(22050)
+            file.writeframes(struct.pack("<{:d}h".format(frames), *[random.randint(-20000, 20000) for j in range(frames)]))
+
+def measure(lib, args, cache, selected):
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        waveforms = lib.Waveforms(args.samples, args.amplitude, cache=cache)
+        for name in selected:
+            waveforms.get_data(name)
+    return (time.perf_counter() - start) * 1000, waveforms
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure custom waveform loading at boot")
+    parser.add_argument("--waves", type=int, default=32)
+    parser.add_argument("--selected", type=int, default=2, help="custom waveforms selected by the loaded patch")
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--amplitude", type=int, default=12000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    directory = tempfile.mkdtemp(prefix="synthio-mono-")
+    try:
+        write_waves(directory, args.waves)
+        lib = emulate.setup(directory, os.path.join(emulate.ROOT_DIR, "settings.toml"), realtime_audio=False)
+        names = ["wave{:02d}".format(i) for i in range(args.waves)]
+        selected = names[:args.selected]
+        cache = "/waveforms/cache.bin"
+
+        results = []
+        results.append(("resample all (previous)",) + measure(lib, args, None, names))
+        results.append(("resample selected",) + measure(lib, args, None, selected))
+        results.append(("cache build",) + measure(lib, args, cache, selected))
+        results.append(("cache valid",) + measure(lib, args, cache, selected))
+        path = os.path.join(directory, "waveforms", "wave{:02d}.wav".format(args.waves - 1))
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        results.append(("cache, 1 file changed",) + measure(lib, args, cache, selected))
+
+        reference = results[0][2]
+        cached = measure(lib, args, cache, names)[1]
+        differences = sum(1 for name in names if (reference.get_data(name) != cached.get_data(name)).any())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print("\n{:d} waveforms, {:d} samples, {:d} selected".format(args.waves, args.samples, args.selected))
+    print("{:<28}{:>10}".format("boot", "ms"))
+    for name, elapsed, waveforms in results:
+        print("{:<28}{:>10.2f}".format(name, elapsed))
+    print("Cached tables matching resampled tables: {:d}/{:d}".format(args.waves - differences, args.waves))
+
+if __name__ == "__main__":
+    main()
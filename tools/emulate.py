@@ -0,0 +1,143 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Runs code.py (or any device script) on a Linux host using the stand-in modules
+# in tools/emulator. Device paths such as /patches are mapped onto the project
+# directory and os.getenv reads settings.toml just like CircuitPython.
+#
+# Usage: python3 tools/emulate.py [script] [--duration 10] [--set AUDIO_RATE=44100]
+
+import argparse, os, random, signal, sys, time, tracemalloc, types, wave
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TOOLS_DIR)
+EMULATOR_DIR = os.path.join(TOOLS_DIR, "emulator")
+
+if not EMULATOR_DIR in sys.path:
+    sys.path.insert(0, EMULATOR_DIR)
+
+import _device
+
+def get_library_sources(root=ROOT_DIR):
+    # Read the source list from the Makefile so the emulated library is built in the same order
+    variables = {}
+    with open(os.path.join(root, "Makefile"), "r") as file:
+        for line in file:
+            if "=" in line and not line.startswith("\t"):
+                key, value = line.split("=", 1)
+                variables[key.strip(" :")] = value.strip()
+    sources = variables.get("LIB_SRCS", "")
+    for key in variables:
+        sources = sources.replace("$(" + key + ")", variables[key])
+    return [os.path.join(root, path) for path in sources.split()]
+
+def setup(root=ROOT_DIR, settings=None, overrides=(), realtime_audio=True, seed=None, clock=None):
+    _device.root = os.path.abspath(root)
+    _device.realtime_audio = realtime_audio
+    if clock:
+        _device.use_clock(clock)
+    _device.load_settings(settings or os.path.join(_device.root, "settings.toml"))
+    for item in overrides:
+        key, value = item.split("=", 1)
+        parsed = _device._parse_value(value)
+        _device.settings[key] = value if parsed is None else parsed
+    if not seed is None:
+        random.seed(seed)
+    library = _device.build_library(get_library_sources(ROOT_DIR))
+    _device.reset_heap()
+    return library
+
+class BootComplete(Exception):
+    pass
+
+def boot(root=ROOT_DIR, settings=None, overrides=(), seed=None, script=None):
+    # Runs code.py up to the first iteration of its main loop and returns the script's
+    # module so tools can use the device objects it created
+    script = os.path.abspath(script or os.path.join(ROOT_DIR, "code.py"))
+    def tick(clock):
+        raise BootComplete()
+    setup(root, settings, overrides, False, seed, _device.VirtualClock(script, tick))
+    module = types.ModuleType("__main__")
+    module.__file__ = script
+    try:
+        _device.execute(script, module)
+    except BootComplete:
+        pass
+    return module
+
+def get_output_stats():
+    stats = {}
+    for output in _device.outputs:
+        for key, value in output.get_stats().items():
+            stats[key] = stats.get(key, 0) + value
+    return stats
+
+class WaveSink:
+    def __init__(self, path):
+        self._path = path
+        self._chunks = []
+    def __call__(self, data):
+        self._chunks.append(data.tobytes())
+    def save(self, sample_rate, channel_count):
+        with wave.open(self._path, "wb") as file:
+            file.setnchannels(channel_count)
+            file.setsampwidth(2)
+            file.setframerate(sample_rate)
+            file.writeframes(b"".join(self._chunks))
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a synthio-mono script on the host")
+    parser.add_argument("script", nargs="?", default=os.path.join(ROOT_DIR, "code.py"))
+    parser.add_argument("--root", default=ROOT_DIR, help="directory emulating the CIRCUITPY drive")
+    parser.add_argument("--settings", default=None, help="settings.toml path (default: <root>/settings.toml)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a settings.toml value")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run before interrupting the script")
+    parser.add_argument("--no-audio", action="store_true", help="do not render audio in the background")
+    parser.add_argument("--wav", default=None, help="write rendered audio to a wav file")
+    parser.add_argument("--tracemalloc", action="store_true", help="report memory allocations of device code")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    sink = WaveSink(args.wav) if args.wav else None
+    start = time.perf_counter()
+    setup(args.root, args.settings, args.set, not args.no_audio, args.seed)
+    _device.sink = sink
+
+    signal.signal(signal.SIGALRM, _interrupt)
+    signal.setitimer(signal.ITIMER_REAL, args.duration)
+    try:
+        _device.execute(os.path.abspath(args.script))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    elapsed = time.perf_counter() - start
+
+    print("\n:: Emulation Report ::")
+    print("Wall time: {:.3f}s".format(elapsed))
+    stats = get_output_stats()
+    if stats.get("buffers"):
+        print("Audio: {:.3f}s rendered in {:d} buffers, {:d} underruns".format(stats["audio_time"], stats["buffers"], stats["underruns"]))
+        print("Render: {:.3f}s total, {:.3f}ms max per buffer, {:.1f}% of realtime".format(stats["render_time"], stats["render_max"] * 1000, stats["render_time"] / stats["audio_time"] * 100 if stats["audio_time"] else 0.0))
+    if sink and _device.outputs:
+        mixer = _device.outputs[0]._source
+        sink.save(mixer.sample_rate, mixer.channel_count)
+        print("Wrote {}".format(args.wav))
+
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        print("Memory: {:d} bytes allocated, {:d} bytes peak".format(current, peak))
+        sources = get_library_sources() + [os.path.abspath(args.script)]
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, path) for path in sources])
+        for stat in snapshot.statistics("lineno")[:10]:
+            print("  {}".format(stat))
+
+if __name__ == "__main__":
+    main()
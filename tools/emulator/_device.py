@@ -0,0 +1,180 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Shared state of the emulated device: the CIRCUITPY filesystem root, settings.toml
+# values, and the sandboxed builtins that device code is executed with.
+
+import builtins, gc, os as _os, sys, time, types, tracemalloc
+
+root = _os.getcwd()
+settings = {}
+heap_size = 200000 # Approximate RP2040 heap available to user code
+heap_base = 0 # Host allocations made before device code started
+
+realtime_audio = True
+sink = None
+outputs = []
+uarts = []
+
+# Filesystem
+
+def remap(path):
+    if type(path) is str and path.startswith("/") and not path.startswith(root):
+        return root + path
+    return path
+
+def open(path, mode="r", *args, **kwargs):
+    return builtins.open(remap(path), mode, *args, **kwargs)
+
+# Settings
+
+def _parse_value(value):
+    value = value.strip()
+    if value.startswith("\"") or value.startswith("'"):
+        quote = value[0]
+        end = value.find(quote, 1)
+        if end < 0:
+            return None
+        return value[1:end].encode("utf-8").decode("unicode_escape")
+    if "#" in value:
+        value = value[:value.index("#")].strip()
+    try:
+        return int(value, 0)
+    except ValueError:
+        return None
+
+def load_settings(path):
+    settings.clear()
+    try:
+        with builtins.open(path, "r") as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith("#") or line.startswith("[") or not "=" in line:
+                    continue
+                key, value = line.split("=", 1)
+                value = _parse_value(value)
+                if not value is None:
+                    settings[key.strip()] = value
+    except OSError:
+        print("Failed to read settings: {}".format(path))
+    return settings
+
+def getenv(key, default=None):
+    return settings.get(key, default)
+
+# Modules
+
+def _build_os():
+    mod = types.ModuleType("os")
+    for name in ("sep", "urandom", "getcwd", "uname"):
+        if hasattr(_os, name):
+            setattr(mod, name, getattr(_os, name))
+    mod.getenv = getenv
+    mod.listdir = lambda path=".": _os.listdir(remap(path))
+    mod.stat = lambda path: _os.stat(remap(path))
+    mod.remove = lambda path: _os.remove(remap(path))
+    mod.rename = lambda old, new: _os.rename(remap(old), remap(new))
+    mod.mkdir = lambda path: _os.mkdir(remap(path))
+    mod.rmdir = lambda path: _os.rmdir(remap(path))
+    mod.chdir = lambda path: _os.chdir(remap(path))
+    mod.sync = getattr(_os, "sync", lambda: None)
+    return mod
+
+def mem_alloc():
+    if not tracemalloc.is_tracing():
+        return 0
+    return max(tracemalloc.get_traced_memory()[0] - heap_base, 0)
+def mem_free():
+    return max(heap_size - mem_alloc(), 0)
+
+def reset_heap():
+    global heap_base
+    heap_base = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+def _build_gc():
+    mod = types.ModuleType("gc")
+    for name in ("collect", "enable", "disable", "isenabled"):
+        setattr(mod, name, getattr(gc, name))
+    mod.mem_alloc = mem_alloc
+    mod.mem_free = mem_free
+    return mod
+
+# Clock
+
+class VirtualClock:
+    # Simulated time for offline rendering. Every call to time.monotonic() from the
+    # top level of the running script (the main loop of code.py) counts as one loop
+    # iteration and gives the host a chance to inject input, render audio and
+    # advance the clock through the tick callback.
+    def __init__(self, script=None, tick=None):
+        self.now = 0.0
+        self.script = script
+        self.tick = tick
+        self.iterations = 0
+    def monotonic(self):
+        if self.tick:
+            frame = sys._getframe(1)
+            if frame.f_code.co_name == "<module>" and (self.script is None or frame.f_code.co_filename == self.script):
+                self.iterations = self.iterations + 1
+                self.tick(self)
+        return self.now
+    def monotonic_ns(self):
+        return int(self.monotonic() * 1000000000)
+    def sleep(self, seconds):
+        self.now = self.now + max(seconds, 0.0)
+    def advance(self, seconds):
+        self.now = self.now + seconds
+
+clock = None
+
+def monotonic():
+    if clock:
+        return clock.now
+    return time.monotonic()
+
+def use_clock(value):
+    global clock
+    clock = value
+    mod = types.ModuleType("time")
+    for name in ("time", "localtime", "mktime", "struct_time"):
+        setattr(mod, name, getattr(time, name))
+    mod.monotonic = clock.monotonic
+    mod.monotonic_ns = clock.monotonic_ns
+    mod.sleep = clock.sleep
+    overrides["time"] = mod
+
+def _import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level == 0 and name in overrides:
+        return overrides[name]
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+overrides = {
+    "os": _build_os(),
+    "gc": _build_gc(),
+}
+
+def get_builtins():
+    sandbox = dict(builtins.__dict__)
+    sandbox["open"] = open
+    sandbox["__import__"] = _import
+    return sandbox
+
+def execute(path, module=None, name="__main__"):
+    if module is None:
+        module = types.ModuleType(name)
+        module.__file__ = path
+    module.__dict__["__builtins__"] = get_builtins()
+    with builtins.open(path, "r") as file:
+        source = file.read()
+    exec(compile(source, path, "exec"), module.__dict__)
+    return module
+
+def build_library(paths, name="synthio_mono"):
+    # Mirrors the Makefile: every source file is evaluated into a single module namespace
+    module = types.ModuleType(name)
+    module.__file__ = name + ".py"
+    sys.modules[name] = module
+    for path in paths:
+        execute(path, module)
+    return module
@@ -0,0 +1,97 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Audio output shared by the I2S and PWM stand-ins. In realtime mode a background
+# thread pulls one mixer buffer per buffer period, mimicking the DMA interrupt of
+# the device, and counts underruns whenever rendering falls behind the clock.
+# Otherwise the host drives rendering explicitly through render().
+
+import threading, time
+import _device
+
+class AudioOut:
+    def __init__(self):
+        self.sink = _device.sink
+        self.frames = 0
+        self.buffers = 0
+        self.underruns = 0
+        self.render_time = 0.0
+        self.render_max = 0.0
+        self._source = None
+        self._paused = False
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+        _device.outputs.append(self)
+
+    @property
+    def playing(self):
+        return not self._source is None
+    @property
+    def paused(self):
+        return self._paused
+
+    def play(self, sample, *, loop=False):
+        self._source = sample
+        if _device.realtime_audio and self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+    def stop(self):
+        self._source = None
+    def pause(self):
+        self._paused = True
+    def resume(self):
+        self._paused = False
+
+    def render(self, frames):
+        source = self._source
+        if source is None or self._paused:
+            return None
+        with self._lock:
+            start = time.perf_counter()
+            data = source._render(frames)
+            duration = time.perf_counter() - start
+            self.frames = self.frames + frames
+            self.buffers = self.buffers + 1
+            self.render_time = self.render_time + duration
+            self.render_max = max(self.render_max, duration)
+        if self.sink:
+            self.sink(data)
+        return data
+
+    def get_stats(self):
+        sample_rate = getattr(self._source, "sample_rate", 0)
+        return {
+            "frames": self.frames,
+            "buffers": self.buffers,
+            "underruns": self.underruns,
+            "render_time": self.render_time,
+            "render_max": self.render_max,
+            "audio_time": self.frames / sample_rate if sample_rate else 0.0,
+        }
+
+    def _run(self):
+        deadline = time.perf_counter()
+        while self._running:
+            source = self._source
+            if source is None:
+                time.sleep(0.01)
+                deadline = time.perf_counter()
+                continue
+            frames = source.get_buffer_frames() if hasattr(source, "get_buffer_frames") else 1024
+            self.render(frames)
+            deadline = deadline + frames / source.sample_rate
+            delay = deadline - time.perf_counter()
+            if delay > 0.0:
+                time.sleep(delay)
+            else:
+                self.underruns = self.underruns + 1
+                deadline = time.perf_counter()
+
+    def deinit(self):
+        self._running = False
+        self._source = None
+        if self in _device.outputs:
+            _device.outputs.remove(self)
@@ -0,0 +1,49 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Character LCD that keeps its contents in memory so headless runs can inspect it.
+
+class Character_LCD_Mono:
+    LEFT_TO_RIGHT = 0
+    RIGHT_TO_LEFT = 1
+
+    def __init__(self, rs, en, db4, db5, db6, db7, columns, lines, backlight_pin=None, backlight_inverted=False):
+        self.columns = columns
+        self.lines = lines
+        self.cursor = False
+        self.blink = False
+        self.display = True
+        self.text_direction = self.LEFT_TO_RIGHT
+        self.backlight = True
+        self._row = 0
+        self._column = 0
+        self.clear()
+
+    def clear(self):
+        self.buffer = [[" "] * self.columns for i in range(self.lines)]
+        self._row = 0
+        self._column = 0
+
+    def home(self):
+        self.cursor_position(0, 0)
+
+    def cursor_position(self, column, row):
+        self._column = min(max(column, 0), self.columns - 1)
+        self._row = min(max(row, 0), self.lines - 1)
+
+    @property
+    def message(self):
+        return "\n".join("".join(row) for row in self.buffer)
+    @message.setter
+    def message(self, message):
+        column = self._column
+        row = self._row
+        for character in message:
+            if character == "\n":
+                row = row + 1
+                column = self._column
+                continue
+            if row < self.lines and column < self.columns:
+                self.buffer[row][column] = character
+            column = column + 1
@@ -0,0 +1,95 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+import _device
+
+class Debouncer:
+    def __init__(self, io, interval=0.010):
+        self._io = io
+        self.interval = interval
+        self._state = self._read()
+        self._last_state = self._state
+        self._changed = 0.0
+        self._duration = 0.0
+        self._last_duration = 0.0
+
+    def _read(self):
+        if callable(self._io):
+            return bool(self._io())
+        return bool(self._io.value)
+
+    def update(self, new_state=None):
+        now = _device.monotonic()
+        self._last_state = self._state
+        if new_state is None:
+            new_state = self._read()
+        if new_state != self._state and now - self._changed >= self.interval:
+            self._last_duration = now - self._changed
+            self._changed = now
+            self._state = new_state
+
+    @property
+    def value(self):
+        return self._state
+    @property
+    def rose(self):
+        return self._state and not self._last_state
+    @property
+    def fell(self):
+        return not self._state and self._last_state
+    @property
+    def last_duration(self):
+        return self._last_duration
+    @property
+    def current_duration(self):
+        return _device.monotonic() - self._changed
+
+class Button(Debouncer):
+    def __init__(self, pin, short_duration_ms=200, long_duration_ms=500, value_when_pressed=False, **kwargs):
+        super().__init__(pin, **kwargs)
+        self.short_duration_ms = short_duration_ms
+        self.long_duration_ms = long_duration_ms
+        self.value_when_pressed = value_when_pressed
+        self._short_count = 0
+        self._short_counter = 0
+        self._long_triggered = False
+        self._long_press = False
+        self._last_change = 0.0
+
+    def update(self, new_state=None):
+        super().update(new_state)
+        now = _device.monotonic()
+        self._long_press = False
+        self._short_count = 0
+        if self.pressed:
+            self._long_triggered = False
+            self._last_change = now
+        elif self.released:
+            if not self._long_triggered and (now - self._last_change) * 1000 < self.short_duration_ms:
+                self._short_counter = self._short_counter + 1
+            self._last_change = now
+        if self.value == self.value_when_pressed:
+            if not self._long_triggered and (now - self._last_change) * 1000 >= self.long_duration_ms:
+                self._long_triggered = True
+                self._long_press = True
+                self._short_counter = 0
+        elif self._short_counter and (now - self._last_change) * 1000 >= self.short_duration_ms:
+            self._short_count = self._short_counter
+            self._short_counter = 0
+
+    @property
+    def pressed(self):
+        return self.rose if self.value_when_pressed else self.fell
+    @property
+    def released(self):
+        return self.fell if self.value_when_pressed else self.rose
+    @property
+    def is_pressed(self):
+        return self.value == self.value_when_pressed
+    @property
+    def long_press(self):
+        return self._long_press
+    @property
+    def short_count(self):
+        return self._short_count
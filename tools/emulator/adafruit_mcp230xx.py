@@ -0,0 +1,5 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Imported by the display driver only, no functionality is required on the host.
@@ -0,0 +1,39 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+from .midi_message import MIDIMessage
+
+class MIDI:
+    def __init__(self, midi_in=None, midi_out=None, *, in_channel=None, out_channel=0, in_buf_size=30, debug=False):
+        self._midi_in = midi_in
+        self._midi_out = midi_out
+        self.in_channel = in_channel
+        self.out_channel = out_channel
+        self._in_buf_size = in_buf_size
+        self._in_buf = bytearray()
+        self._debug = debug
+
+    def receive(self):
+        if self._midi_in and len(self._in_buf) < self._in_buf_size:
+            data = self._midi_in.read(self._in_buf_size - len(self._in_buf))
+            if data:
+                self._in_buf.extend(data)
+        msg, consumed = MIDIMessage.from_message_bytes(self._in_buf, self.in_channel)
+        if consumed:
+            del self._in_buf[:consumed]
+        return msg
+
+    def send(self, msg, channel=None):
+        if channel is None:
+            channel = self.out_channel
+        if type(msg) is list:
+            data = bytearray()
+            for item in msg:
+                item.channel = channel
+                data.extend(bytes(item))
+        else:
+            msg.channel = channel
+            data = bytes(msg)
+        if self._midi_out:
+            self._midi_out.write(data)
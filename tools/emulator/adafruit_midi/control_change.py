@@ -0,0 +1,25 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+from .midi_message import MIDIMessage
+
+class ControlChange(MIDIMessage):
+    STATUS = 0xB0
+    MASK = 0xF0
+    LENGTH = 3
+    CHANNEL_MASK = 0x0F
+
+    def __init__(self, control, value, *, channel=None):
+        super().__init__(channel=channel)
+        self.control = control
+        self.value = value
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[1], data[2])
+
+    def _data(self):
+        return bytes([self.control & 0x7F, self.value & 0x7F])
+
+ControlChange.register_message_type()
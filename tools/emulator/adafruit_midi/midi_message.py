@@ -0,0 +1,76 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+class MIDIMessage:
+    STATUS = 0x00
+    MASK = 0xFF
+    LENGTH = 1
+    CHANNEL_MASK = None
+
+    _messages = []
+
+    def __init__(self, *, channel=None):
+        self.channel = channel
+
+    @classmethod
+    def register_message_type(cls):
+        if not cls in MIDIMessage._messages:
+            MIDIMessage._messages.append(cls)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls()
+
+    def _data(self):
+        return b""
+
+    def __bytes__(self):
+        status = self.STATUS
+        if not self.CHANNEL_MASK is None:
+            status = status | ((self.channel or 0) & self.CHANNEL_MASK)
+        return bytes([status]) + self._data()
+
+    @staticmethod
+    def match(status):
+        for message in MIDIMessage._messages:
+            if status & message.MASK == message.STATUS:
+                return message
+        return None
+
+    @staticmethod
+    def from_message_bytes(buffer, channel_in):
+        # Returns (message or None, bytes consumed). A None message with no bytes
+        # consumed means the buffer holds an incomplete message.
+        index = 0
+        while index < len(buffer):
+            status = buffer[index]
+            if status < 0x80:
+                index = index + 1
+                continue
+            message = MIDIMessage.match(status)
+            length = message.LENGTH if message else 1
+            if status == 0xF0:
+                end = buffer.find(0xF7, index)
+                if end < 0:
+                    return None, index
+                return None, end + 1
+            if index + length > len(buffer):
+                return None, index
+            consumed = index + length
+            if message is None:
+                return None, consumed
+            msg = message.from_bytes(buffer[index:consumed])
+            if not message.CHANNEL_MASK is None:
+                msg.channel = status & message.CHANNEL_MASK
+                if not _channel_match(msg.channel, channel_in):
+                    return None, consumed
+            return msg, consumed
+        return None, index
+
+def _channel_match(channel, channel_in):
+    if channel_in is None:
+        return True
+    if type(channel_in) is int:
+        return channel == channel_in
+    return channel in channel_in
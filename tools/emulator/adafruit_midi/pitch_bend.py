@@ -0,0 +1,24 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+from .midi_message import MIDIMessage
+
+class PitchBend(MIDIMessage):
+    STATUS = 0xE0
+    MASK = 0xF0
+    LENGTH = 3
+    CHANNEL_MASK = 0x0F
+
+    def __init__(self, pitch_bend, *, channel=None):
+        super().__init__(channel=channel)
+        self.pitch_bend = pitch_bend
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[2] << 7 | data[1])
+
+    def _data(self):
+        return bytes([self.pitch_bend & 0x7F, (self.pitch_bend >> 7) & 0x7F])
+
+PitchBend.register_message_type()
@@ -0,0 +1,25 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+from .midi_message import MIDIMessage
+
+class PolyphonicKeyPressure(MIDIMessage):
+    STATUS = 0xA0
+    MASK = 0xF0
+    LENGTH = 3
+    CHANNEL_MASK = 0x0F
+
+    def __init__(self, note, pressure, *, channel=None):
+        super().__init__(channel=channel)
+        self.note = note
+        self.pressure = pressure
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[1], data[2])
+
+    def _data(self):
+        return bytes([self.note & 0x7F, self.pressure & 0x7F])
+
+PolyphonicKeyPressure.register_message_type()
@@ -0,0 +1,24 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+from .midi_message import MIDIMessage
+
+class ProgramChange(MIDIMessage):
+    STATUS = 0xC0
+    MASK = 0xF0
+    LENGTH = 2
+    CHANNEL_MASK = 0x0F
+
+    def __init__(self, patch, *, channel=None):
+        super().__init__(channel=channel)
+        self.patch = patch
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[1])
+
+    def _data(self):
+        return bytes([self.patch & 0x7F])
+
+ProgramChange.register_message_type()
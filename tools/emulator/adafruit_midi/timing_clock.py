@@ -0,0 +1,13 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+from .midi_message import MIDIMessage
+
+class TimingClock(MIDIMessage):
+    STATUS = 0xF8
+    MASK = 0xFF
+    LENGTH = 1
+    CHANNEL_MASK = None
+
+TimingClock.register_message_type()
@@ -0,0 +1,13 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# adafruit_wave mirrors the standard library wave reader
+
+import wave
+import _device
+
+def open(f, mode="rb"):
+    if type(f) is str:
+        f = _device.open(f, mode)
+    return wave.open(f, mode)
@@ -0,0 +1,12 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+from _output import AudioOut
+
+class I2SOut(AudioOut):
+    def __init__(self, bit_clock, word_select, data, *, main_clock=None, left_justified=False):
+        super().__init__()
+        self.bit_clock = bit_clock
+        self.word_select = word_select
+        self.data = data
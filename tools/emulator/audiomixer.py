@@ -0,0 +1,53 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+import numpy
+
+class MixerVoice:
+    def __init__(self):
+        self.level = 1.0
+        self.loop = False
+        self._source = None
+    @property
+    def playing(self):
+        return not self._source is None
+    def play(self, sample, *, loop=False):
+        self._source = sample
+        self.loop = loop
+    def stop(self):
+        self._source = None
+
+class Mixer:
+    def __init__(self, voice_count=2, buffer_size=1024, channel_count=2, bits_per_sample=16, samples_signed=True, sample_rate=8000):
+        self.voice_count = voice_count
+        self.buffer_size = buffer_size
+        self.channel_count = channel_count
+        self.bits_per_sample = bits_per_sample
+        self.samples_signed = samples_signed
+        self.sample_rate = sample_rate
+        self.voice = tuple(MixerVoice() for i in range(voice_count))
+
+    @property
+    def playing(self):
+        return any(voice.playing for voice in self.voice)
+
+    def get_buffer_frames(self):
+        # buffer_size is expressed in bytes
+        return max(self.buffer_size // (self.channel_count * self.bits_per_sample // 8), 1)
+
+    def _render(self, frames):
+        mix = numpy.zeros(frames * self.channel_count, dtype=numpy.float64)
+        for voice in self.voice:
+            if voice._source is None:
+                continue
+            mix += voice._source._render(frames) * voice.level
+        return numpy.clip(mix, -32768, 32767).astype(numpy.int16)
+
+    def play(self, sample, *, voice=0, loop=False):
+        self.voice[voice].play(sample, loop=loop)
+    def stop_voice(self, voice=0):
+        self.voice[voice].stop()
+    def deinit(self):
+        for voice in self.voice:
+            voice.stop()
@@ -0,0 +1,11 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+from _output import AudioOut
+
+class PWMAudioOut(AudioOut):
+    def __init__(self, left_channel, *, right_channel=None, quiescent_value=0x8000):
+        super().__init__()
+        self.left_channel = left_channel
+        self.right_channel = right_channel
@@ -0,0 +1,22 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Raspberry Pi Pico pin names
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+    def __repr__(self):
+        return "board.{}".format(self.name)
+
+for _i in range(29):
+    globals()["GP{:d}".format(_i)] = Pin("GP{:d}".format(_i))
+del _i
+
+LED = globals()["GP25"]
+SMPS_MODE = globals()["GP23"]
+VBUS_SENSE = globals()["GP24"]
+A0 = globals()["GP26"]
+A1 = globals()["GP27"]
+A2 = globals()["GP28"]
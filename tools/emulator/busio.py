@@ -0,0 +1,57 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# UART with an in-memory receive buffer. Host tools inject incoming bytes with
+# feed() and inspect outgoing bytes through the tx buffer.
+
+import _device
+
+class UART:
+    def __init__(self, tx=None, rx=None, *, baudrate=9600, bits=8, parity=None, stop=1, timeout=1, receiver_buffer_size=64):
+        self.tx = tx
+        self.rx = rx
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.receiver_buffer_size = receiver_buffer_size
+        self.rx_buffer = bytearray()
+        self.tx_buffer = bytearray()
+        self.writes = 0
+        self.overflows = 0
+        _device.uarts.append(self)
+
+    def feed(self, data):
+        self.rx_buffer.extend(data)
+        # Bytes beyond the hardware ring buffer are dropped like on the device
+        overflow = len(self.rx_buffer) - self.receiver_buffer_size
+        if overflow > 0:
+            self.overflows = self.overflows + overflow
+            del self.rx_buffer[:overflow]
+
+    @property
+    def in_waiting(self):
+        return len(self.rx_buffer)
+    def read(self, nbytes=None):
+        if not self.rx_buffer:
+            return None
+        if nbytes is None:
+            nbytes = len(self.rx_buffer)
+        data = bytes(self.rx_buffer[:nbytes])
+        del self.rx_buffer[:nbytes]
+        return data
+    def readinto(self, buf):
+        nbytes = min(len(buf), len(self.rx_buffer))
+        if not nbytes:
+            return None
+        buf[:nbytes] = self.rx_buffer[:nbytes]
+        del self.rx_buffer[:nbytes]
+        return nbytes
+    def write(self, buf):
+        self.tx_buffer.extend(buf)
+        self.writes = self.writes + 1
+        return len(buf)
+    def reset_input_buffer(self):
+        self.rx_buffer = bytearray()
+    def deinit(self):
+        if self in _device.uarts:
+            _device.uarts.remove(self)
@@ -0,0 +1,44 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+class Direction:
+    INPUT = 0
+    OUTPUT = 1
+
+class Pull:
+    UP = 0
+    DOWN = 1
+
+class DriveMode:
+    PUSH_PULL = 0
+    OPEN_DRAIN = 1
+
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.drive_mode = DriveMode.PUSH_PULL
+        self.value = False
+        self._pull = None
+    @property
+    def pull(self):
+        return self._pull
+    @pull.setter
+    def pull(self, value):
+        # An idle input rests at the level of its pull resistor
+        self._pull = value
+        self.value = value == Pull.UP
+    def switch_to_output(self, value=False, drive_mode=DriveMode.PUSH_PULL):
+        self.direction = Direction.OUTPUT
+        self.drive_mode = drive_mode
+        self.value = value
+    def switch_to_input(self, pull=None):
+        self.direction = Direction.INPUT
+        self.pull = pull
+    def deinit(self):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.deinit()
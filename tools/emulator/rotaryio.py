@@ -0,0 +1,12 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+class IncrementalEncoder:
+    def __init__(self, pin_a, pin_b, divisor=4):
+        self.pin_a = pin_a
+        self.pin_b = pin_b
+        self.divisor = divisor
+        self.position = 0
+    def deinit(self):
+        pass
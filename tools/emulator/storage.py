@@ -0,0 +1,6 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+def remount(mount_path, readonly=False, *, disable_concurrent_write_protection=False):
+    pass
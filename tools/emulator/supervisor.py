@@ -0,0 +1,27 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# The host terminal stands in for the serial console
+
+import select, sys, time
+
+class _Runtime:
+    usb_connected = True
+    serial_connected = True
+    @property
+    def serial_bytes_available(self):
+        try:
+            return len(select.select([sys.stdin], [], [], 0)[0]) > 0
+        except (OSError, ValueError):
+            return False
+
+runtime = _Runtime()
+
+_start = time.monotonic()
+
+def ticks_ms():
+    return int((time.monotonic() - _start) * 1000) & 0x3FFFFFFF
+
+def reload():
+    pass
@@ -0,0 +1,407 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Subset of CircuitPython's synthio module. Blocks (LFO, Math) and envelopes are
+# advanced once per block of BLOCK_SIZE samples like the native implementation.
+
+import math, threading
+import numpy
+
+BLOCK_SIZE = 256
+
+_block_duration = BLOCK_SIZE / 48000
+
+def midi_to_hz(midi_note):
+    return 440.0 * math.pow(2.0, (midi_note - 69) / 12.0)
+def voct_to_hz(ctrl):
+    return 440.0 * math.pow(2.0, ctrl - 0.75)
+
+def _resolve(value, tick):
+    if isinstance(value, _Block):
+        return value._tick(tick)
+    return float(value)
+
+class _Block:
+    def __init__(self):
+        self._last_tick = -1
+        self._value = 0.0
+    @property
+    def value(self):
+        return self._value
+    def _tick(self, tick):
+        if tick != self._last_tick:
+            self._last_tick = tick
+            self._value = self._compute(tick)
+        return self._value
+    def _compute(self, tick):
+        return self._value
+
+# LFO
+
+_TRIANGLE = numpy.array([0, 32767, 0, -32767], dtype=numpy.int16)
+
+class LFO(_Block):
+    def __init__(self, waveform=None, *, rate=1.0, scale=1.0, offset=0.0, phase_offset=0.0, once=False, interpolate=True):
+        super().__init__()
+        self.waveform = waveform
+        self.rate = rate
+        self.scale = scale
+        self.offset = offset
+        self.phase_offset = phase_offset
+        self.once = once
+        self.interpolate = interpolate
+        self._accum = 0.0
+    @property
+    def phase(self):
+        return self._accum
+    def retrigger(self):
+        self._accum = 0.0
+        self._last_tick = -1
+    def _compute(self, tick):
+        rate = _resolve(self.rate, tick)
+        accum = self._accum + rate * _block_duration
+        if self.once:
+            accum = min(max(accum, 0.0), 1.0)
+        else:
+            accum = accum - math.floor(accum)
+        self._accum = accum
+
+        waveform = _TRIANGLE if self.waveform is None else self.waveform
+        length = len(waveform)
+        phase = accum + _resolve(self.phase_offset, tick)
+        if not self.once or phase < 0.0 or phase > 1.0:
+            phase = phase - math.floor(phase)
+        scaled = phase * (length - 1 if self.once else length)
+        index = min(int(scaled), length - 1)
+        value = float(waveform[index])
+        if self.interpolate:
+            next_index = index + 1
+            if next_index >= length:
+                next_index = index if self.once else 0
+            value = value + (float(waveform[next_index]) - value) * (scaled - index)
+        return value / 32768.0 * _resolve(self.scale, tick) + _resolve(self.offset, tick)
+
+# Math
+
+class MathOperation:
+    SUM = 0
+    ADD_SUB = 1
+    PRODUCT = 2
+    MUL_DIV = 3
+    SCALE_OFFSET = 4
+    OFFSET_SCALE = 5
+    LERP = 6
+    CONSTRAINED_LERP = 7
+    DIV_ADD = 8
+    ADD_DIV = 9
+    MID = 10
+    MAX = 11
+    MIN = 12
+    ABS = 13
+
+def _divide(a, b):
+    return a / b if b else 0.0
+
+_OPERATIONS = {
+    MathOperation.SUM: lambda a, b, c: a + b + c,
+    MathOperation.ADD_SUB: lambda a, b, c: a + b - c,
+    MathOperation.PRODUCT: lambda a, b, c: a * b * c,
+    MathOperation.MUL_DIV: lambda a, b, c: _divide(a * b, c),
+    MathOperation.SCALE_OFFSET: lambda a, b, c: a * b + c,
+    MathOperation.OFFSET_SCALE: lambda a, b, c: (a + b) * c,
+    MathOperation.LERP: lambda a, b, c: a * (1.0 - c) + b * c,
+    MathOperation.CONSTRAINED_LERP: lambda a, b, c: a + (b - a) * min(max(c, 0.0), 1.0),
+    MathOperation.DIV_ADD: lambda a, b, c: _divide(a, b) + c,
+    MathOperation.ADD_DIV: lambda a, b, c: _divide(a + b, c),
+    MathOperation.MID: lambda a, b, c: sorted((a, b, c))[1],
+    MathOperation.MAX: lambda a, b, c: max(a, b, c),
+    MathOperation.MIN: lambda a, b, c: min(a, b, c),
+    MathOperation.ABS: lambda a, b, c: abs(a),
+}
+
+class Math(_Block):
+    def __init__(self, operation, a, b=0.0, c=1.0):
+        super().__init__()
+        self.operation = operation
+        self.a = a
+        self.b = b
+        self.c = c
+    def _compute(self, tick):
+        return _OPERATIONS[self.operation](_resolve(self.a, tick), _resolve(self.b, tick), _resolve(self.c, tick))
+
+# Envelope
+
+class Envelope:
+    def __init__(self, *, attack_time=0.1, decay_time=0.05, release_time=0.2, attack_level=1.0, sustain_level=0.8):
+        self.attack_time = attack_time
+        self.decay_time = decay_time
+        self.release_time = release_time
+        self.attack_level = attack_level
+        self.sustain_level = sustain_level
+
+_DEFAULT_ENVELOPE = Envelope(attack_time=0.0, decay_time=0.0, release_time=0.0, attack_level=1.0, sustain_level=1.0)
+
+_ATTACK, _DECAY, _SUSTAIN, _RELEASE = range(4)
+
+class EnvelopeState:
+    ATTACK = "attack"
+    DECAY = "decay"
+    SUSTAIN = "sustain"
+    RELEASE = "release"
+
+class _EnvelopeState:
+    def __init__(self):
+        self.state = _ATTACK
+        self.level = 0.0
+    def press(self):
+        self.state = _ATTACK
+    def release(self):
+        self.state = _RELEASE
+    def step(self, envelope, dt):
+        if self.state == _ATTACK:
+            if envelope.attack_time > 0.0:
+                self.level = self.level + envelope.attack_level * dt / envelope.attack_time
+            else:
+                self.level = envelope.attack_level
+            if self.level >= envelope.attack_level:
+                self.level = envelope.attack_level
+                self.state = _DECAY
+        elif self.state == _DECAY:
+            if envelope.decay_time > 0.0:
+                step = abs(envelope.attack_level - envelope.sustain_level) * dt / envelope.decay_time
+            else:
+                step = 1.0
+            if self.level > envelope.sustain_level:
+                self.level = max(self.level - step, envelope.sustain_level)
+            else:
+                self.level = min(self.level + step, envelope.sustain_level)
+            if self.level == envelope.sustain_level:
+                self.state = _SUSTAIN
+        elif self.state == _SUSTAIN:
+            self.level = envelope.sustain_level
+        else: # _RELEASE
+            peak = max(envelope.attack_level, envelope.sustain_level, 0.001)
+            if envelope.release_time > 0.0:
+                self.level = max(self.level - peak * dt / envelope.release_time, 0.0)
+            else:
+                self.level = 0.0
+        return self.level
+    def finished(self):
+        return self.state == _RELEASE and self.level <= 0.0
+
+# Filter
+
+class Biquad:
+    def __init__(self, b0, b1, b2, a1, a2):
+        self.b0 = b0
+        self.b1 = b1
+        self.b2 = b2
+        self.a1 = a1
+        self.a2 = a2
+
+class FilterMode:
+    LOW_PASS = 0
+    HIGH_PASS = 1
+    BAND_PASS = 2
+    NOTCH = 3
+
+_FILTER_KINDS = ("lpf", "hpf", "bpf", "notch")
+
+class BlockBiquad:
+    # Filter whose cutoff and Q are block inputs, recalculated every block
+    def __init__(self, mode, frequency, Q=0.7071067811865475):
+        self.mode = mode
+        self.frequency = frequency
+        self.Q = Q
+
+def _build_biquad(kind, frequency, Q, sample_rate):
+    w0 = 2.0 * math.pi * min(max(frequency, 1.0), sample_rate * 0.499) / sample_rate
+    s = math.sin(w0)
+    c = math.cos(w0)
+    alpha = s / (2.0 * max(Q, 0.001))
+    if kind == "lpf":
+        b0 = (1.0 - c) / 2.0
+        b1 = 1.0 - c
+        b2 = b0
+    elif kind == "hpf":
+        b0 = (1.0 + c) / 2.0
+        b1 = -(1.0 + c)
+        b2 = b0
+    elif kind == "notch":
+        b0 = 1.0
+        b1 = -2.0 * c
+        b2 = 1.0
+    else: # "bpf"
+        b0 = alpha
+        b1 = 0.0
+        b2 = -alpha
+    a0 = 1.0 + alpha
+    return Biquad(b0 / a0, b1 / a0, b2 / a0, -2.0 * c / a0, (1.0 - alpha) / a0)
+
+# Note
+
+_SQUARE = numpy.array([32767] * 8 + [-32767] * 8, dtype=numpy.int16)
+
+class Note:
+    def __init__(self, frequency, *, panning=0.0, waveform=None, envelope=None, amplitude=1.0, bend=0.0, filter=None, ring_frequency=0.0, ring_bend=0.0, ring_waveform=None):
+        self.frequency = frequency
+        self.panning = panning
+        self.waveform = waveform
+        self.envelope = envelope
+        self.amplitude = amplitude
+        self.bend = bend
+        self.filter = filter
+        self.ring_frequency = ring_frequency
+        self.ring_bend = ring_bend
+        self.ring_waveform = ring_waveform
+
+class _Channel:
+    def __init__(self, note):
+        self.note = note
+        self.phase = 0.0
+        self.envelope = _EnvelopeState()
+        self.filter_state = [0.0, 0.0, 0.0, 0.0]
+        self.tick = -1
+
+    def begin_block(self, tick, sample_rate, envelope):
+        note = self.note
+        if not note.envelope is None:
+            envelope = note.envelope
+        self.tick = tick
+        self.start_level = self.envelope.level
+        self.end_level = self.envelope.step(envelope, _block_duration)
+        self.amplitude = _resolve(note.amplitude, tick)
+        self.increment = note.frequency * math.pow(2.0, _resolve(note.bend, tick)) / sample_rate
+        self.panning = min(max(_resolve(note.panning, tick), -1.0), 1.0)
+        self.filter = note.filter
+        if isinstance(self.filter, BlockBiquad):
+            self.filter = _build_biquad(_FILTER_KINDS[self.filter.mode], _resolve(self.filter.frequency, tick), _resolve(self.filter.Q, tick), sample_rate)
+
+    def render(self, mix, offset):
+        note = self.note
+        frames = mix.shape[0]
+        waveform = _SQUARE if note.waveform is None else note.waveform
+        length = len(waveform)
+        increment = self.increment * length
+        phases = (self.phase + increment * numpy.arange(frames)) % length
+        self.phase = (self.phase + increment * frames) % length
+
+        positions = (numpy.arange(frames) + offset) / BLOCK_SIZE
+        levels = (self.start_level + (self.end_level - self.start_level) * positions) * self.amplitude
+        samples = numpy.asarray(waveform, dtype=numpy.float64)[phases.astype(numpy.int32)] * levels
+
+        if not self.filter is None:
+            samples = self._filter(samples, self.filter)
+
+        mix[:, 0] += samples * (1.0 if self.panning <= 0.0 else 1.0 - self.panning)
+        if mix.shape[1] > 1:
+            mix[:, 1] += samples * (1.0 if self.panning >= 0.0 else 1.0 + self.panning)
+
+    def _filter(self, samples, biquad):
+        b0, b1, b2, a1, a2 = biquad.b0, biquad.b1, biquad.b2, biquad.a1, biquad.a2
+        x1, x2, y1, y2 = self.filter_state
+        output = samples.tolist()
+        for i in range(len(output)):
+            x0 = output[i]
+            y0 = b0 * x0 + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+            x2, x1 = x1, x0
+            y2, y1 = y1, y0
+            output[i] = y0
+        self.filter_state = [x1, x2, y1, y2]
+        return numpy.array(output)
+
+# Synthesizer
+
+class Synthesizer:
+    def __init__(self, *, sample_rate=11025, channel_count=1, waveform=None, envelope=None):
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.bits_per_sample = 16
+        self.waveform = waveform
+        self.envelope = envelope
+        self._envelope = envelope if not envelope is None else _DEFAULT_ENVELOPE
+        self.blocks = []
+        self._channels = []
+        self._lock = threading.Lock()
+        self._tick = 0
+        self._offset = 0
+
+    @property
+    def pressed(self):
+        return tuple(channel.note for channel in self._channels if channel.envelope.state != _RELEASE)
+
+    def _find(self, note):
+        for channel in self._channels:
+            if channel.note is note:
+                return channel
+        return None
+
+    def press(self, press=()):
+        if isinstance(press, Note):
+            press = (press,)
+        with self._lock:
+            for note in press:
+                channel = self._find(note)
+                if channel is None:
+                    self._channels.append(_Channel(note))
+                elif channel.envelope.state == _RELEASE:
+                    channel.envelope.press()
+    def release(self, release=()):
+        if isinstance(release, Note):
+            release = (release,)
+        with self._lock:
+            for note in release:
+                channel = self._find(note)
+                if channel:
+                    channel.envelope.release()
+    def release_all(self):
+        with self._lock:
+            for channel in self._channels:
+                channel.envelope.release()
+    def release_then_press(self, release=(), press=()):
+        self.release(release)
+        self.press(press)
+    def note_info(self, note):
+        channel = self._find(note)
+        if channel is None:
+            return (None, 0.0)
+        return ((EnvelopeState.ATTACK, EnvelopeState.DECAY, EnvelopeState.SUSTAIN, EnvelopeState.RELEASE)[channel.envelope.state], channel.envelope.level)
+
+    def low_pass_filter(self, frequency, Q=0.7071067811865475):
+        return _build_biquad("lpf", frequency, Q, self.sample_rate)
+    def high_pass_filter(self, frequency, Q=0.7071067811865475):
+        return _build_biquad("hpf", frequency, Q, self.sample_rate)
+    def band_pass_filter(self, frequency, Q=0.7071067811865475):
+        return _build_biquad("bpf", frequency, Q, self.sample_rate)
+
+    def _begin_block(self):
+        global _block_duration
+        _block_duration = BLOCK_SIZE / self.sample_rate
+        self._channels = [channel for channel in self._channels if not channel.envelope.finished()]
+        self._tick = self._tick + 1
+        for block in tuple(self.blocks):
+            block._tick(self._tick)
+        for channel in self._channels:
+            channel.begin_block(self._tick, self.sample_rate, self._envelope)
+
+    def _render(self, frames):
+        mix = numpy.zeros((frames, self.channel_count), dtype=numpy.float64)
+        with self._lock:
+            position = 0
+            while position < frames:
+                if not self._offset:
+                    self._begin_block()
+                length = min(BLOCK_SIZE - self._offset, frames - position)
+                for channel in self._channels:
+                    if channel.tick != self._tick:
+                        channel.begin_block(self._tick, self.sample_rate, self._envelope)
+                    channel.render(mix[position:position+length], self._offset)
+                position = position + length
+                self._offset = (self._offset + length) % BLOCK_SIZE
+        return numpy.clip(mix, -32768, 32767).astype(numpy.int16).reshape(-1)
+
+    def deinit(self):
+        with self._lock:
+            self._channels = []
+            self.blocks = []
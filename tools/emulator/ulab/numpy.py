@@ -0,0 +1,8 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# ulab.numpy is a subset of NumPy, so the host simply exposes NumPy itself.
+
+from numpy import *
+from numpy import pi, e, inf, nan
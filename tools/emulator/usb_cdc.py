@@ -0,0 +1,11 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+console = None
+data = None
+
+def enable(*, console=True, data=False):
+    pass
+def disable():
+    pass
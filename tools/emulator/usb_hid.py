@@ -0,0 +1,8 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+def enable(devices=None, boot_device=0):
+    pass
+def disable():
+    pass
@@ -0,0 +1,19 @@
+# circuitpython-synthio-mono: Host Emulation
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+import busio
+
+class PortIn(busio.UART):
+    def __init__(self):
+        super().__init__(receiver_buffer_size=512)
+
+class PortOut(busio.UART):
+    pass
+
+ports = (PortIn(), PortOut())
+
+def enable():
+    pass
+def disable():
+    pass
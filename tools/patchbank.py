@@ -0,0 +1,48 @@
+# circuitpython-synthio-mono: Patch Bank Converter
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Converts the JSON patches of a CIRCUITPY drive into the binary patch bank read
+# at boot (patches/bank.bin) or exports bank slots back to JSON. Parameter ids are
+# taken from the parameters registered by code.py so the bank matches the firmware.
+#
+# Usage: python3 tools/patchbank.py build [--root .]
+#        python3 tools/patchbank.py export [--root .] [--index 0] [--output dir]
+
+import argparse, json, os
+
+import emulate
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or export the synthio-mono patch bank")
+    parser.add_argument("command", choices=("build", "export"))
+    parser.add_argument("--root", default=emulate.ROOT_DIR, help="directory emulating the CIRCUITPY drive")
+    parser.add_argument("--settings", default=os.path.join(emulate.ROOT_DIR, "settings.toml"))
+    parser.add_argument("--index", type=int, action="append", default=None, help="slot to export (default: all)")
+    parser.add_argument("--output", default=None, help="directory for exported JSON patches (default: <root>/patches)")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.root)
+    device = emulate.boot(root, args.settings, ("PATCH_BANK=1",))
+    patches = device.patches
+    if args.command == "build":
+        if not patches.build_bank():
+            raise SystemExit("Failed to build patch bank")
+        print("Wrote {}".format(os.path.join(root, "patches", "bank.bin")))
+        return
+
+    indexes = args.index if args.index else [index for index in range(100) if patches.has_bank(index)]
+    for index in indexes:
+        if not patches.has_bank(index):
+            print("Slot {:02d} is empty".format(index))
+            continue
+        data = patches.get_bank_data(index)
+        output = os.path.abspath(args.output) if args.output else os.path.join(root, "patches")
+        os.makedirs(output, exist_ok=True)
+        path = os.path.join(output, "{:02d}-{}.json".format(index, data["name"]))
+        with open(path, "w") as file:
+            json.dump(data, file, indent=4)
+        print("Exported slot {:02d} to {}".format(index, path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# circuitpython-synthio-mono: Offline Renderer
+# 2023 Cooper Dalrymple - me@dcdalrymple.com
+# GPL v3 License
+
+# Renders a Standard MIDI File through code.py into a wav file faster than real time.
+# code.py runs unmodified on a virtual clock: MIDI bytes are fed into the emulated
+# UART as they come due and each main loop iteration renders one step of audio.
+# A golden summary of the output can be stored and compared to catch changes to
+# the rendered sound.
+#
+# Usage: python3 tools/render.py song.mid [--patch patch.json] [--wav out.wav] [--golden song.json]
+
+import argparse, hashlib, json, math, os, shutil, struct, sys, tempfile, time
+
+import emulate
+import _device
+
+# Standard MIDI File
+
+def _read_varlen(data, index):
+    value = 0
+    while True:
+        byte = data[index]
+        index = index + 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, index
+
+def read_midi_file(path):
+    # Returns a list of (seconds, message bytes) for every channel and realtime message of all tracks
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[0:4] != b"MThd":
+        raise ValueError("Not a Standard MIDI File: {}".format(path))
+    length, format, track_count, division = struct.unpack(">IHHH", data[4:14])
+    if division & 0x8000:
+        raise ValueError("SMPTE time division is not supported")
+
+    events = [] # (tick, order, message bytes or tempo)
+    index = 8 + length
+    order = 0
+    for track in range(track_count):
+        if data[index:index+4] != b"MTrk":
+            break
+        end = index + 8 + struct.unpack(">I", data[index+4:index+8])[0]
+        index = index + 8
+        tick = 0
+        status = 0
+        while index < end:
+            delta, index = _read_varlen(data, index)
+            tick = tick + delta
+            if data[index] & 0x80:
+                status = data[index]
+                index = index + 1
+            if status == 0xFF: # Meta event
+                kind = data[index]
+                length, index = _read_varlen(data, index + 1)
+                if kind == 0x51:
+                    events.append((tick, order, int.from_bytes(data[index:index+3], "big")))
+                elif kind == 0x2F:
+                    index = end
+                    break
+                index = index + length
+                status = 0
+            elif status == 0xF0 or status == 0xF7: # System exclusive
+                length, index = _read_varlen(data, index)
+                index = index + length
+                status = 0
+            elif status >= 0xF8:
+                events.append((tick, order, bytes([status])))
+            elif status & 0xF0 in (0xC0, 0xD0):
+                events.append((tick, order, bytes([status, data[index]])))
+                index = index + 1
+            else:
+                events.append((tick, order, bytes([status, data[index], data[index+1]])))
+                index = index + 2
+            order = order + 1
+        index = end
+
+    events.sort(key=lambda event: (event[0], event[1]))
+    result = []
+    tempo = 500000
+    last_tick = 0
+    seconds = 0.0
+    for tick, order, message in events:
+        seconds = seconds + (tick - last_tick) * tempo / 1000000 / division
+        last_tick = tick
+        if type(message) is int:
+            tempo = message
+        else:
+            result.append((seconds, message))
+    return result
+
+# Golden Output
+
+def summarize(data, sample_rate, channel_count, window=0.1):
+    frames = len(data) // (2 * channel_count)
+    samples = struct.unpack("<{:d}h".format(frames * channel_count), data[:frames * channel_count * 2])
+    size = max(int(sample_rate * window), 1)
+    rms = []
+    for start in range(0, frames, size):
+        values = samples[start*channel_count:(start+size)*channel_count]
+        rms.append(round(math.sqrt(sum(value * value for value in values) / max(len(values), 1)), 1))
+    return {
+        "sample_rate": sample_rate,
+        "channel_count": channel_count,
+        "frames": frames,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "window": window,
+        "rms": rms,
+    }
+
+def compare(golden, summary, tolerance=1.0):
+    if golden["sha256"] == summary["sha256"]:
+        return []
+    differences = []
+    for key in ("sample_rate", "channel_count", "frames"):
+        if golden.get(key) != summary.get(key):
+            differences.append("{}: expected {} got {}".format(key, golden.get(key), summary.get(key)))
+    for i in range(min(len(golden["rms"]), len(summary["rms"]))):
+        if abs(golden["rms"][i] - summary["rms"][i]) > tolerance:
+            differences.append("RMS differs from {:.2f}s: expected {} got {}".format(i * golden["window"], golden["rms"][i], summary["rms"][i]))
+            break
+    if not differences:
+        differences.append("Output differs below RMS tolerance")
+    return differences
+
+# Rendering
+
+class RenderComplete(Exception):
+    pass
+
+class Renderer:
+    def __init__(self, events, step=None, tail=1.0, channel=None):
+        self.events = events
+        if not channel is None:
+            self.events = [(seconds, bytes([message[0] & 0xF0 | channel]) + message[1:] if message[0] < 0xF0 else message) for seconds, message in events]
+        self.step = step
+        self.end = (events[-1][0] if events else 0.0) + tail
+        self.start = None
+        self.index = 0
+        self.frames = 0
+        self.chunks = []
+        self.wall_start = 0.0
+        self.wall_time = 0.0
+        self._output = None
+        self._uart = None
+
+    def _begin(self, clock):
+        self.start = clock.now
+        self.wall_start = time.perf_counter()
+        self._output = _device.outputs[0]
+        self._output.sink = self.chunks.append
+        for uart in _device.uarts:
+            if uart.baudrate == 31250:
+                self._uart = uart
+        if self.step is None:
+            self.step = 256 / self._output._source.sample_rate
+
+    def tick(self, clock):
+        if self.start is None:
+            self._begin(clock)
+        position = clock.now - self.start
+        if position >= self.end:
+            self.wall_time = time.perf_counter() - self.wall_start
+            raise RenderComplete()
+
+        while self.index < len(self.events) and self.events[self.index][0] <= position:
+            if self._uart:
+                self._uart.feed(self.events[self.index][1])
+            self.index = self.index + 1
+
+        sample_rate = self._output._source.sample_rate
+        frames = int(round((position + self.step) * sample_rate)) - self.frames
+        if frames > 0:
+            self._output.render(frames)
+            self.frames = self.frames + frames
+        clock.advance(self.step)
+
+    def get_data(self):
+        return b"".join(chunk.tobytes() for chunk in self.chunks)
+
+def _prepare_root(root, patch):
+    # Lay out a temporary CIRCUITPY drive with the selected patch loaded at boot as patch 00
+    directory = tempfile.mkdtemp(prefix="synthio-mono-")
+    shutil.copy(os.path.join(root, "midi.json"), directory)
+    for name in ("patches", "waveforms"):
+        if os.path.isdir(os.path.join(root, name)):
+            shutil.copytree(os.path.join(root, name), os.path.join(directory, name))
+        else:
+            os.mkdir(os.path.join(directory, name))
+    if patch:
+        patches = os.path.join(directory, "patches")
+        for filename in os.listdir(patches):
+            if filename.startswith("00-"):
+                os.remove(os.path.join(patches, filename))
+        name = os.path.splitext(os.path.basename(patch))[0]
+        if len(name) > 3 and name[0:2].isdigit() and name[2] == "-":
+            name = name[3:]
+        shutil.copy(patch, os.path.join(patches, "00-{}.json".format(name)))
+    return directory
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a MIDI file through synthio-mono")
+    parser.add_argument("midi", help="Standard MIDI File to render")
+    parser.add_argument("--patch", default=None, help="patch JSON to load instead of patch 00")
+    parser.add_argument("--root", default=emulate.ROOT_DIR, help="directory emulating the CIRCUITPY drive")
+    parser.add_argument("--script", default=os.path.join(emulate.ROOT_DIR, "code.py"))
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="override a settings.toml value")
+    parser.add_argument("--step", type=float, default=None, help="seconds per main loop iteration (default: one synthio block)")
+    parser.add_argument("--tail", type=float, default=1.0, help="seconds rendered after the last event")
+    parser.add_argument("--channel", type=int, default=None, help="move all channel messages to this channel")
+    parser.add_argument("--wav", default=None, help="write rendered audio to a wav file")
+    parser.add_argument("--golden", default=None, help="golden summary to compare against")
+    parser.add_argument("--update-golden", action="store_true", help="write the golden summary instead of comparing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    events = read_midi_file(args.midi)
+    renderer = Renderer(events, args.step, args.tail, args.channel)
+    script = os.path.abspath(args.script)
+    clock = _device.VirtualClock(script, renderer.tick)
+
+    root = _prepare_root(args.root, args.patch)
+    try:
+        emulate.setup(root, os.path.join(args.root, "settings.toml"), args.set, False, args.seed, clock)
+        _device.execute(script)
+    except RenderComplete:
+        pass
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    output = _device.outputs[0]._source
+    data = renderer.get_data()
+    seconds = renderer.frames / output.sample_rate
+    print("\n:: Render Report ::")
+    print("Rendered {:.3f}s of audio at {:d}Hz in {:.3f}s ({:.2f}x realtime, {:d} loop iterations)".format(
+        seconds, output.sample_rate, renderer.wall_time, seconds / renderer.wall_time if renderer.wall_time else 0.0, clock.iterations))
+    if renderer._uart and renderer._uart.overflows:
+        print("UART overflowed, {:d} bytes dropped".format(renderer._uart.overflows))
+
+    if args.wav:
+        sink = emulate.WaveSink(args.wav)
+        sink._chunks.append(data)
+        sink.save(output.sample_rate, output.channel_count)
+        print("Wrote {}".format(args.wav))
+
+    if args.golden:
+        summary = summarize(data, output.sample_rate, output.channel_count)
+        if args.update_golden or not os.path.exists(args.golden):
+            with open(args.golden, "w") as file:
+                json.dump(summary, file, indent=1)
+            print("Updated golden summary: {}".format(args.golden))
+        else:
+            with open(args.golden, "r") as file:
+                golden = json.load(file)
+            differences = compare(golden, summary)
+            if differences:
+                print("Output does not match golden summary: {}".format(args.golden))
+                for difference in differences:
+                    print("  {}".format(difference))
+                sys.exit(1)
+            print("Output matches golden summary: {}".format(args.golden))
+
+if __name__ == "__main__":
+    main()